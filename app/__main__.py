@@ -7,12 +7,34 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--window-width", help=f"Window width", type=int, default=1280)
 parser.add_argument("--window-height", help=f"Window height", type=int, default=720)
 parser.add_argument("--fullscreen", help="Fullscreen window", action="store_true", default=False)
+parser.add_argument("--route", help="CSV file of lat_deg,lon_deg,alt_m waypoints for the navigation brain",
+                    type=str, default=None)
+parser.add_argument("--gain-schedule", help="JSON file of airspeed/altitude PID gain schedules",
+                    type=str, default=None)
+parser.add_argument("--external-fdm", help="Fly the built-in flight model and use FlightGear as a renderer "
+                                         "(start FG with --fdm=external)", action="store_true", default=False)
+parser.add_argument("--tracker-process", help="Run the tracker in a separate process", action="store_true",
+                    default=False)
+parser.add_argument("--tracker-scheduling", help="Infer only the frames the tracking needs and forecast the bbox "
+                                                 "on the others", action="store_true", default=False)
+parser.add_argument("--video-source", help="Frame source: camera:INDEX, file:PATH[,pace=False][,loop=True], "
+                                         "synthetic[:fps=FPS], shm:NAME or mjpeg:URL", type=str,
+                    default="camera:2")
+parser.add_argument("--record", help="Record the video and the telemetry to PATH.avi, PATH.telemetry.csv and "
+                                     "PATH.index.csv", type=str, default=None)
 args = parser.parse_args()
 
 
 app = FGApp(
     window_width=args.window_width,
     window_height=args.window_height,
-    fullscreen=args.fullscreen)
+    fullscreen=args.fullscreen,
+    route_file=args.route,
+    gain_schedule_file=args.gain_schedule,
+    external_fdm=args.external_fdm,
+    tracker_process=args.tracker_process,
+    tracker_scheduling=args.tracker_scheduling,
+    video_source=args.video_source,
+    record_path=args.record)
 
 app.run()
@@ -1 +1,3 @@
-from .video_capture import VideoCaptureCVStream
+from .video_capture import VideoCaptureCVStream, VideoFrame, make_preview
+from .video_sources import VIDEO_SOURCES, create_video_capture, register_video_source
+from .recorder import DropPolicy, FrameRecorder, Recording, TelemetrySampler
@@ -2,6 +2,9 @@ import enum
 
 import numpy as np
 
+from app.core.autopilot.fg_gain_schedule import GainSchedule
+from app.core.autopilot.fg_navigation import Route, RouteGuidance
+from app.core.autopilot.fg_params import ParameterBlock, ParameterReader
 from app.core.autopilot.fg_pid import LerpController
 from app.core.autopilot.fg_pid import PIDController, PIDControllerCoefficient
 
@@ -11,6 +14,10 @@ class BrainBase:
         MANUAL = "Manual"
         AUTOPILOT = "Autopilot"
         TRACKING = "Tracking"
+        NAVIGATION = "Navigation"
+
+    # Brains that command the aircraft get the failsafe output, the others leave the controls to FG
+    FLIES_AIRCRAFT = False
 
     def update(self, fdm_event_pipe=None, ctrls_event_pipe=None):
         raise NotImplementedError()
@@ -23,6 +30,8 @@ class BrainBase:
 
 
 class StorageBrain(BrainBase):
+    TELEMETRY_FIELDS = ("pitch", "yaw", "roll", "lon_rad", "lat_rad", "alt_m", "vcas", "alpha_rad")
+
     def __init__(self):
         super().__init__()
 
@@ -30,6 +39,19 @@ class StorageBrain(BrainBase):
         self._current_yaw = 0
         self._current_roll = 0
 
+        self._current_vcas = 0
+        self._current_alt = 0
+        self._current_alpha = 0
+
+        # Written by the FDM process, read by the GUI and the ctrls process
+        self._telemetry = ParameterBlock(self.TELEMETRY_FIELDS)
+        self._telemetry_reader = ParameterReader(self._telemetry)
+        self._gui_telemetry_reader = ParameterReader(self._telemetry)
+
+    @property
+    def telemetry_block(self) -> ParameterBlock:
+        return self._telemetry
+
     @property
     def pitch(self) -> float:
         return self._current_pitch
@@ -42,27 +64,57 @@ class StorageBrain(BrainBase):
     def roll(self) -> float:
         return self._current_roll
 
+    @property
+    def vcas(self) -> float:
+        return self._current_vcas
 
-class ManualBrain(StorageBrain):
-    def __init__(self):
-        super().__init__()
+    @property
+    def alt(self) -> float:
+        return self._current_alt
+
+    @property
+    def alpha(self) -> float:
+        return self._current_alpha
 
     def update(self, fdm_event_pipe=None, ctrls_event_pipe=None):
-        if fdm_event_pipe and fdm_event_pipe.parent_poll():
-            self._current_pitch, self._current_yaw, self._current_roll = fdm_event_pipe.parent_recv()
+        telemetry = self._gui_telemetry_reader
+
+        if telemetry.poll():
+            self._current_pitch = telemetry["pitch"]
+            self._current_yaw = telemetry["yaw"]
+            self._current_roll = telemetry["roll"]
+
+            self._current_vcas = telemetry["vcas"]
+            self._current_alt = telemetry["alt_m"]
+            self._current_alpha = telemetry["alpha_rad"]
 
     def fdm_update(self, fdm_data, event_pipe):
-        pitch = np.rad2deg(fdm_data.theta_rad)
-        yaw = np.rad2deg(fdm_data.psi_rad)
-        roll = np.rad2deg(fdm_data.phi_rad)
+        self._telemetry.write(pitch=np.rad2deg(fdm_data.theta_rad),
+                              yaw=np.rad2deg(fdm_data.psi_rad),
+                              roll=np.rad2deg(fdm_data.phi_rad),
+                              lon_rad=fdm_data.lon_rad,
+                              lat_rad=fdm_data.lat_rad,
+                              alt_m=fdm_data.alt_m,
+                              vcas=fdm_data.vcas,
+                              alpha_rad=fdm_data.alpha_rad)
 
-        event_pipe.child_send((pitch, yaw, roll))
+
+class ManualBrain(StorageBrain):
+    def __init__(self):
+        super().__init__()
 
     def ctrls_update(self, ctrls_data, event_pipe):
         return None
 
 
 class PilotBrain(StorageBrain):
+    PARAMETER_FIELDS = ("pitch_k_p", "pitch_k_i", "pitch_k_d",
+                        "yaw_k_p", "yaw_k_i", "yaw_k_d",
+                        "roll_k_p", "roll_k_i", "roll_k_d",
+                        "gain_scheduling")
+
+    FLIES_AIRCRAFT = True
+
     def __init__(self):
         super().__init__()
 
@@ -72,9 +124,16 @@ class PilotBrain(StorageBrain):
         self._yaw_controller = PIDController()
         self._roll_controller = PIDController()
 
-        self._pitch_controller_coefficients = PIDControllerCoefficient(K_p=0.1, K_i=0.005, K_d=0.001)
-        self._yaw_controller_coefficients = PIDControllerCoefficient(K_p=0.1, K_i=0, K_d=0)
-        self._roll_controller_coefficients = PIDControllerCoefficient(K_p=0.05, K_i=0.005, K_d=0.001)
+        # Written by the GUI only when a setting changes, read by the ctrls process
+        self._params = ParameterBlock(self.PARAMETER_FIELDS)
+        self._params_reader = ParameterReader(self._params)
+
+        self.pitch_pid_c = PIDControllerCoefficient(K_p=0.1, K_i=0.005, K_d=0.001)
+        self.yaw_pid_c = PIDControllerCoefficient(K_p=0.1, K_i=0, K_d=0)
+        self.roll_pid_c = PIDControllerCoefficient(K_p=0.05, K_i=0.005, K_d=0.001)
+
+        self._gain_schedules = {}
+        self._scheduled_pid_c = {axis: PIDControllerCoefficient(0, 0, 0) for axis in ("pitch", "yaw", "roll")}
 
     @property
     def pitch_pid_c(self):
@@ -91,76 +150,100 @@ class PilotBrain(StorageBrain):
     @pitch_pid_c.setter
     def pitch_pid_c(self, pid_c):
         self._pitch_controller_coefficients = pid_c
+        self._params.write(pitch_k_p=pid_c.K_p, pitch_k_i=pid_c.K_i, pitch_k_d=pid_c.K_d)
 
     @yaw_pid_c.setter
     def yaw_pid_c(self, pid_c):
         self._yaw_controller_coefficients = pid_c
+        self._params.write(yaw_k_p=pid_c.K_p, yaw_k_i=pid_c.K_i, yaw_k_d=pid_c.K_d)
 
     @roll_pid_c.setter
     def roll_pid_c(self, pid_c):
         self._roll_controller_coefficients = pid_c
+        self._params.write(roll_k_p=pid_c.K_p, roll_k_i=pid_c.K_i, roll_k_d=pid_c.K_d)
+
+    @property
+    def gain_schedules(self):
+        return self._gain_schedules
+
+    @property
+    def is_gain_scheduling(self) -> bool:
+        return self._params["gain_scheduling"] != 0
+
+    def set_gain_schedules(self, schedules: dict):
+        """
+        Set airspeed/altitude gain schedules per PID axis. The schedule tables are shared with the ctrls
+        process, so this has to be called before the controller is connected; node edits propagate live.
+
+        :param schedules: GainSchedule by axis name (pitch, yaw, roll)
+        """
+        self._gain_schedules = dict(schedules)
+
+    def set_gain_scheduling(self, enabled: bool):
+        self._params.write(gain_scheduling=float(enabled))
+
+    def _update_pid(self, controller: PIDController, axis: str, SP, PV):
+        params = self._params_reader
+
+        schedule: GainSchedule = self._gain_schedules.get(axis)
+        if schedule is not None and params["gain_scheduling"]:
+            telemetry = self._telemetry_reader
+            pid_c = schedule.lookup(telemetry["vcas"], telemetry["alt_m"], telemetry["alpha_rad"],
+                                    out=self._scheduled_pid_c[axis])
+            return controller.update(SP, PV, K_p=pid_c.K_p, K_i=pid_c.K_i, K_d=pid_c.K_d)
+
+        return controller.update(SP, PV,
+                                 K_p=params[f"{axis}_k_p"],
+                                 K_i=params[f"{axis}_k_i"],
+                                 K_d=params[f"{axis}_k_d"])
 
 
 class AutopilotBrain(PilotBrain):
+    PARAMETER_FIELDS = PilotBrain.PARAMETER_FIELDS + ("target_throttle",
+                                                      "target_pitch", "target_yaw", "target_roll")
+
     def __init__(self):
         super().__init__()
 
-        self._target_pitch = 0
-        self._target_yaw = 0
-        self._target_roll = 0
-        self._target_throttle = 0
+        self.set_target_pitch(0)
+        self.set_target_yaw(0)
+        self.set_target_roll(0)
+        self.set_target_throttle(0)
 
     def set_target_pitch(self, pitch):
         self._target_pitch = pitch
+        self._params.write(target_pitch=pitch)
 
     def set_target_yaw(self, yaw):
         self._target_yaw = yaw
+        self._params.write(target_yaw=yaw)
 
     def set_target_roll(self, roll):
         self._target_roll = roll
+        self._params.write(target_roll=roll)
 
     def set_target_throttle(self, throttle):
         self._target_throttle = throttle
+        self._params.write(target_throttle=throttle)
 
-    def update(self, fdm_event_pipe=None, ctrls_event_pipe=None):
-        if fdm_event_pipe and fdm_event_pipe.parent_poll():
-            self._current_pitch, self._current_yaw, self._current_roll = fdm_event_pipe.parent_recv()
-
-            ctrls_event_pipe.parent_send((self._target_throttle,
-                                          self._target_pitch, self._target_yaw, self._target_roll,
-                                          self._current_pitch, self._current_yaw, self._current_roll,
-                                          self._pitch_controller_coefficients,
-                                          self._yaw_controller_coefficients,
-                                          self._roll_controller_coefficients))
-
-    def fdm_update(self, fdm_data, event_pipe):
-        pitch = np.rad2deg(fdm_data.theta_rad)
-        yaw = np.rad2deg(fdm_data.psi_rad)
-        roll = np.rad2deg(fdm_data.phi_rad)
-
-        event_pipe.child_send((pitch, yaw, roll))
+    def _target_attitude(self):
+        return self._params_reader["target_pitch"], self._params_reader["target_yaw"], \
+            self._params_reader["target_roll"]
 
     def ctrls_update(self, ctrls_data, event_pipe):
-        target_throttle = 0
+        self._params_reader.poll()
 
-        if event_pipe.child_poll():
-            target_throttle, target_pitch, target_yaw, target_roll, \
-                pitch, yaw, roll, \
-                pitch_pid_c, yaw_pid_c, roll_pid_c = event_pipe.child_recv()
+        if self._telemetry_reader.poll():
+            pitch = self._telemetry_reader["pitch"]
+            yaw = self._telemetry_reader["yaw"]
+            roll = self._telemetry_reader["roll"]
+
+            target_pitch, target_yaw, target_roll = self._target_attitude()
 
             # Update controllers
-            self._pitch_controller.update(target_pitch, pitch,
-                                          K_p=pitch_pid_c.K_p,
-                                          K_i=pitch_pid_c.K_i,
-                                          K_d=pitch_pid_c.K_d)
-            self._yaw_controller.update(target_yaw, yaw,
-                                        K_p=yaw_pid_c.K_p,
-                                        K_i=yaw_pid_c.K_i,
-                                        K_d=yaw_pid_c.K_d)
-            self._roll_controller.update(target_roll, roll,
-                                         K_p=yaw_pid_c.K_p,
-                                         K_i=yaw_pid_c.K_i,
-                                         K_d=yaw_pid_c.K_d)
+            self._update_pid(self._pitch_controller, "pitch", target_pitch, pitch)
+            self._update_pid(self._yaw_controller, "yaw", target_yaw, yaw)
+            self._update_pid(self._roll_controller, "yaw", target_roll, roll)
 
             # Debug
             # print(f"Pitch:\t {pitch:.2f} \t Elevator:\t {self._pitch_controller.P_out:.2f}")
@@ -174,70 +257,93 @@ class AutopilotBrain(PilotBrain):
 
         # Throttle
         current_throttle = self._throttle_controller.P_out
-        target_throttle = self._throttle_controller.update(target_throttle, current_throttle, t=0.1)
+        target_throttle = self._throttle_controller.update(self._params_reader["target_throttle"],
+                                                           current_throttle, t=0.1)
         ctrls_data.throttle = [target_throttle] * 4  # engines number
 
         return ctrls_data
 
 
+class NavigationBrain(AutopilotBrain):
+    def __init__(self, route: Route = None):
+        """
+        Autopilot that follows a waypoint route. Pitch and yaw targets come from the route guidance,
+        roll and throttle targets from the autopilot settings.
+
+        The route is read in the ctrls process, so it has to be set before the controller is connected.
+
+        :param route: Route to follow, holds the autopilot targets while there is none
+        """
+        super().__init__()
+
+        self._guidance = None
+        self.set_route(route)
+
+    @property
+    def route(self):
+        return self._guidance.route if self._guidance else None
+
+    def set_route(self, route: Route, lookahead_m: float = 500):
+        self._guidance = RouteGuidance(route, lookahead_m=lookahead_m) if route is not None else None
+
+    def _target_attitude(self):
+        if self._guidance is None:
+            return super()._target_attitude()
+
+        telemetry = self._telemetry_reader
+        target_pitch, target_yaw = self._guidance.update(telemetry["lat_rad"], telemetry["lon_rad"],
+                                                         telemetry["alt_m"], telemetry["yaw"])
+
+        return target_pitch, target_yaw, self._params_reader["target_roll"]
+
+
 class TrackingAutopilotBrain(PilotBrain):
+    PARAMETER_FIELDS = PilotBrain.PARAMETER_FIELDS + ("target_x", "target_y",
+                                                      "has_bbox", "bbox_x", "bbox_y", "bbox_w", "bbox_h")
+
     def __init__(self):
         super().__init__()
 
         self._object_bbox = None
         self._target_location = None
 
-        self._pitch_controller_coefficients = PIDControllerCoefficient(K_p=0.002, K_i=0.001, K_d=0)
-        self._yaw_controller_coefficients = PIDControllerCoefficient(K_p=0.001, K_i=0.0001, K_d=0)
-        self._roll_controller_coefficients = PIDControllerCoefficient(K_p=0.05, K_i=0, K_d=0)
+        self.pitch_pid_c = PIDControllerCoefficient(K_p=0.002, K_i=0.001, K_d=0)
+        self.yaw_pid_c = PIDControllerCoefficient(K_p=0.001, K_i=0.0001, K_d=0)
+        self.roll_pid_c = PIDControllerCoefficient(K_p=0.05, K_i=0, K_d=0)
 
     def set_object_bbox(self, object_bbox):
         self._object_bbox = object_bbox
 
+        if object_bbox is None:
+            self._params.write(has_bbox=0)
+        else:
+            self._params.write(has_bbox=1,
+                               bbox_x=object_bbox[0], bbox_y=object_bbox[1],
+                               bbox_w=object_bbox[2], bbox_h=object_bbox[3])
+
     def set_target_location(self, location):
         self._target_location = location
+        self._params.write(target_x=location[0], target_y=location[1])
 
-    def update(self, fdm_event_pipe=None, ctrls_event_pipe=None):
-        if fdm_event_pipe and fdm_event_pipe.parent_poll():
-            self._current_pitch, self._current_yaw, self._current_roll = fdm_event_pipe.parent_recv()
-
-            if ctrls_event_pipe:
-                ctrls_event_pipe.parent_send((self._target_location, self._object_bbox,
-                                              self._current_pitch, self._current_yaw, self._current_roll,
-                                              self._pitch_controller_coefficients,
-                                              self._yaw_controller_coefficients,
-                                              self._roll_controller_coefficients))
-
-    def fdm_update(self, fdm_data, event_pipe):
-        pitch = np.rad2deg(fdm_data.theta_rad)
-        yaw = np.rad2deg(fdm_data.psi_rad)
-        roll = np.rad2deg(fdm_data.phi_rad)
+    def ctrls_update(self, ctrls_data, event_pipe):
+        self._params_reader.poll()
 
-        event_pipe.child_send((pitch, yaw, roll))
+        has_bbox = False
 
-    def ctrls_update(self, ctrls_data, event_pipe):
-        object_bbox = None
+        if self._telemetry_reader.poll():
+            params = self._params_reader
+            has_bbox = params["has_bbox"] != 0
 
-        if event_pipe.child_poll():
-            target_location, object_bbox, pitch, yaw, roll,\
-                pitch_pid_c, yaw_pid_c, roll_pid_c = event_pipe.child_recv()  # Unpack tuple from parent
+            if has_bbox:
+                roll = self._telemetry_reader["roll"]
 
-            if object_bbox is not None:
                 # Update controllers
-                object_location = object_bbox[0] + object_bbox[2] / 2, object_bbox[1] + object_bbox[3] / 2
-
-                self._pitch_controller.update(target_location[1], object_location[1],
-                                              K_p=pitch_pid_c.K_p,
-                                              K_i=pitch_pid_c.K_i,
-                                              K_d=pitch_pid_c.K_d)
-                self._yaw_controller.update(target_location[0], object_location[0],
-                                            K_p=yaw_pid_c.K_p,
-                                            K_i=yaw_pid_c.K_i,
-                                            K_d=yaw_pid_c.K_d)
-                self._roll_controller.update(0, roll,
-                                             K_p=yaw_pid_c.K_p,
-                                             K_i=yaw_pid_c.K_i,
-                                             K_d=yaw_pid_c.K_d)
+                target_location = params["target_x"], params["target_y"]
+                object_location = params["bbox_x"] + params["bbox_w"] / 2, params["bbox_y"] + params["bbox_h"] / 2
+
+                self._update_pid(self._pitch_controller, "pitch", target_location[1], object_location[1])
+                self._update_pid(self._yaw_controller, "yaw", target_location[0], object_location[0])
+                self._update_pid(self._roll_controller, "yaw", 0, roll)
 
                 print(f"Target location: {target_location}\t Current location: {object_location}")
                 print(f"Roll:\t {roll:.2f} \t Aileron:\t {self._roll_controller.P_out:.2f}")
@@ -247,5 +353,5 @@ class TrackingAutopilotBrain(PilotBrain):
         ctrls_data.rudder = -self._yaw_controller.P_out
         ctrls_data.aileron = self._roll_controller.P_out
 
-        if object_bbox is not None:
+        if has_bbox:
             return ctrls_data
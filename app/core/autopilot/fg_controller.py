@@ -1,21 +1,55 @@
 from typing import Optional
 
+import ctypes
+import dataclasses
 import time
 import threading
 
+import multiprocess as mp
+
 from flightgear_python.fg_if import FDMConnection
 from flightgear_python.fg_if import CtrlsConnection
 
 from app.core.autopilot import Port
 
 from app.core.autopilot.fg_brain import BrainBase
+from app.core.autopilot.fg_params import ParameterBlock
+
+
+@dataclasses.dataclass
+class WatchdogConfig:
+    fdm_timeout_s: float = 0.5  # Max age of the last FDM sample
+    ctrls_timeout_s: float = 0.5  # Max age of the last ctrls packet the control loop handled
+    late_frame_s: float = 0.1  # FDM inter-arrival time counted as a late frame
+    failsafe_interval_s: float = 1 / 30  # Interval of the failsafe packets the watchdog sends
+
+
+@dataclasses.dataclass
+class WatchdogStats:
+    is_failsafe: bool = False
+    fdm_age_s: float = 0
+    ctrls_age_s: float = 0
+    fdm_timeouts: int = 0
+    ctrls_timeouts: int = 0
+    late_frames: int = 0
+    ctrls_transmissions: int = 0
+    failsafe_transmissions: int = 0  # Failsafe packets sent by the watchdog, without a ctrls packet from FG
+    recoveries: int = 0
+    last_recovery_s: float = 0
+    max_recovery_s: float = 0
 
 
 class FGController(threading.Thread):
     FDM_VERSION = 24
     CTRLS_VERSION = 27
 
-    def __init__(self, brain: BrainBase):
+    STATUS_FIELDS = ("fdm_time", "ctrls_time", "late_frames", "ctrls_transmissions", "failsafe",
+                     "elevator", "aileron", "rudder", "throttle")
+
+    # Interval of refreshing the ctrls packet template the watchdog builds failsafe packets from, s
+    CTRLS_TEMPLATE_INTERVAL_S = 0.5
+
+    def __init__(self, brain: BrainBase, watchdog_config: WatchdogConfig = None):
         super().__init__()
 
         self._brain = brain
@@ -28,7 +62,40 @@ class FGController(threading.Thread):
 
         self._stop_event = threading.Event()
 
-    def connect(self, host: str, fdm_port: Port, ctrls_port: Port, disconnect_callback: callable):
+        # Shared with the RX/TX processes: sample times and counters go up, the failsafe flag goes down
+        self._status = ParameterBlock(self.STATUS_FIELDS)
+
+        self._watchdog_config = watchdog_config or WatchdogConfig()
+        self._watchdog_stats = WatchdogStats()
+        self._failsafe_start_time = 0
+        self._last_failsafe_time = 0
+        self._is_fdm_stale = False
+        self._is_ctrls_stale = False
+
+        # Last ctrls packet from FG, written by the ctrls process, created on connect
+        self._ctrls_template = None
+        self._ctrls_template_length = mp.RawValue(ctypes.c_int, 0)
+        self._ctrls_template_lock = mp.Lock()
+
+        # RX/TX process side
+        self._last_fdm_time = None
+        self._late_frames = 0
+        self._ctrls_transmissions = 0
+        self._held_throttle = None
+        self._last_template_time = 0
+
+    @property
+    def watchdog_stats(self) -> WatchdogStats:
+        return self._watchdog_stats
+
+    @property
+    def status_block(self) -> ParameterBlock:
+        """
+        Sample times, counters and the last transmitted controls, for recording
+        """
+        return self._status
+
+    def connect(self, host: str, fdm_port: Port, ctrls_port: Port, disconnect_callback: callable = None):
         """
         Connect to a UDP connection with FlightGear
 
@@ -37,6 +104,10 @@ class FGController(threading.Thread):
         :param ctrls_port: Out/In ctrls  ports of the socket
         """
 
+        # Give FG the full timeout to send the first packets
+        now = time.monotonic()
+        self._status.write(fdm_time=now, ctrls_time=now)
+
         self._fdm_connection = FDMConnection(fdm_version=self.FDM_VERSION)
         self._fdm_connection.set_disconnect_callback(disconnect_callback=disconnect_callback)
         self._fdm_connection.connect_rx(host, fdm_port.port_out, self._fdm_callback)
@@ -44,6 +115,8 @@ class FGController(threading.Thread):
         self._fdm_connection.start()  # Start the FDM RX/TX loop
 
         self._ctrls_connection = CtrlsConnection(ctrls_version=self.CTRLS_VERSION)
+        self._ctrls_template = mp.RawArray(ctypes.c_char, self._ctrls_connection.fg_net_struct.sizeof())
+        self._ctrls_template_length.value = 0
         self._ctrls_connection.set_disconnect_callback(disconnect_callback=disconnect_callback)
         self._ctrls_connection.connect_rx(host, ctrls_port.port_out, self._ctrls_callback)
         self._ctrls_connection.connect_tx(host, ctrls_port.port_in)
@@ -66,12 +139,126 @@ class FGController(threading.Thread):
 
     def update(self):
         self._brain.update(self._fdm_connection.event_pipe, self._ctrls_connection.event_pipe)
+        self._update_watchdog()
+
+    def _update_watchdog(self):
+        config = self._watchdog_config
+        stats = self._watchdog_stats
+
+        now = time.monotonic()
+        stats.fdm_age_s = now - self._status["fdm_time"]
+        stats.ctrls_age_s = now - self._status["ctrls_time"]
+        stats.late_frames = int(self._status["late_frames"])
+        stats.ctrls_transmissions = int(self._status["ctrls_transmissions"])
+
+        is_fdm_stale = stats.fdm_age_s > config.fdm_timeout_s
+        # Brains that leave the controls to FG send nothing, there is no output to watch
+        is_ctrls_stale = self._brain.FLIES_AIRCRAFT and stats.ctrls_age_s > config.ctrls_timeout_s
+
+        # Count timeouts on the stale edge only
+        if is_fdm_stale and not self._is_fdm_stale:
+            stats.fdm_timeouts += 1
+        if is_ctrls_stale and not self._is_ctrls_stale:
+            stats.ctrls_timeouts += 1
+        self._is_fdm_stale = is_fdm_stale
+        self._is_ctrls_stale = is_ctrls_stale
+
+        is_failsafe = is_fdm_stale or is_ctrls_stale
+        if is_failsafe != stats.is_failsafe:
+            stats.is_failsafe = is_failsafe
+            self._status.write(failsafe=float(is_failsafe))
+
+            if is_failsafe:
+                self._failsafe_start_time = now
+                print(f"[WARNING] Failsafe engaged: FDM age {stats.fdm_age_s:.2f} s, "
+                      f"ctrls age {stats.ctrls_age_s:.2f} s")
+            else:
+                stats.recoveries += 1
+                stats.last_recovery_s = now - self._failsafe_start_time
+                stats.max_recovery_s = max(stats.max_recovery_s, stats.last_recovery_s)
+                print(f"[INFO] Failsafe released after {stats.last_recovery_s:.2f} s")
+
+        if is_failsafe and self._brain.FLIES_AIRCRAFT and now - self._last_failsafe_time >= config.failsafe_interval_s:
+            self._send_failsafe()
+            self._last_failsafe_time = now
+
+    def _send_failsafe(self):
+        """
+        Send the failsafe output from the watchdog, so it reaches FG also when FG has stopped sending
+        ctrls packets and the ctrls callback does not run
+        """
+        with self._ctrls_template_lock:
+            length = self._ctrls_template_length.value
+            template = self._ctrls_template.raw[:length]
+        if not length or self._ctrls_connection is None:
+            # No packet from FG yet, nothing to take the other controls from
+            return
+
+        ctrls_data = self._ctrls_connection.fg_net_struct.parse(template)
+        held_throttle = [self._status["throttle"]] * len(ctrls_data.throttle) \
+            if self._status["ctrls_transmissions"] else None
+        self._ctrls_connection.send(dict(**self._failsafe_ctrls(ctrls_data, held_throttle)))
+        self._watchdog_stats.failsafe_transmissions += 1
+
+    @staticmethod
+    def _failsafe_ctrls(ctrls_data, held_throttle=None):
+        # Surfaces neutral, throttle held at the last commanded value
+        ctrls_data.elevator = 0
+        ctrls_data.rudder = 0
+        ctrls_data.aileron = 0
+
+        if held_throttle is not None:
+            ctrls_data.throttle = held_throttle
+
+        return ctrls_data
+
+    def _store_ctrls_template(self, ctrls_data, now):
+        if now - self._last_template_time < self.CTRLS_TEMPLATE_INTERVAL_S:
+            return
+        self._last_template_time = now
+
+        packet = self._ctrls_connection.fg_net_struct.build(dict(**ctrls_data))
+        with self._ctrls_template_lock:
+            self._ctrls_template[:len(packet)] = packet
+            self._ctrls_template_length.value = len(packet)
 
     def _fdm_callback(self, fdm_data, event_pipe):
-        return self._brain.fdm_update(fdm_data, event_pipe)
+        now = time.monotonic()
+        if self._last_fdm_time is not None and now - self._last_fdm_time > self._watchdog_config.late_frame_s:
+            self._late_frames += 1
+        self._last_fdm_time = now
+
+        result = self._brain.fdm_update(fdm_data, event_pipe)
+
+        self._status.write(fdm_time=now, late_frames=self._late_frames)
+
+        return result
 
     def _ctrls_callback(self, ctrls_data, event_pipe):
-        return self._brain.ctrls_update(ctrls_data, event_pipe)
+        now = time.monotonic()
+        self._store_ctrls_template(ctrls_data, now)
+
+        result = self._brain.ctrls_update(ctrls_data, event_pipe)
+        if not self._brain.FLIES_AIRCRAFT:
+            return result
+
+        if result is None:
+            # The brain leaves the controls to the pilot or FG this tick, nothing is sent back. The
+            # control loop still runs, the failsafe output comes from the watchdog tick
+            self._status.write(ctrls_time=now)
+            return None
+
+        if self._status["failsafe"]:
+            result = self._failsafe_ctrls(result, self._held_throttle)
+        else:
+            self._held_throttle = list(result.throttle)
+
+        self._ctrls_transmissions += 1
+        self._status.write(ctrls_time=now, ctrls_transmissions=self._ctrls_transmissions,
+                           elevator=result.elevator, aileron=result.aileron, rudder=result.rudder,
+                           throttle=result.throttle[0])
+
+        return result
 
 
 if __name__ == "__main__":
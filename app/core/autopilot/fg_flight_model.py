@@ -0,0 +1,241 @@
+import dataclasses
+
+import numpy as np
+
+
+G = 9.80665
+RHO_0 = 1.225
+EARTH_RADIUS_M = 6371000.0
+M_TO_FT = 3.28084
+MPS_TO_KT = 1.94384
+
+
+@dataclasses.dataclass
+class AircraftParameters:
+    """
+    Rigid-body and linear aerodynamic coefficients, per radian. Defaults are a light single-engine aircraft.
+    Control sign conventions follow FlightGear: positive elevator pitches down, positive aileron rolls right,
+    positive rudder yaws right.
+    """
+    mass: float = 1100
+    inertia: tuple = (1285, 1825, 2667)  # Ixx, Iyy, Izz
+    wing_area: float = 16.2
+    wing_span: float = 10.9
+    chord: float = 1.5
+    thrust_max: float = 2500
+    max_deflection: float = 0.35  # Control surface deflection at +-1
+
+    CL_0: float = 0.25
+    CL_alpha: float = 4.6
+    CL_de: float = -0.4
+    CD_0: float = 0.03
+    CD_k: float = 0.05
+    CY_beta: float = -0.3
+
+    Cm_0: float = 0.01
+    Cm_alpha: float = -0.9
+    Cm_q: float = -12
+    Cm_de: float = -1.1
+
+    Cl_beta: float = -0.09
+    Cl_p: float = -0.47
+    Cl_r: float = 0.1
+    Cl_da: float = 0.18
+
+    Cn_beta: float = 0.065
+    Cn_r: float = -0.1
+    Cn_p: float = -0.03
+    Cn_dr: float = 0.07
+
+
+class FlightModel:
+    def __init__(self, n=1, params: AircraftParameters = None,
+                 lat_deg=55.0, lon_deg=37.0, alt_m=1000.0, airspeed=60.0, heading_deg=0.0):
+        """
+        Vectorised 6-DOF flight model of ``n`` independent aircraft with fixed-step integration.
+        All state is kept in (n, 3) arrays: NED position relative to the origin, body velocity,
+        Euler angles and body rates.
+
+        :param n: Number of aircraft
+        :param params: Aircraft parameters
+        :param lat_deg: Latitude of the NED origin
+        :param lon_deg: Longitude of the NED origin
+        :param alt_m: Initial altitude
+        :param airspeed: Initial airspeed, m/s
+        :param heading_deg: Initial heading
+        """
+        self._n = n
+        self._p = params or AircraftParameters()
+
+        self._lat0 = np.deg2rad(lat_deg)
+        self._lon0 = np.deg2rad(lon_deg)
+
+        self._inertia = np.array(self._p.inertia, dtype=np.float64)
+
+        self.position = np.zeros((n, 3))
+        self.position[:, 2] = -alt_m
+        self.velocity = np.zeros((n, 3))
+        self.euler = np.zeros((n, 3))
+        self.euler[:, 2] = np.deg2rad(heading_deg)
+        self.rates = np.zeros((n, 3))
+
+        # elevator, aileron, rudder in [-1, 1], throttle in [0, 1]
+        self.controls = np.zeros((n, 4))
+
+        self.time = 0.0
+
+        self._trim(airspeed, alt_m)
+
+    @property
+    def n(self):
+        return self._n
+
+    def _trim(self, airspeed, alt_m):
+        p = self._p
+        qbar = 0.5 * self._density(alt_m) * airspeed ** 2
+        CL = p.mass * G / (qbar * p.wing_area)
+        alpha = (CL - p.CL_0) / p.CL_alpha
+        drag = qbar * p.wing_area * (p.CD_0 + p.CD_k * CL ** 2)
+
+        self.velocity[:, 0] = airspeed * np.cos(alpha)
+        self.velocity[:, 2] = airspeed * np.sin(alpha)
+        self.euler[:, 1] = alpha
+        self.controls[:, 0] = -(p.Cm_0 + p.Cm_alpha * alpha) / (p.Cm_de * p.max_deflection)
+        self.controls[:, 3] = np.clip(drag / p.thrust_max, 0, 1)
+
+    @staticmethod
+    def _density(alt_m):
+        return RHO_0 * np.exp(-np.maximum(alt_m, 0) / 8500)
+
+    def _air_data(self):
+        u, v, w = self.velocity.T
+        airspeed = np.maximum(np.sqrt(u * u + v * v + w * w), 1e-3)
+        alpha = np.arctan2(w, u)
+        beta = np.arcsin(np.clip(v / airspeed, -1, 1))
+        return airspeed, alpha, beta
+
+    def _body_to_ned(self):
+        phi, theta, psi = self.euler.T
+        c_phi, s_phi = np.cos(phi), np.sin(phi)
+        c_the, s_the = np.cos(theta), np.sin(theta)
+        c_psi, s_psi = np.cos(psi), np.sin(psi)
+
+        rotation = np.empty((self._n, 3, 3))
+        rotation[:, 0, 0] = c_the * c_psi
+        rotation[:, 0, 1] = s_phi * s_the * c_psi - c_phi * s_psi
+        rotation[:, 0, 2] = c_phi * s_the * c_psi + s_phi * s_psi
+        rotation[:, 1, 0] = c_the * s_psi
+        rotation[:, 1, 1] = s_phi * s_the * s_psi + c_phi * c_psi
+        rotation[:, 1, 2] = c_phi * s_the * s_psi - s_phi * c_psi
+        rotation[:, 2, 0] = -s_the
+        rotation[:, 2, 1] = s_phi * c_the
+        rotation[:, 2, 2] = c_phi * c_the
+        return rotation
+
+    def step(self, dt: float):
+        """
+        Advance all aircraft by one semi-implicit Euler step
+        """
+        p = self._p
+
+        airspeed, alpha, beta = self._air_data()
+        qbar_s = 0.5 * self._density(-self.position[:, 2]) * airspeed ** 2 * p.wing_area
+
+        de, da, dr = (self.controls[:, :3] * p.max_deflection).T
+        throttle = np.clip(self.controls[:, 3], 0, 1)
+        rate_p, rate_q, rate_r = self.rates.T
+        half_span_v = p.wing_span / (2 * airspeed)
+        half_chord_v = p.chord / (2 * airspeed)
+
+        # Aerodynamic forces in the wind frame, rotated to body
+        CL = p.CL_0 + p.CL_alpha * alpha + p.CL_de * de
+        CD = p.CD_0 + p.CD_k * CL * CL
+        CY = p.CY_beta * beta
+        c_a, s_a = np.cos(alpha), np.sin(alpha)
+
+        forces = np.empty((self._n, 3))
+        forces[:, 0] = qbar_s * (CL * s_a - CD * c_a) + throttle * p.thrust_max
+        forces[:, 1] = qbar_s * CY
+        forces[:, 2] = qbar_s * (-CL * c_a - CD * s_a)
+
+        phi, theta = self.euler[:, 0], self.euler[:, 1]
+        forces[:, 0] -= p.mass * G * np.sin(theta)
+        forces[:, 1] += p.mass * G * np.sin(phi) * np.cos(theta)
+        forces[:, 2] += p.mass * G * np.cos(phi) * np.cos(theta)
+
+        moments = np.empty((self._n, 3))
+        moments[:, 0] = qbar_s * p.wing_span * (p.Cl_beta * beta + p.Cl_p * rate_p * half_span_v +
+                                                p.Cl_r * rate_r * half_span_v + p.Cl_da * da)
+        moments[:, 1] = qbar_s * p.chord * (p.Cm_0 + p.Cm_alpha * alpha + p.Cm_q * rate_q * half_chord_v +
+                                            p.Cm_de * de)
+        moments[:, 2] = qbar_s * p.wing_span * (p.Cn_beta * beta + p.Cn_r * rate_r * half_span_v +
+                                                p.Cn_p * rate_p * half_span_v + p.Cn_dr * dr)
+
+        # Rigid body dynamics with a diagonal inertia tensor
+        i_xx, i_yy, i_zz = self._inertia
+        rates_dot = np.empty((self._n, 3))
+        rates_dot[:, 0] = (moments[:, 0] - (i_zz - i_yy) * rate_q * rate_r) / i_xx
+        rates_dot[:, 1] = (moments[:, 1] - (i_xx - i_zz) * rate_p * rate_r) / i_yy
+        rates_dot[:, 2] = (moments[:, 2] - (i_yy - i_xx) * rate_p * rate_q) / i_zz
+
+        velocity_dot = forces / p.mass - np.cross(self.rates, self.velocity)
+
+        self.rates += rates_dot * dt
+        self.velocity += velocity_dot * dt
+
+        rate_p, rate_q, rate_r = self.rates.T
+        s_phi, c_phi = np.sin(phi), np.cos(phi)
+        c_theta = np.maximum(np.cos(theta), 1e-6)
+        euler_dot = np.empty((self._n, 3))
+        euler_dot[:, 0] = rate_p + (rate_q * s_phi + rate_r * c_phi) * np.tan(theta)
+        euler_dot[:, 1] = rate_q * c_phi - rate_r * s_phi
+        euler_dot[:, 2] = (rate_q * s_phi + rate_r * c_phi) / c_theta
+        self.euler += euler_dot * dt
+        self.euler[:, 0] = (self.euler[:, 0] + np.pi) % (2 * np.pi) - np.pi
+        self.euler[:, 2] %= 2 * np.pi
+
+        self.position += np.einsum("nij,nj->ni", self._body_to_ned(), self.velocity) * dt
+
+        # Flat ground
+        on_ground = self.position[:, 2] > 0
+        self.position[on_ground, 2] = 0
+
+        self.time += dt
+
+    def fdm_data(self, i=0) -> dict:
+        """
+        Net FDM fields of one aircraft, in FlightGear units
+        """
+        airspeed, alpha, beta = self._air_data()
+        velocity_ned = np.einsum("ij,j->i", self._body_to_ned()[i], self.velocity[i])
+
+        north, east, down = self.position[i]
+        lat = self._lat0 + north / EARTH_RADIUS_M
+        lon = self._lon0 + east / (EARTH_RADIUS_M * np.cos(self._lat0))
+
+        return {
+            "lon_rad": float(lon),
+            "lat_rad": float(lat),
+            "alt_m": float(-down),
+            "agl_m": float(-down),
+            "phi_rad": float(self.euler[i, 0]),
+            "theta_rad": float(self.euler[i, 1]),
+            "psi_rad": float(self.euler[i, 2]),
+            "alpha_rad": float(alpha[i]),
+            "beta_rad": float(beta[i]),
+            "phidot_rad_per_s": float(self.rates[i, 0]),
+            "thetadot_rad_per_s": float(self.rates[i, 1]),
+            "psidot_rad_per_s": float(self.rates[i, 2]),
+            "vcas": float(airspeed[i] * np.sqrt(self._density(-down) / RHO_0) * MPS_TO_KT),
+            "climb_rate_ft_per_s": float(-velocity_ned[2] * M_TO_FT),
+            "v_north_ft_per_s": float(velocity_ned[0] * M_TO_FT),
+            "v_east_ft_per_s": float(velocity_ned[1] * M_TO_FT),
+            "v_down_ft_per_s": float(velocity_ned[2] * M_TO_FT),
+            "v_body_u": float(self.velocity[i, 0] * M_TO_FT),
+            "v_body_v": float(self.velocity[i, 1] * M_TO_FT),
+            "v_body_w": float(self.velocity[i, 2] * M_TO_FT),
+            "elevator": float(self.controls[i, 0]),
+            "left_aileron": float(self.controls[i, 1]),
+            "right_aileron": float(-self.controls[i, 1]),
+            "rudder": float(self.controls[i, 2]),
+        }
@@ -0,0 +1,304 @@
+import json
+from typing import Dict, Sequence
+
+import numpy as np
+
+from app.core.autopilot.fg_params import ParameterBlock, ParameterReader
+from app.core.autopilot.fg_pid import PIDControllerCoefficient
+
+
+class GainSchedule:
+    GAINS = ("K_p", "K_i", "K_d")
+    AXES = ("vcas", "alt_m", "alpha_rad")
+
+    def __init__(self, origin: Sequence[float], step: Sequence[float], table: np.ndarray):
+        """
+        PID gains on a regular (airspeed, altitude[, angle of attack]) grid.
+
+        The table lives in a shared parameter block, so node edits made in the GUI process reach the ctrls
+        process. A lookup is a bilinear (trilinear with AoA) interpolation with O(1) cell indexing over a
+        plain list snapshot of the table, without allocating arrays.
+
+        :param origin: Grid coordinates of the first node, per axis
+        :param step: Node spacing, per axis
+        :param table: Gains of shape (n_vcas, n_alt[, n_alpha], 3)
+        """
+        table = np.asarray(table, dtype=np.float64)
+        if table.ndim == 3:
+            table = table[:, :, np.newaxis, :]
+        assert table.ndim == 4 and table.shape[-1] == len(self.GAINS)
+
+        self._shape = table.shape[:3]
+        self._origin = tuple(float(o) for o in origin) + (0.0,) * (3 - len(origin))
+        self._step = tuple(float(s) for s in step) + (1.0,) * (3 - len(step))
+        self._inv_step = tuple(1.0 / s for s in self._step)
+        self._strides = (self._shape[1] * self._shape[2] * 3, self._shape[2] * 3, 3)
+        # Offset of the upper neighbour node per axis, 0 on a single-node axis so the lookup stays in the table
+        self._neighbours = tuple(stride if n > 1 else 0 for stride, n in zip(self._strides, self._shape))
+
+        self._block = ParameterBlock(table.size)
+        self._block.write_array(table.ravel().tolist())
+
+        self._reader = ParameterReader(self._block)
+        self._table = []
+
+    @classmethod
+    def compile(cls, breakpoints: Sequence[Sequence[float]], gains, max_nodes=64):
+        """
+        Resample gains given on (possibly irregular) breakpoints onto a regular grid
+
+        :param breakpoints: Increasing breakpoints per axis (vcas, alt_m[, alpha_rad])
+        :param gains: Gains of shape (len(breakpoints[0]), len(breakpoints[1])[, ...], 3)
+        :param max_nodes: Node limit per axis
+        """
+        from scipy.interpolate import RegularGridInterpolator
+
+        breakpoints = [np.asarray(b, dtype=np.float64) for b in breakpoints]
+        gains = np.asarray(gains, dtype=np.float64)
+
+        src_axes = []
+        grid_axes = []
+        for a, b in enumerate(breakpoints):
+            if len(b) < 2:
+                b = np.array([b[0], b[0] + 1.0])
+                gains = np.repeat(gains, 2, axis=a)
+            # Finest breakpoint spacing decides the node count, so every breakpoint is close to a node
+            n_nodes = int(np.clip(np.ceil((b[-1] - b[0]) / np.min(np.diff(b))) + 1, 2, max_nodes))
+            src_axes.append(b)
+            grid_axes.append(np.linspace(b[0], b[-1], n_nodes))
+
+        interpolator = RegularGridInterpolator(src_axes, gains)
+        mesh = np.stack(np.meshgrid(*grid_axes, indexing="ij"), axis=-1)
+        table = interpolator(mesh)
+
+        return cls(origin=[a[0] for a in grid_axes], step=[a[1] - a[0] for a in grid_axes], table=table)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    def _locate(self, axis, value):
+        x = (value - self._origin[axis]) * self._inv_step[axis]
+        last = self._shape[axis] - 1
+        if last == 0 or x <= 0:
+            return 0, 0.0
+        if x >= last:
+            return last - 1, 1.0
+        i = int(x)
+        return i, x - i
+
+    def lookup(self, vcas: float, alt_m: float, alpha_rad: float = 0.0,
+               out: PIDControllerCoefficient = None) -> PIDControllerCoefficient:
+        """
+        Interpolate the gains at an operating point
+
+        :param vcas: Calibrated airspeed
+        :param alt_m: Altitude
+        :param alpha_rad: Angle of attack, ignored by schedules without an AoA axis
+        :param out: Coefficients to write into
+        """
+        if self._reader.poll():
+            self._table = self._reader.values.tolist()
+
+        if out is None:
+            out = PIDControllerCoefficient(0, 0, 0)
+
+        t = self._table
+        s0, s1, s2 = self._strides
+        n0, n1, n2 = self._neighbours
+
+        i, fx = self._locate(0, vcas)
+        j, fy = self._locate(1, alt_m)
+        k, fz = self._locate(2, alpha_rad)
+        base = i * s0 + j * s1 + k * s2
+
+        for g in range(3):
+            b = base + g
+            v0 = t[b] + (t[b + n0] - t[b]) * fx
+            v1 = t[b + n1] + (t[b + n0 + n1] - t[b + n1]) * fx
+            value = v0 + (v1 - v0) * fy
+
+            if fz:
+                b += n2
+                v0 = t[b] + (t[b + n0] - t[b]) * fx
+                v1 = t[b + n1] + (t[b + n0 + n1] - t[b + n1]) * fx
+                value += (v0 + (v1 - v0) * fy - value) * fz
+
+            setattr(out, self.GAINS[g], value)
+
+        return out
+
+    def nearest_node(self, vcas: float, alt_m: float, alpha_rad: float = 0.0) -> int:
+        """
+        Index of the grid node closest to an operating point
+        """
+        index = 0
+        for axis, value in enumerate((vcas, alt_m, alpha_rad)):
+            i = int(round((value - self._origin[axis]) * self._inv_step[axis]))
+            index = index * self._shape[axis] + min(max(i, 0), self._shape[axis] - 1)
+        return index
+
+    def node_point(self, node: int):
+        """
+        Operating point of a grid node
+        """
+        k = node % self._shape[2]
+        j = node // self._shape[2] % self._shape[1]
+        i = node // (self._shape[1] * self._shape[2])
+        return tuple(self._origin[a] + idx * self._step[a] for a, idx in enumerate((i, j, k)))
+
+    def node_gains(self, node: int) -> PIDControllerCoefficient:
+        return PIDControllerCoefficient(*(self._block[node * 3 + g] for g in range(3)))
+
+    def set_node_gains(self, node: int, pid_c: PIDControllerCoefficient):
+        self._block.write_array([pid_c.K_p, pid_c.K_i, pid_c.K_d], offset=node * 3)
+
+    def to_table(self) -> np.ndarray:
+        _, values = self._block.read()
+        return values.reshape(*self._shape, 3)
+
+    def to_dict(self) -> dict:
+        table = self.to_table()
+        n_axes = 3 if self._shape[2] > 1 else 2
+        if n_axes == 2:
+            table = table[:, :, 0, :]
+
+        return {
+            "breakpoints": {axis: [self._origin[a] + i * self._step[a] for i in range(self._shape[a])]
+                            for a, axis in enumerate(self.AXES[:n_axes])},
+            **{gain: table[..., g].tolist() for g, gain in enumerate(self.GAINS)}
+        }
+
+
+def load_gain_schedules(path: str, max_nodes=64) -> Dict[str, GainSchedule]:
+    """
+    Load per-axis gain schedules from a JSON file of the form
+
+    .. code-block:: json
+
+        {
+            "breakpoints": {"vcas": [...], "alt_m": [...], "alpha_rad": [...]},
+            "pitch": {"K_p": [[...]], "K_i": [[...]], "K_d": [[...]]},
+            "yaw": {...},
+            "roll": {...}
+        }
+
+    ``alpha_rad`` is optional, gain arrays are indexed in breakpoint order.
+
+    :param path: Path to the file
+    :param max_nodes: Node limit per axis of the compiled grids
+    :return: Schedules by PID axis name
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    breakpoints = [data["breakpoints"][axis] for axis in GainSchedule.AXES if axis in data["breakpoints"]]
+
+    schedules = {}
+    for axis in ("pitch", "yaw", "roll"):
+        if axis not in data:
+            continue
+        gains = np.stack([np.asarray(data[axis][gain], dtype=np.float64) for gain in GainSchedule.GAINS], axis=-1)
+        schedules[axis] = GainSchedule.compile(breakpoints, gains, max_nodes=max_nodes)
+
+    return schedules
+
+
+def save_gain_schedules(path: str, schedules: Dict[str, GainSchedule]):
+    data = {}
+    for axis, schedule in schedules.items():
+        schedule_dict = schedule.to_dict()
+        data["breakpoints"] = schedule_dict.pop("breakpoints")
+        data[axis] = schedule_dict
+
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def build_gain_schedules(runs_path: str, n_nodes=None, use_alpha=False) -> Dict[str, GainSchedule]:
+    """
+    Build gain schedules from tuning runs. Gains are interpolated linearly between the tuned points
+    and taken from the nearest one outside them, or everywhere when the points do not span the
+    scheduling space (too few, or all on a line or a plane).
+
+    :param runs_path: CSV file with an ``axis,vcas,alt_m[,alpha_rad],K_p,K_i,K_d`` header,
+        one row per tuned operating point
+    :param n_nodes: Node count per axis of the generated grid, one per scheduling axis, 16 each if not set
+    :param use_alpha: Schedule on the angle of attack too
+    :return: Schedules by PID axis name
+    """
+    from scipy.interpolate import griddata
+    from scipy.spatial import QhullError
+
+    axes = GainSchedule.AXES if use_alpha else GainSchedule.AXES[:2]
+    n_nodes = (16,) * len(axes) if n_nodes is None else tuple(n_nodes)
+    if len(n_nodes) != len(axes):
+        raise ValueError(f"{len(n_nodes)} node counts for the {len(axes)} scheduling axes {', '.join(axes)}")
+
+    runs = np.genfromtxt(runs_path, delimiter=",", names=True, dtype=None, encoding="utf-8")
+
+    schedules = {}
+    for axis in np.unique(runs["axis"]):
+        axis_runs = runs[runs["axis"] == axis]
+        points = np.stack([axis_runs[a].astype(np.float64) for a in axes], axis=1)
+        values = np.stack([axis_runs[g].astype(np.float64) for g in GainSchedule.GAINS], axis=1)
+
+        # Average repeated runs at the same operating point
+        points, inverse = np.unique(points, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        values = np.stack([np.bincount(inverse, values[:, g]) for g in range(3)], axis=1) / \
+            np.bincount(inverse)[:, np.newaxis]
+
+        grid_axes = [np.linspace(points[:, a].min(), points[:, a].max(), n) for a, n in enumerate(n_nodes)]
+        mesh = np.stack(np.meshgrid(*grid_axes, indexing="ij"), axis=-1)
+
+        table = np.empty(mesh.shape[:-1] + (3,))
+        for g in range(3):
+            nearest = griddata(points, values[:, g], mesh, method="nearest")
+            try:
+                linear = griddata(points, values[:, g], mesh, method="linear") if len(points) > len(axes) else None
+            except QhullError:
+                # Degenerate points have no triangulation
+                linear = None
+            table[..., g] = nearest if linear is None else np.where(np.isnan(linear), nearest, linear)
+
+        step = [a[1] - a[0] if len(a) > 1 and a[1] > a[0] else 1.0 for a in grid_axes]
+        schedules[str(axis)] = GainSchedule(origin=[a[0] for a in grid_axes], step=step, table=table)
+
+    return schedules
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build gain schedules from tuning runs")
+    build_parser.add_argument("runs", help="CSV file of tuning runs", type=str)
+    build_parser.add_argument("output", help="Output JSON file", type=str)
+    build_parser.add_argument("--nodes", help="Node count per scheduling axis, 16 each if not set", type=int,
+                              nargs="+", default=None)
+    build_parser.add_argument("--alpha", help="Schedule on angle of attack", action="store_true", default=False)
+
+    bench_parser = subparsers.add_parser("bench", help="Measure lookup time")
+    bench_parser.add_argument("--schedule", help="JSON schedule file", type=str, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        save_gain_schedules(args.output, build_gain_schedules(args.runs, args.nodes, args.alpha))
+    else:
+        if args.schedule:
+            schedule = next(iter(load_gain_schedules(args.schedule).values()))
+        else:
+            schedule = GainSchedule.compile([[50, 100, 150, 200, 300], [0, 1000, 3000, 6000]],
+                                            np.random.default_rng(0).uniform(0, 0.1, (5, 4, 3)))
+
+        pid_c = PIDControllerCoefficient(0, 0, 0)
+        n = 100000
+        tic = time.perf_counter()
+        for i in range(n):
+            schedule.lookup(80 + i % 200, 500 + i % 5000, out=pid_c)
+        print(f"Lookup: {(time.perf_counter() - tic) / n * 1e6:.2f} us")
@@ -0,0 +1,200 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+EARTH_RADIUS_M = 6371000.0
+
+
+class Route:
+    def __init__(self, waypoints, index_spacing_m: float = None):
+        """
+        Route of lat/lon/alt waypoints with a spatial index over its segments.
+
+        Waypoints are projected to a local east/north plane (equirectangular around the mean latitude).
+        Every segment is sampled at least every ``index_spacing_m`` meters and the samples are put into
+        a k-d tree, so the nearest segment to a position is found with two tree queries and an exact
+        distance check over a handful of candidates, instead of a scan over the whole route.
+
+        :param waypoints: Array-like of (lat_deg, lon_deg, alt_m) rows, at least two
+        :param index_spacing_m: Distance between index samples, median segment length by default
+        """
+        waypoints = np.asarray(waypoints, dtype=np.float64)
+        assert waypoints.ndim == 2 and waypoints.shape[0] >= 2 and waypoints.shape[1] == 3
+
+        self._lat0 = np.deg2rad(np.mean(waypoints[:, 0]))
+        self._lon0 = np.deg2rad(np.mean(waypoints[:, 1]))
+        self._cos_lat0 = np.cos(self._lat0)
+
+        x, y = self.to_local(np.deg2rad(waypoints[:, 0]), np.deg2rad(waypoints[:, 1]))
+        self._points = np.stack([x, y], axis=1)
+        self._alt = waypoints[:, 2].copy()
+
+        self._seg_start = self._points[:-1]
+        self._seg_delta = self._points[1:] - self._points[:-1]
+        self._seg_length = np.hypot(self._seg_delta[:, 0], self._seg_delta[:, 1])
+        self._seg_length_sq = np.maximum(self._seg_length ** 2, 1e-12)
+        self._cum_length = np.concatenate([[0.0], np.cumsum(self._seg_length)])
+
+        if index_spacing_m is None:
+            index_spacing_m = max(float(np.median(self._seg_length)), 1.0)
+        self._index_spacing = index_spacing_m
+
+        # Sample every segment so that no point of it is further than spacing / 2 from a sample
+        samples_per_seg = np.maximum(np.ceil(self._seg_length / index_spacing_m), 1).astype(np.int64)
+        sample_seg = np.repeat(np.arange(len(self._seg_length)), samples_per_seg)
+        first_sample = np.concatenate([[0], np.cumsum(samples_per_seg)[:-1]])
+        sample_t = (np.arange(len(sample_seg)) - np.repeat(first_sample, samples_per_seg) + 0.5) / \
+            np.repeat(samples_per_seg, samples_per_seg)
+        samples = self._seg_start[sample_seg] + self._seg_delta[sample_seg] * sample_t[:, np.newaxis]
+
+        self._sample_seg = sample_seg
+        self._tree = cKDTree(samples)
+        self._search_slack = 0.5 * float(np.max(self._seg_length / samples_per_seg))
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        """
+        Load a route from a CSV file of ``lat_deg,lon_deg,alt_m`` rows
+
+        :param path: Path to the file
+        """
+        return cls(np.loadtxt(path, delimiter=",", ndmin=2), **kwargs)
+
+    @property
+    def length(self) -> float:
+        return self._cum_length[-1]
+
+    def __len__(self):
+        return len(self._points)
+
+    def to_local(self, lat_rad, lon_rad):
+        """
+        Project lat/lon (radians) to local east/north meters
+        """
+        x = (lon_rad - self._lon0) * self._cos_lat0 * EARTH_RADIUS_M
+        y = (lat_rad - self._lat0) * EARTH_RADIUS_M
+        return x, y
+
+    def nearest_segment(self, x: float, y: float):
+        """
+        Find the route segment closest to a local position
+
+        :return: Segment index, along-track distance and signed cross-track distance (positive to the right)
+        """
+        nearest_sample_dist, _ = self._tree.query((x, y))
+        candidates = self._tree.query_ball_point((x, y), nearest_sample_dist + self._search_slack)
+        segments = np.unique(self._sample_seg[candidates])
+
+        to_point = np.array((x, y)) - self._seg_start[segments]
+        delta = self._seg_delta[segments]
+        t = np.clip(np.einsum("ij,ij->i", to_point, delta) / self._seg_length_sq[segments], 0, 1)
+        offset = to_point - delta * t[:, np.newaxis]
+        dist_sq = np.einsum("ij,ij->i", offset, offset)
+
+        best = int(np.argmin(dist_sq))
+        seg = int(segments[best])
+
+        cross = delta[best, 0] * to_point[best, 1] - delta[best, 1] * to_point[best, 0]
+        cross_track = -np.sign(cross) * np.sqrt(dist_sq[best])
+        along_track = self._cum_length[seg] + t[best] * self._seg_length[seg]
+
+        return seg, along_track, cross_track
+
+    def point_at(self, along_track: float):
+        """
+        Interpolate the route at an along-track distance
+
+        :return: Local x, y and altitude
+        """
+        along_track = min(max(along_track, 0.0), self.length)
+        seg = min(int(np.searchsorted(self._cum_length, along_track, side="right")) - 1, len(self._seg_length) - 1)
+        t = (along_track - self._cum_length[seg]) / max(self._seg_length[seg], 1e-12)
+
+        x, y = self._seg_start[seg] + self._seg_delta[seg] * t
+        alt = self._alt[seg] + (self._alt[seg + 1] - self._alt[seg]) * t
+        return x, y, alt
+
+
+class RouteGuidance:
+    def __init__(self, route: Route, lookahead_m: float = 500, max_pitch_deg: float = 15):
+        """
+        Lookahead (carrot) guidance along a route
+
+        :param route: Route to follow
+        :param lookahead_m: Along-track distance of the carrot ahead of the nearest route point
+        :param max_pitch_deg: Pitch target limit
+        """
+        self._route = route
+        self._lookahead = lookahead_m
+        self._max_pitch = max_pitch_deg
+
+        self._segment = 0
+        self._cross_track = 0.0
+
+    @property
+    def route(self):
+        return self._route
+
+    @property
+    def segment(self) -> int:
+        return self._segment
+
+    @property
+    def cross_track(self) -> float:
+        return self._cross_track
+
+    def update(self, lat_rad: float, lon_rad: float, alt_m: float, yaw_deg: float):
+        """
+        Compute pitch/yaw targets for the current position
+
+        :param lat_rad: Latitude
+        :param lon_rad: Longitude
+        :param alt_m: Altitude
+        :param yaw_deg: Current heading, used to unwrap the yaw target
+        :return: Target pitch and yaw in degrees
+        """
+        x, y = self._route.to_local(lat_rad, lon_rad)
+        self._segment, along_track, self._cross_track = self._route.nearest_segment(x, y)
+
+        carrot_x, carrot_y, carrot_alt = self._route.point_at(along_track + self._lookahead)
+        dx, dy = carrot_x - x, carrot_y - y
+
+        bearing = np.rad2deg(np.arctan2(dx, dy))
+        # Keep the target on the near side of the current heading so the yaw PID turns the short way
+        target_yaw = yaw_deg + (bearing - yaw_deg + 180) % 360 - 180
+
+        horizontal_dist = max(np.hypot(dx, dy), 1.0)
+        target_pitch = np.clip(np.rad2deg(np.arctan2(carrot_alt - alt_m, horizontal_dist)),
+                               -self._max_pitch, self._max_pitch)
+
+        return target_pitch, target_yaw
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+
+    for n_points in (1000, 10000, 100000):
+        # Random walk of ~200 m legs around 55N 37E
+        headings = np.cumsum(rng.normal(0, 0.2, n_points))
+        steps = rng.uniform(100, 300, n_points)
+        north = np.cumsum(steps * np.cos(headings))
+        east = np.cumsum(steps * np.sin(headings))
+        lat = 55 + np.rad2deg(north / EARTH_RADIUS_M)
+        lon = 37 + np.rad2deg(east / (EARTH_RADIUS_M * np.cos(np.deg2rad(55))))
+        alt = 1000 + 200 * np.sin(np.linspace(0, 20, n_points))
+
+        tic = time.perf_counter()
+        guidance = RouteGuidance(Route(np.stack([lat, lon, alt], axis=1)))
+        build_time = time.perf_counter() - tic
+
+        queries = rng.integers(0, n_points, 2000)
+        jitter = rng.normal(0, 1e-5, (len(queries), 2))
+
+        tic = time.perf_counter()
+        for i, q in enumerate(queries):
+            guidance.update(np.deg2rad(lat[q] + jitter[i, 0]), np.deg2rad(lon[q] + jitter[i, 1]), alt[q], 0)
+        tick_time = (time.perf_counter() - tic) / len(queries)
+
+        print(f"{n_points:>7} points: build {build_time * 1e3:.1f} ms, tick {tick_time * 1e6:.1f} us")
@@ -0,0 +1,148 @@
+import ctypes
+from typing import Sequence, Union
+
+import multiprocess as mp
+import numpy as np
+
+
+class ParameterBlock:
+    def __init__(self, fields: Union[Sequence[str], int]):
+        """
+        Fixed-layout block of float64 values shared between the GUI process and the FlightGear
+        RX/TX processes. The block must be created before the processes are started.
+
+        Writes are guarded by a seqlock: the version counter is odd while a write is in progress and
+        is bumped to the next even value when it completes, so readers can compare it against the last
+        seen version to cheaply detect changes without any pipe traffic.
+
+        :param fields: Names of the values in layout order, or the number of values for an anonymous
+            layout that is addressed by index
+        """
+        self._fields = tuple(range(fields)) if isinstance(fields, int) else tuple(fields)
+        self._index = {name: i for i, name in enumerate(self._fields)}
+
+        self._values = mp.RawArray(ctypes.c_double, len(self._fields))
+        self._version = mp.RawValue(ctypes.c_uint64, 0)
+
+        self._write_lock = mp.Lock()
+
+    @property
+    def fields(self):
+        return self._fields
+
+    @property
+    def version(self) -> int:
+        return self._version.value
+
+    def index(self, field: Union[str, int]) -> int:
+        return self._index[field]
+
+    def write(self, **values):
+        """
+        Write values by field name and bump the version counter
+
+        :param values: Field values
+        """
+        # Resolved before the version turns odd, an unknown field must not leave readers spinning
+        indexed = [(self._index[field], value) for field, value in values.items()]
+        with self._write_lock:
+            self._version.value += 1
+            for i, value in indexed:
+                self._values[i] = value
+            self._version.value += 1
+
+    def write_array(self, values, offset=0):
+        """
+        Write a contiguous run of values starting at the offset and bump the version counter
+
+        :param values: Sequence of values
+        :param offset: Index of the first value in the block
+        """
+        if offset < 0 or offset + len(values) > len(self._fields):
+            raise IndexError(f"Values {offset}..{offset + len(values)} do not fit a block of {len(self._fields)}")
+        with self._write_lock:
+            self._version.value += 1
+            self._values[offset:offset + len(values)] = values
+            self._version.value += 1
+
+    def read(self, out: np.ndarray = None):
+        """
+        Read a consistent snapshot of the block
+
+        :param out: Optional preallocated float64 array of the block size
+        :return: Version of the snapshot and the values
+        """
+        if out is None:
+            out = np.empty(len(self._fields), dtype=np.float64)
+
+        view = np.frombuffer(self._values, dtype=np.float64)
+
+        while True:
+            version = self._version.value
+            if version & 1:
+                continue
+            np.copyto(out, view)
+            if self._version.value == version:
+                return version, out
+
+    def __getitem__(self, field: Union[str, int]) -> float:
+        return self._values[self._index[field]]
+
+    def __len__(self):
+        return len(self._fields)
+
+
+class ParameterReader:
+    def __init__(self, block: ParameterBlock):
+        """
+        Reader side of a parameter block. Keeps a private copy of the values
+        and refreshes it only when the block version changes.
+
+        :param block: Parameter block to read
+        """
+        self._block = block
+        self._version = -1
+        self._values = np.zeros(len(block), dtype=np.float64)
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values
+
+    def __getitem__(self, field: str) -> float:
+        return self._values[self._block.index(field)]
+
+    def poll(self) -> bool:
+        """
+        Refresh the local copy if the block has changed
+
+        :return: True if new values were read
+        """
+        if self._block.version == self._version:
+            return False
+
+        self._version, _ = self._block.read(self._values)
+        return True
+
+
+if __name__ == "__main__":
+    import time
+
+    block = ParameterBlock(("throttle", "pitch", "yaw", "roll"))
+    reader = ParameterReader(block)
+
+    block.write(throttle=0.6, pitch=20, yaw=180, roll=0)
+    assert reader.poll() and reader["yaw"] == 180
+    assert not reader.poll()
+
+    # A rejected write leaves the block readable
+    try:
+        block.write(throttle=0.5, rudder=1)
+    except KeyError:
+        pass
+    assert block.version % 2 == 0 and block["throttle"] == 0.6
+
+    n = 100000
+    tic = time.perf_counter()
+    for _ in range(n):
+        reader.poll()
+    print(f"Unchanged poll: {(time.perf_counter() - tic) / n * 1e9:.0f} ns")
@@ -0,0 +1,183 @@
+import time
+
+from construct import Array, Bytes, Const, Container
+
+from flightgear_python.fg_if import FDMConnection
+from flightgear_python.fdm_v24 import fdm_struct
+
+from app.core.autopilot import Port
+
+from app.core.autopilot.fg_brain import BrainBase
+from app.core.autopilot.fg_controller import FGController
+from app.core.autopilot.fg_flight_model import FlightModel
+
+
+def _fdm_defaults() -> dict:
+    defaults = {}
+    for name, field in fdm_struct.items():
+        if isinstance(field, Const):
+            continue
+        elif isinstance(field, Array):
+            defaults[name] = [0] * field.count
+        elif isinstance(field, Bytes):
+            defaults[name] = bytes(field.length)
+        else:
+            defaults[name] = 0
+
+    defaults.update(num_engines=1, eng_state=["running", "off", "off", "off"], rpm=[2400, 0, 0, 0],
+                    num_tanks=1, num_wheels=3, gear_pos=[1, 1, 1], visibility_m=20000)
+    return defaults
+
+
+class FGSimulator(FGController):
+    def __init__(self, brain: BrainBase, flight_model: FlightModel = None,
+                 physics_rate=240, control_rate=60, render_rate=60, realtime=True):
+        """
+        External FDM mode: flies our own flight model in-process at a fixed rate and drives FlightGear
+        only as a renderer through Net FDM packets (FG started with ``--fdm=external``).
+
+        The simulation is deterministic: physics, brain and rendering run on fixed step counts. With
+        ``realtime`` off, or when no renderer is connected, it runs as fast as possible.
+
+        :param brain: Brain that flies the model
+        :param flight_model: Flight model, the first aircraft is flown and rendered
+        :param physics_rate: Integration rate, Hz
+        :param control_rate: Brain update rate, Hz
+        :param render_rate: Rate of FDM packets sent to FG, Hz
+        :param realtime: Pace the simulation to wall-clock time
+        """
+        super().__init__(brain)
+
+        self._model = flight_model or FlightModel()
+
+        self._dt = 1 / physics_rate
+        self._control_decimation = max(1, round(physics_rate / control_rate))
+        self._render_decimation = max(1, round(physics_rate / render_rate))
+        self._realtime = realtime
+
+        self._step_count = 0
+        self._fdm_packet = _fdm_defaults()
+
+    @property
+    def flight_model(self) -> FlightModel:
+        return self._model
+
+    @property
+    def step_count(self) -> int:
+        return self._step_count
+
+    def connect(self, host: str, fdm_port: Port, ctrls_port: Port = None, disconnect_callback: callable = None):
+        """
+        Connect to the FDM input of FlightGear. Controls come from the brain, so ``ctrls_port`` is unused.
+
+        :param host: IP address of FG (usually localhost)
+        :param fdm_port: Out/In fdm ports of the socket, only the input one is used
+        """
+        self._fdm_connection = FDMConnection(fdm_version=self.FDM_VERSION)
+        self._fdm_connection.connect_tx(host, fdm_port.port_in)
+
+    def run(self):
+        next_step_time = time.perf_counter()
+
+        while not self._stop_event.is_set():
+            self.step()
+
+            if self._realtime and self._fdm_connection:
+                next_step_time += self._dt
+                delay = next_step_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def stop(self):
+        self._stop_event.set()
+
+        if self.is_alive():
+            self.join()
+
+    def update(self):
+        self._brain.update()
+        # The control step stands in for the FDM and ctrls callbacks, so the status block is recorded
+        # with the same meaning in both modes
+        self._update_watchdog()
+
+    def step(self):
+        self._model.step(self._dt)
+        self._step_count += 1
+
+        if self._step_count % self._control_decimation == 0:
+            self._update_brain()
+
+        if self._fdm_connection and self._step_count % self._render_decimation == 0:
+            self._fdm_packet.update(self._model.fdm_data(0))
+            self._fdm_packet["cur_time_s"] = int(time.time())
+            self._fdm_connection.send(self._fdm_packet)
+
+    def _update_brain(self):
+        controls = self._model.controls[0]
+
+        now = time.monotonic()
+        # Late control steps only mean something when the simulation is paced to wall-clock time
+        if self._realtime and self._fdm_connection and self._last_fdm_time is not None and \
+                now - self._last_fdm_time > self._watchdog_config.late_frame_s:
+            self._late_frames += 1
+        self._last_fdm_time = now
+
+        self._brain.fdm_update(Container(**self._model.fdm_data(0)), None)
+        self._status.write(fdm_time=now, late_frames=self._late_frames)
+
+        ctrls_data = Container(elevator=float(controls[0]), aileron=float(controls[1]), rudder=float(controls[2]),
+                               throttle=[float(controls[3])] * 4)
+        ctrls_data = self._brain.ctrls_update(ctrls_data, None)
+
+        if ctrls_data is not None:
+            controls[:] = ctrls_data.elevator, ctrls_data.aileron, ctrls_data.rudder, ctrls_data.throttle[0]
+            self._ctrls_transmissions += 1
+            self._status.write(ctrls_time=now, ctrls_transmissions=self._ctrls_transmissions,
+                               elevator=controls[0], aileron=controls[1], rudder=controls[2], throttle=controls[3])
+        else:
+            self._status.write(ctrls_time=now)
+
+        self.update()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.core.autopilot.fg_brain import AutopilotBrain
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", help="Simulated time", type=float, default=120)
+    parser.add_argument("--host", help="FlightGear host, runs headless if not set", type=str, default=None)
+    parser.add_argument("--fdm-in-port", help="FlightGear Net FDM input port", type=int, default=5502)
+    args = parser.parse_args()
+
+    # Raw vectorised model throughput
+    for n in (1, 100, 1000):
+        model = FlightModel(n=n)
+        steps = 2400
+        tic = time.perf_counter()
+        for _ in range(steps):
+            model.step(1 / 240)
+        elapsed = time.perf_counter() - tic
+        print(f"Model, {n:>4} aircraft: {steps / elapsed:,.0f} steps/s, {n * steps / elapsed:,.0f} aircraft-steps/s")
+
+    # Closed loop with the autopilot brain
+    brain = AutopilotBrain()
+    brain.set_target_pitch(5)
+    brain.set_target_yaw(90)
+    brain.set_target_throttle(0.6)
+
+    simulator = FGSimulator(brain)
+    if args.host:
+        simulator.connect(args.host, Port(0, args.fdm_in_port))
+
+    steps = int(args.seconds * 240)
+    tic = time.perf_counter()
+    for _ in range(steps):
+        simulator.step()
+        if args.host:
+            time.sleep(max(0.0, simulator.flight_model.time - (time.perf_counter() - tic)))
+    elapsed = time.perf_counter() - tic
+
+    print(f"Closed loop: {steps / elapsed:,.0f} steps/s, {args.seconds / elapsed:.1f}x real time")
+    print(f"Pitch {brain.pitch:.1f}, yaw {brain.yaw:.1f}, roll {brain.roll:.1f}, altitude {brain.alt:.0f} m")
@@ -0,0 +1,390 @@
+"""
+MJPEG over HTTP source, for FlightGear's screen stream (start FlightGear with --httpd=8080):
+
+    python -m app --video-source "mjpeg:http://localhost:8080/screenshot?stream=y"
+"""
+import dataclasses
+import http.client
+import re
+import socket
+import time
+from threading import Condition, Event, Thread
+from typing import Optional
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+from .video_capture import VideoCaptureBase
+
+
+@dataclasses.dataclass
+class MjpegStats:
+    received_frames: int = 0
+    decoded_frames: int = 0
+    dropped_frames: int = 0  # Received but replaced by a newer one before decoding
+    reconnects: int = 0
+    decode_fps: float = 0.0  # Moving average
+    decode_time: float = 0.0  # Moving average, s
+    frame_age: float = 0.0  # Time from receiving the last read frame to reading it, s
+
+
+# Next marker after entropy-coded data, 0xff 0x00 is a stuffed byte and 0xff 0xd0-0xd7 restart markers
+_ENTROPY_MARKER = re.compile(rb"\xff[^\x00\xd0-\xd7]")
+
+
+def _is_complete_jpeg(buffer, start, end) -> bool:
+    """
+    True if buffer[start:end] is a JPEG that ends with the end marker of its own stream. Segments
+    are skipped by their lengths, so the end marker of a thumbnail embedded in an APP segment does
+    not count.
+    """
+    if buffer[start:start + 2] != b"\xff\xd8":
+        return False
+    i = start + 2
+    while i + 2 <= end:
+        if buffer[i] != 0xff:
+            return False
+        marker = buffer[i + 1]
+        if marker == 0xff:
+            # Fill byte
+            i += 1
+        elif marker == 0xd9:
+            return i + 2 == end
+        elif 0xd0 <= marker <= 0xd7 or marker == 0x01:
+            i += 2
+        else:
+            if i + 4 > end:
+                return False
+            i += 2 + int.from_bytes(buffer[i + 2:i + 4], "big")
+            if marker == 0xda:
+                # Start of scan, its entropy-coded data runs to the next marker
+                match = _ENTROPY_MARKER.search(buffer, i, end)
+                if match is None:
+                    return False
+                i = match.start()
+    return False
+
+
+class _MultipartParser:
+    def __init__(self, boundary: bytes):
+        """
+        Incremental parser of a multipart/x-mixed-replace body. Data is appended to one buffer
+        that is compacted after every part, part bodies are passed on as memoryviews into it.
+        """
+        self._delimiter = b"--" + boundary.lstrip(b"-") if boundary else b"--"
+        self._buffer = bytearray()
+        self._offset = 0
+        self._body_start = None
+        self._body_length = None
+        # Where the search for the delimiter ending a body without length resumes
+        self._scan_start = None
+
+    def feed(self, data, on_part):
+        """
+        :param data: Next bytes of the body
+        :param on_part: Called with the body of every part the data completes, the memoryview is
+            released when it returns
+        """
+        buffer = self._buffer
+        if self._offset:
+            del buffer[:self._offset]
+            if self._body_start is not None:
+                self._body_start -= self._offset
+                self._scan_start -= self._offset
+            self._offset = 0
+        buffer += data
+
+        while True:
+            if self._body_start is None:
+                # Part headers: the delimiter line, header lines and an empty line
+                start = buffer.find(self._delimiter, self._offset)
+                if start < 0:
+                    break
+                end = buffer.find(b"\r\n\r\n", start)
+                if end < 0:
+                    break
+                self._body_length = None
+                for line in bytes(buffer[start:end]).split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        self._body_length = int(value)
+                self._body_start = self._scan_start = end + 4
+
+            if self._body_length is not None:
+                body_end = self._body_start + self._body_length
+                if len(buffer) < body_end:
+                    break
+                next_offset = body_end
+            else:
+                # No length, the body ends at the next delimiter, or with the data if that completes
+                # a JPEG, so the part does not wait for the next one. The search resumes where the
+                # last one stopped, less a delimiter split over the chunks.
+                body_end = buffer.find(self._delimiter, self._scan_start)
+                if body_end >= 0:
+                    next_offset = body_end
+                elif self._ends_jpeg(buffer):
+                    body_end = next_offset = len(buffer)
+                else:
+                    self._scan_start = max(self._body_start, len(buffer) - len(self._delimiter) + 1)
+                    break
+                if buffer[body_end - 2:body_end] == b"\r\n":
+                    body_end -= 2
+
+            part = memoryview(buffer)[self._body_start:body_end]
+            try:
+                on_part(part)
+            finally:
+                part.release()
+            self._body_start = None
+            self._offset = next_offset
+
+    def _ends_jpeg(self, buffer) -> bool:
+        end = len(buffer)
+        if buffer.endswith(b"\r\n"):
+            end -= 2
+        return buffer[end - 2:end] == b"\xff\xd9" and _is_complete_jpeg(buffer, self._body_start, end)
+
+
+class MjpegVideoSource(VideoCaptureBase):
+    def __init__(self, url: str, timeout=1.0, reconnect_interval=1.0, chunk_size=65536):
+        """
+        Keeps one HTTP connection to an MJPEG stream. A receiver thread parses the multipart body
+        and copies every JPEG into a free one of three reused buffers, a decoder thread decodes the
+        latest received one, older undecoded ones are dropped. read() returns the next decoded frame.
+
+        :param url: Stream url
+        :param timeout: Longest wait of read() for a new frame, s
+        :param reconnect_interval: Wait before connecting again after the connection failed, s
+        :param chunk_size: Size of one socket read
+        """
+        self._url = urlsplit(url)
+        self._timeout = timeout
+        self._reconnect_interval = reconnect_interval
+        self._chunk = bytearray(chunk_size)
+
+        # One buffer is written by the receiver, one waits for the decoder, one is decoded
+        self._jpeg_buffers = [bytearray() for _ in range(3)]
+        self._jpeg_lengths = [0] * 3
+        self._receive_times = [0.0] * 3
+        self._pending: Optional[int] = None
+        self._decoding: Optional[int] = None
+        self._jpeg_condition = Condition()
+
+        self._frame = None
+        self._frame_receive_time = 0.0
+        self._frame_number = 0
+        self._read_frame_number = 0
+        self._frame_condition = Condition()
+
+        self._stats = MjpegStats()
+        self._last_decode_time = None
+
+        self._stopped = Event()
+        self._connection = None
+        self._socket = None
+        self._receiver = Thread(target=self._receive, daemon=True)
+        self._decoder = Thread(target=self._decode, daemon=True)
+        self._receiver.start()
+        self._decoder.start()
+
+    @property
+    def stats(self) -> MjpegStats:
+        return self._stats
+
+    def _connect(self):
+        url = self._url
+        connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self._connection = connection_class(url.hostname, url.port, timeout=5)
+        path = url.path or "/"
+        self._connection.request("GET", path + ("?" + url.query if url.query else ""))
+        # The connection lets go of its socket once the response is known to end with it, the
+        # response keeps reading from it
+        self._socket = self._connection.sock
+        response = self._connection.getresponse()
+        if response.status != 200:
+            raise IOError(f"MJPEG stream {url.geturl()} answered {response.status} {response.reason}")
+
+        content_type = response.getheader("Content-Type", "")
+        _, _, boundary = content_type.partition("boundary=")
+        return response, _MultipartParser(boundary.strip().strip('"').encode())
+
+    def _free_buffer(self):
+        # Called under the condition, the buffer neither pending nor being decoded
+        return next(i for i in range(3) if i != self._pending and i != self._decoding)
+
+    def _receive(self):
+        chunk = memoryview(self._chunk)
+        last_error = None
+        while not self._stopped.is_set():
+            try:
+                response, parser = self._connect()
+                last_error = None
+                while not self._stopped.is_set():
+                    if response.chunked:
+                        data = response.read1(len(chunk))
+                    else:
+                        # readinto would wait for a full chunk, readinto1 returns what has arrived
+                        data = chunk[:response.fp.readinto1(chunk)]
+                    if not data:
+                        break
+                    parser.feed(data, self._hand_over)
+            except (OSError, http.client.HTTPException) as e:
+                # Reported once while the same error repeats on every reconnect
+                if not self._stopped.is_set() and str(e) != last_error:
+                    print(f"[WARNING] MJPEG stream {self._url.geturl()}: {e}")
+                last_error = str(e)
+            finally:
+                if self._connection:
+                    self._connection.close()
+                if self._socket:
+                    self._socket.close()
+
+            if self._stopped.wait(self._reconnect_interval):
+                break
+            self._stats.reconnects += 1
+
+    def _hand_over(self, jpeg):
+        receive_time = time.monotonic()
+        with self._jpeg_condition:
+            i = self._free_buffer()
+        buffer = self._jpeg_buffers[i]
+        if len(buffer) < len(jpeg):
+            buffer.extend(bytes(len(jpeg) - len(buffer)))
+        buffer[:len(jpeg)] = jpeg
+
+        with self._jpeg_condition:
+            self._stats.received_frames += 1
+            if self._pending is not None:
+                self._stats.dropped_frames += 1
+            self._jpeg_lengths[i] = len(jpeg)
+            self._receive_times[i] = receive_time
+            self._pending = i
+            self._jpeg_condition.notify()
+
+    def _decode(self):
+        stats = self._stats
+        while True:
+            with self._jpeg_condition:
+                self._decoding = None
+                self._jpeg_condition.wait_for(lambda: self._pending is not None or self._stopped.is_set())
+                if self._stopped.is_set():
+                    return
+                i = self._decoding = self._pending
+                self._pending = None
+
+            tic = time.perf_counter()
+            data = np.frombuffer(self._jpeg_buffers[i], np.uint8, count=self._jpeg_lengths[i])
+            frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            # The buffer may be grown by the receiver once it is free again
+            del data
+            decode_time = time.perf_counter() - tic
+            if frame is None:
+                continue
+
+            now = time.monotonic()
+            stats.decoded_frames += 1
+            stats.decode_time = decode_time if stats.decoded_frames == 1 else \
+                stats.decode_time + (decode_time - stats.decode_time) * 0.1
+            if self._last_decode_time is not None and now > self._last_decode_time:
+                fps = 1 / (now - self._last_decode_time)
+                stats.decode_fps = fps if stats.decoded_frames == 2 else stats.decode_fps + (fps - stats.decode_fps) * 0.1
+            self._last_decode_time = now
+
+            with self._frame_condition:
+                self._frame = frame
+                self._frame_receive_time = self._receive_times[i]
+                self._frame_number += 1
+                self._frame_condition.notify_all()
+
+    def read(self) -> tuple:
+        with self._frame_condition:
+            if not self._frame_condition.wait_for(
+                    lambda: self._frame_number > self._read_frame_number or self._stopped.is_set(), self._timeout) \
+                    or self._frame_number == self._read_frame_number:
+                return False, None
+            self._read_frame_number = self._frame_number
+            self._stats.frame_age = time.monotonic() - self._frame_receive_time
+            return True, self._frame
+
+    def release(self):
+        self._stopped.set()
+        with self._jpeg_condition:
+            self._jpeg_condition.notify()
+        with self._frame_condition:
+            self._frame_condition.notify_all()
+        sock = self._socket
+        if sock:
+            # Unblocks the receiver waiting on the socket, closing alone does not wake a blocked recv
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        self._receiver.join(timeout=2)
+        self._decoder.join(timeout=2)
+
+
+if __name__ == "__main__":
+    import argparse
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from .video_capture import VideoCaptureCVStream
+    from .video_sources import SyntheticVideoSource
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, default=None, help="Stream url, a local stand-in server if not set")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=30.0, help="Frame rate of the stand-in server")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        # Stand-in of FlightGear's /screenshot?stream=y, parts alternate with and without Content-Length
+        class StreamHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                source = SyntheticVideoSource(fps=args.fps)
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=--fgframe")
+                self.end_headers()
+                try:
+                    for i in range(int(args.seconds * args.fps) + 30):
+                        _, frame = source.read()
+                        jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+                        headers = b"--fgframe\r\nContent-Type: image/jpeg\r\n"
+                        if i % 2 == 0:
+                            headers += b"Content-Length: %d\r\n" % len(jpeg)
+                        self.wfile.write(headers + b"\r\n" + jpeg + b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *_):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StreamHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/screenshot?stream=y"
+
+    source = MjpegVideoSource(url)
+    capture = VideoCaptureCVStream(source)
+
+    last_sequence, frames, ages = 0, 0, []
+    tic = time.monotonic()
+    while time.monotonic() - tic < args.seconds:
+        video_frame = capture.read_new(last_sequence, timeout=2.0)
+        if video_frame is None:
+            break
+        last_sequence = video_frame.sequence
+        frames += 1
+        ages.append(source.stats.frame_age)
+    elapsed = time.monotonic() - tic
+    capture.stop()
+    if server:
+        server.shutdown()
+
+    stats = source.stats
+    print(f"{frames} frames in {elapsed:.1f} s, received {stats.received_frames}, decoded {stats.decoded_frames}, "
+          f"dropped {stats.dropped_frames}, reconnects {stats.reconnects}")
+    print(f"Decode {stats.decode_fps:.1f} FPS, {stats.decode_time * 1e3:.2f} ms per frame, "
+          f"frame age at read median {np.median(ages) * 1e3:.2f} ms, max {np.max(ages) * 1e3:.2f} ms")
@@ -0,0 +1,369 @@
+"""
+Recording of the captured video together with the telemetry, and its playback.
+
+A recording ``flight`` is three files: ``flight.avi`` with the frames, ``flight.telemetry.csv``
+with one timestamped row per telemetry sample and ``flight.index.csv`` with the capture time of
+every video frame and the telemetry row that was current at that time. Timestamps are
+time.monotonic() of the recording machine.
+"""
+import bisect
+import csv
+import dataclasses
+import enum
+import time
+from collections import deque
+from threading import Condition, Event, Thread
+from typing import Optional, Sequence
+
+import cv2
+import numpy as np
+
+from .autopilot.fg_params import ParameterBlock, ParameterReader
+from .video_capture import VideoFrame
+
+
+class DropPolicy(enum.Enum):
+    DROP_OLDEST = "oldest"  # A full queue makes room for the new frame, the recording follows the present
+    DROP_NEWEST = "newest"  # A full queue refuses the new frame, the recording has no gaps inside a burst
+
+
+@dataclasses.dataclass
+class RecorderStats:
+    frames: int = 0  # Frames handed to the recorder
+    written_frames: int = 0
+    dropped_frames: int = 0
+    telemetry_records: int = 0
+    queued_frames: int = 0
+    encode_time: float = 0.0  # Moving average, s
+
+
+class FrameRecorder:
+    def __init__(self, path: str, telemetry_fields: Sequence[str], fps=30.0, max_queued_frames=8,
+                 drop_policy: DropPolicy = DropPolicy.DROP_OLDEST, fourcc="MJPG"):
+        """
+        Encodes frames and writes telemetry on a background thread. Frames wait in a bounded queue,
+        a full queue drops a frame by the drop policy instead of blocking. Telemetry records are
+        small and are never dropped. add_frame and add_telemetry only append to the queues.
+
+        :param path: Recording path without extension
+        :param telemetry_fields: Names of the telemetry values
+        :param fps: Nominal frame rate of the video file, the real frame times are in the index
+        :param max_queued_frames: Frames waiting for the encoder at most
+        :param drop_policy: Frame to drop when the queue is full
+        :param fourcc: Video codec
+        """
+        self._path = path
+        self._telemetry_fields = tuple(telemetry_fields)
+        self._fps = fps
+        self._max_queued_frames = max_queued_frames
+        self._drop_policy = drop_policy
+        self._fourcc = cv2.VideoWriter_fourcc(*fourcc)
+
+        self._frames = deque()
+        self._telemetry = deque()
+        self._condition = Condition()
+        self._stopped = False
+
+        self._stats = RecorderStats()
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def stats(self) -> RecorderStats:
+        return self._stats
+
+    @property
+    def telemetry_fields(self):
+        return self._telemetry_fields
+
+    def add_frame(self, video_frame: VideoFrame) -> bool:
+        """
+        Queue a captured frame for encoding, the frame must not be changed afterwards
+
+        :return: False if the frame was dropped
+        """
+        stats = self._stats
+        with self._condition:
+            stats.frames += 1
+            if len(self._frames) >= self._max_queued_frames:
+                stats.dropped_frames += 1
+                if self._drop_policy is DropPolicy.DROP_NEWEST:
+                    return False
+                self._frames.popleft()
+
+            self._frames.append(video_frame)
+            stats.queued_frames = len(self._frames)
+            self._condition.notify()
+        return True
+
+    def add_telemetry(self, timestamp: float, values: Sequence[float]):
+        """
+        :param timestamp: Sample time, time.monotonic()
+        :param values: Values in telemetry_fields order
+        """
+        with self._condition:
+            self._telemetry.append((timestamp, tuple(values)))
+            self._condition.notify()
+
+    def stop(self):
+        """
+        Encode the queued frames and close the files
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        stats = self._stats
+        writer = None
+        telemetry_times = []
+
+        with open(self._path + ".telemetry.csv", "w", newline="") as telemetry_file, \
+                open(self._path + ".index.csv", "w", newline="") as index_file:
+            telemetry_csv = csv.writer(telemetry_file)
+            telemetry_csv.writerow(("timestamp",) + self._telemetry_fields)
+            index_csv = csv.writer(index_file)
+            index_csv.writerow(("frame", "sequence", "timestamp", "telemetry_row"))
+
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._frames or self._telemetry or self._stopped)
+                    telemetry = list(self._telemetry)
+                    self._telemetry.clear()
+                    video_frame = self._frames.popleft() if self._frames else None
+                    stats.queued_frames = len(self._frames)
+                    if video_frame is None and not telemetry and self._stopped:
+                        break
+
+                # Telemetry first, so the frame is matched against every sample taken before it was queued
+                for timestamp, values in telemetry:
+                    telemetry_csv.writerow((repr(timestamp),) + values)
+                    telemetry_times.append(timestamp)
+                stats.telemetry_records = len(telemetry_times)
+
+                if video_frame is None:
+                    continue
+
+                tic = time.perf_counter()
+                frame = video_frame.frame
+                if writer is None:
+                    writer = cv2.VideoWriter(self._path + ".avi", self._fourcc, self._fps,
+                                             (frame.shape[1], frame.shape[0]))
+                writer.write(frame)
+                encode_time = time.perf_counter() - tic
+
+                telemetry_row = bisect.bisect_right(telemetry_times, video_frame.timestamp) - 1
+                index_csv.writerow((stats.written_frames, video_frame.sequence, repr(video_frame.timestamp),
+                                    telemetry_row))
+
+                stats.written_frames += 1
+                stats.encode_time = encode_time if stats.written_frames == 1 else \
+                    stats.encode_time + (encode_time - stats.encode_time) * 0.1
+
+        if writer is not None:
+            writer.release()
+
+
+class TelemetrySampler:
+    def __init__(self, recorder: FrameRecorder, blocks: Sequence[ParameterBlock], interval=0.01):
+        """
+        Polls parameter blocks and records their values whenever one of them has changed. The
+        telemetry fields of the recorder are the fields of the blocks in order.
+
+        :param recorder: Recorder of the samples
+        :param blocks: Blocks written by the FDM and ctrls processes
+        :param interval: Polling interval, s
+        """
+        fields = tuple(field for block in blocks for field in block.fields)
+        assert fields == recorder.telemetry_fields, "Block fields do not match the recorder telemetry fields"
+
+        self._recorder = recorder
+        self._readers = [ParameterReader(block) for block in blocks]
+        self._interval = interval
+
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            # Every reader is polled, so each one takes its new values
+            changed = [reader.poll() for reader in self._readers]
+            if any(changed):
+                self._recorder.add_telemetry(time.monotonic(), np.concatenate([r.values for r in self._readers]))
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+class Recording:
+    def __init__(self, path: str):
+        """
+        Playback of a recording with seeking by time
+
+        :param path: Recording path without extension
+        """
+        index = np.loadtxt(path + ".index.csv", delimiter=",", skiprows=1, ndmin=2)
+        self._timestamps = index[:, 2]
+        self._telemetry_rows = index[:, 3].astype(np.int64)
+
+        with open(path + ".telemetry.csv", newline="") as f:
+            self._telemetry_fields = tuple(next(csv.reader(f))[1:])
+        telemetry = np.loadtxt(path + ".telemetry.csv", delimiter=",", skiprows=1, ndmin=2)
+        self._telemetry_times = telemetry[:, 0] if len(telemetry) else np.empty(0)
+        self._telemetry = telemetry[:, 1:] if len(telemetry) else np.empty((0, len(self._telemetry_fields)))
+
+        self._capture = cv2.VideoCapture(path + ".avi")
+        self._next_frame = 0
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._timestamps)
+
+    @property
+    def start_time(self) -> float:
+        return float(self._timestamps[0]) if len(self._timestamps) else 0.0
+
+    @property
+    def duration(self) -> float:
+        return float(self._timestamps[-1] - self._timestamps[0]) if len(self._timestamps) else 0.0
+
+    @property
+    def telemetry_fields(self):
+        return self._telemetry_fields
+
+    def frame_at(self, t: float) -> int:
+        """
+        Frame shown at a time
+
+        :param t: Seconds from the first frame
+        """
+        i = int(np.searchsorted(self._timestamps, self.start_time + t, side="right")) - 1
+        return min(max(i, 0), self.frame_count - 1)
+
+    def telemetry_at(self, t: float) -> Optional[dict]:
+        """
+        Last telemetry sample at a time
+
+        :param t: Seconds from the first frame
+        """
+        row = int(np.searchsorted(self._telemetry_times, self.start_time + t, side="right")) - 1
+        if row < 0:
+            return None
+        return dict(zip(self._telemetry_fields, self._telemetry[row]))
+
+    def seek(self, t: float):
+        """
+        Continue reading from the frame shown at a time
+
+        :param t: Seconds from the first frame
+        """
+        self._next_frame = self.frame_at(t)
+        self._capture.set(cv2.CAP_PROP_POS_FRAMES, self._next_frame)
+
+    def read(self):
+        """
+        :return: Frame, its time from the first frame and the telemetry current at the frame, or
+            None at the end
+        """
+        grabbed, frame = self._capture.read()
+        if not grabbed or self._next_frame >= self.frame_count:
+            return None
+
+        i = self._next_frame
+        self._next_frame += 1
+        row = self._telemetry_rows[i]
+        telemetry = dict(zip(self._telemetry_fields, self._telemetry[row])) if row >= 0 else None
+        return frame, float(self._timestamps[i] - self.start_time), telemetry
+
+    def release(self):
+        self._capture.release()
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+
+    from .video_sources import SyntheticVideoSource, create_video_capture
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    # A 30 FPS synthetic capture and a 100 Hz telemetry block whose value is its own write time
+    capture = create_video_capture("synthetic:width=640,height=360")
+    block = ParameterBlock(("sample_time", "counter"))
+    path = os.path.join(tempfile.mkdtemp(), "flight")
+    recorder = FrameRecorder(path, block.fields, max_queued_frames=4)
+    sampler = TelemetrySampler(recorder, [block])
+
+    add_frame_times = []
+    stopped = Event()
+
+    def write_telemetry():
+        counter = 0
+        while not stopped.wait(0.01):
+            counter += 1
+            block.write(sample_time=time.monotonic(), counter=counter)
+
+    telemetry_thread = Thread(target=write_telemetry, daemon=True)
+    telemetry_thread.start()
+
+    def record(video_frame):
+        # Runs in the capture thread
+        add_tic = time.perf_counter()
+        recorder.add_frame(video_frame)
+        add_frame_times.append(time.perf_counter() - add_tic)
+
+    capture.add_subscriber(record)
+    time.sleep(args.seconds)
+
+    stopped.set()
+    telemetry_thread.join()
+    sampler.stop()
+    capture.stop()
+    recorder.stop()
+
+    stats = recorder.stats
+    sequences = np.loadtxt(path + ".index.csv", delimiter=",", skiprows=1, ndmin=2)[:, 1]
+    print(f"Recorded {stats.written_frames}/{stats.frames} frames of {capture.latest().sequence} captured, "
+          f"dropped {stats.dropped_frames}, index sequences {int(sequences[0])}..{int(sequences[-1])} "
+          f"without gaps {bool(np.all(np.diff(sequences) == 1))}, {stats.telemetry_records} telemetry records, "
+          f"encode {stats.encode_time * 1e3:.2f} ms per frame, add_frame max {max(add_frame_times) * 1e6:.0f} us")
+
+    recording = Recording(path)
+    print(f"Playback: {recording.frame_count} frames over {recording.duration:.2f} s, "
+          f"fields {', '.join(recording.telemetry_fields)}")
+    errors = []
+    for t in np.linspace(0, recording.duration, 10):
+        recording.seek(t)
+        frame, frame_time, telemetry = recording.read()
+        # The frame shown at t was captured at most one frame interval before t
+        assert t - 1 / 25 <= frame_time <= t + 1e-6, (t, frame_time)
+        if telemetry is not None:
+            # The telemetry of a frame was sampled before the frame was captured
+            errors.append(frame_time + recording.start_time - telemetry["sample_time"])
+    recording.release()
+    print(f"Telemetry age at the frame time: median {np.median(errors) * 1e3:.1f} ms, "
+          f"max {np.max(errors) * 1e3:.1f} ms")
+
+    # A burst faster than the encoder, the producer is never blocked and the policy picks the frames
+    source = SyntheticVideoSource(640, 360, pace=False)
+    burst = [VideoFrame(source.read()[1], i + 1, time.monotonic()) for i in range(100)]
+    for policy in DropPolicy:
+        burst_path = os.path.join(tempfile.mkdtemp(), "burst")
+        recorder = FrameRecorder(burst_path, (), max_queued_frames=8, drop_policy=policy)
+        tic = time.perf_counter()
+        for video_frame in burst:
+            recorder.add_frame(video_frame)
+        add_time = time.perf_counter() - tic
+        recorder.stop()
+
+        sequences = np.loadtxt(burst_path + ".index.csv", delimiter=",", skiprows=1, ndmin=2)[:, 1]
+        print(f"Burst of {len(burst)} with {policy.name}: {add_time * 1e3:.1f} ms to queue, "
+              f"{recorder.stats.written_frames} written, {recorder.stats.dropped_frames} dropped, "
+              f"written sequences {int(sequences[0])}..{int(sequences[-1])}")
@@ -1 +1,9 @@
 from .target_manager import TargetManager
+from .multi_target_manager import MultiTargetManager
+from .scheduled_target_manager import ScheduledTargetManager, SchedulerConfig
+from .tracking_worker import TrackingWorker, TrackingResult
+from .tracking_process import ProcessTargetManager
+from .session_factory import SessionConfig
+from .redetector import RedetectionConfig
+from .template_updater import TemplateUpdateConfig
+from .adaptive_search import AdaptiveSearchConfig
@@ -0,0 +1,208 @@
+import dataclasses
+from typing import Tuple
+
+import numpy as np
+
+from .tracker import Tracker
+
+
+@dataclasses.dataclass
+class AdaptiveSearchConfig:
+    scales: Tuple[float, ...] = (1.0, 1.6, 2.5)  # Search window sizes of the pyramid levels, relative to the regular one
+    motion_margin: float = 2.0  # Multiple of the per-frame target motion the search must cover
+    low_score: float = 0.7  # Below it every level is searched
+    wide_score_factor: float = 0.95  # Response factor per level above the first, favours the sharper crops
+    velocity_smoothing: float = 0.5  # Weight of the last displacement in the velocity estimate
+
+
+@dataclasses.dataclass
+class AdaptiveSearchStats:
+    searches: int = 0
+    wide_searches: int = 0  # Searches with more than one level
+    levels: int = 0  # Levels evaluated in total
+    scale: float = 1.0  # Level chosen by the last search
+    template: int = 0  # Template index chosen by the last search
+
+
+class AdaptiveSearch:
+    def __init__(self, tracker: Tracker, config: AdaptiveSearchConfig = None):
+        """
+        Widens the search window when the target moves fast or the tracker is unsure.
+
+        The model input size is fixed, so a wider window is a coarser crop of a larger region. The
+        regular window is searched alone while the smoothed per-frame displacement, times
+        motion_margin, stays within half the area the score map covers. Otherwise the levels up to
+        the first one that covers it are cropped into one batch, run through the backbone and the
+        head in one call each, and the level with the strongest response moves the target. A low
+        score searches every level.
+
+        :param tracker: Tracker whose template and target state are used
+        :param config: Search pyramid settings
+        """
+        self._tracker = tracker
+        self._config = config or AdaptiveSearchConfig()
+        assert self._config.scales[0] == 1.0, "The first level must be the regular search window"
+
+        n_levels = len(self._config.scales)
+        search_size = tracker.search_size
+        self._x_crops = np.zeros((n_levels, 3, search_size, search_size), np.float32)
+        self._pair_templates = None
+        self._pair_embs = None
+
+        self._velocity = np.zeros(2)
+        self._score = 1.0
+
+        self._stats = AdaptiveSearchStats()
+
+    @property
+    def config(self) -> AdaptiveSearchConfig:
+        return self._config
+
+    @property
+    def stats(self) -> AdaptiveSearchStats:
+        return self._stats
+
+    @property
+    def scale(self) -> float:
+        return self._stats.scale
+
+    def reset(self):
+        """
+        Forget the target motion, call after Tracker.select_obj
+        """
+        self._velocity[:] = 0
+        self._score = 1.0
+        self._stats.scale = 1.0
+        self._stats.template = 0
+
+    def _n_levels(self, scale_z):
+        config = self._config
+        if self._score < config.low_score:
+            return len(config.scales)
+
+        tracker = self._tracker
+        radius = (tracker.score_size - 1) * tracker.stride / scale_z / 2
+        needed = np.linalg.norm(self._velocity) * config.motion_margin
+        for i, scale in enumerate(config.scales):
+            if scale * radius >= needed:
+                return i + 1
+        return len(config.scales)
+
+    def _run(self, x_crops, templates):
+        # Every template against every level, level major
+        tracker = self._tracker
+        n_levels, n_templates = len(x_crops), len(templates)
+        n = n_levels * n_templates
+
+        x = tracker.run_backbone_batched(x_crops)
+        if self._pair_embs is None or self._pair_embs.shape[1:] != x.shape[1:] or len(self._pair_embs) < n:
+            self._pair_embs = np.empty((n,) + x.shape[1:], x.dtype)
+        if self._pair_templates is None or self._pair_templates.shape[1:] != templates.shape[1:] or \
+                len(self._pair_templates) < n:
+            self._pair_templates = np.empty((n,) + templates.shape[1:], templates.dtype)
+        pair_embs, pair_templates = self._pair_embs[:n], self._pair_templates[:n]
+        pair_embs.reshape((n_levels, n_templates) + x.shape[1:])[:] = x[:, np.newaxis]
+        pair_templates.reshape((n_levels, n_templates) + templates.shape[1:])[:] = templates
+
+        return tracker.run_head_batched(pair_templates, pair_embs)
+
+    def search(self, image, templates: np.ndarray = None):
+        """
+        Tracker.search_obj over the levels the target motion needs
+
+        :param image: BGR frame
+        :param templates: Template embeddings to search with, (templates, C, H, W), the tracker template if not set
+        :return: Best score, the target bbox (x, y, w, h) and the scale of the chosen level
+        """
+        config = self._config
+        stats = self._stats
+        tracker = self._tracker
+        previous_center = tracker.center_bbox
+
+        scale_z, s_x = tracker.search_scale()
+        n_levels = self._n_levels(scale_z)
+        stats.searches += 1
+        stats.levels += n_levels
+
+        if n_levels == 1 and templates is None:
+            score, bbox = tracker.search_obj(image)
+            stats.scale = 1.0
+            stats.template = 0
+        else:
+            stats.wide_searches += n_levels > 1
+            if templates is None:
+                templates = tracker._z[0]
+            n_templates = len(templates)
+
+            for i, level in enumerate(config.scales[:n_levels]):
+                tracker.get_subwindow(image, tracker.center_bbox, tracker.search_size, round(s_x * level),
+                                      tracker.channel_average, out=self._x_crops[i:i + 1])
+            score, loc = self._run(self._x_crops[:n_levels], templates)
+
+            # Object probability of every anchor of every pair, as in RpnPostprocess.score
+            logits = score.reshape((len(score), 2, -1))
+            probability = 0.5 * (1 + np.tanh(0.5 * (logits[:, 1] - logits[:, 0])))
+            response = probability.max(axis=1) * np.repeat(
+                config.wide_score_factor ** np.arange(n_levels), n_templates)
+            best = int(np.argmax(response))
+            level, stats.template = divmod(best, n_templates)
+
+            stats.scale = config.scales[level]
+            score, bbox = tracker.update_state(score[best:best + 1], loc[best:best + 1],
+                                               scale_z / stats.scale, image.shape[:2])
+
+        smoothing = config.velocity_smoothing
+        self._velocity = self._velocity * (1 - smoothing) + (tracker.center_bbox - previous_center) * smoothing
+        self._score = score
+        return score, bbox, stats.scale
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+    import time
+
+    from .benchmark import make_stand_in_models, precision, success_auc, synthetic_sequence
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default="resources/models/tracker/backbone.onnx")
+    parser.add_argument("--rpn-head", type=str, default="resources/models/tracker/rpn.onnx")
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    backbone, rpn_head = args.backbone, args.rpn_head
+    if not (os.path.exists(backbone) and os.path.exists(rpn_head)):
+        print("[WARNING] Tracker models not found, using random stand-in models, accuracy is meaningless")
+        backbone, rpn_head = make_stand_in_models(tempfile.mkdtemp())
+
+    policies = [("regular window", None),
+                ("adaptive", AdaptiveSearchConfig()),
+                ("adaptive 4 levels", AdaptiveSearchConfig(scales=(1.0, 1.5, 2.25, 3.4))),
+                ("always 3 levels", AdaptiveSearchConfig(low_score=2.0))]
+
+    print(f"{'sequence':<10} {'policy':<18} {'ms/frame':>9} {'levels':>7} {'success AUC':>11} {'prec@20':>8}")
+    for speed in (1, 3, 6):
+        sequence = synthetic_sequence(f"speed {speed}", args.frames, speed=speed)
+        first_roi = tuple(int(v) for v in sequence.ground_truth[0])
+
+        for name, config in policies:
+            tracker = Tracker(backbone, rpn_head)
+            search = AdaptiveSearch(tracker, config)
+            tracker.select_obj(sequence.frames[0], first_roi)
+            search.reset()
+
+            boxes = [sequence.ground_truth[0]]
+            elapsed = 0.0
+            for i in range(1, len(sequence.frames)):
+                frame = sequence.frames[i]
+                tic = time.perf_counter()
+                roi = tracker.search_obj(frame)[1] if config is None else search.search(frame)[1]
+                elapsed += time.perf_counter() - tic
+                boxes.append(roi)
+
+            boxes = np.array(boxes, np.float64)
+            levels = search.stats.levels / search.stats.searches if config else 1.0
+            print(f"{sequence.name:<10} {name:<18} {elapsed / (len(boxes) - 1) * 1e3:>9.2f} {levels:>7.2f} "
+                  f"{success_auc(boxes, sequence.ground_truth):>11.3f} "
+                  f"{precision(boxes, sequence.ground_truth, [20])[0]:>8.3f}")
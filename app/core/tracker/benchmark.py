@@ -0,0 +1,357 @@
+"""
+Tracker benchmark on synthetic and recorded sequences.
+
+    python -m app.core.tracker.benchmark
+    python -m app.core.tracker.benchmark --clip clip.mp4 groundtruth.txt
+
+Recorded clips come with a ground truth text file of one ``x,y,w,h`` line per frame. When the
+tracker weights are missing, tiny generated stand-in models are used (needs the ``onnx``
+package), so the suite runs headless anywhere; their accuracy figures are meaningless.
+"""
+import dataclasses
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import List, Sequence
+
+import cv2
+import numpy as np
+
+from .session_factory import SessionConfig
+from .target_manager import TargetManager
+from .tracker import Tracker
+
+DEFAULT_BACKBONE = "resources/models/tracker/backbone.onnx"
+DEFAULT_RPN_HEAD = "resources/models/tracker/rpn.onnx"
+
+
+@dataclasses.dataclass
+class BenchmarkSequence:
+    name: str
+    frames: Sequence[np.ndarray]
+    ground_truth: np.ndarray  # (n_frames, 4) x, y, w, h
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    name: str
+    fps: float
+    stage_ms: dict  # Mean time per stage of one search
+    success_auc: float
+    precision_20px: float
+    precision_auc: float
+    peak_alloc_mib: float  # Peak traced allocation of one tracker update
+    rss_mib: float  # Resident set size after the run
+    lost_episodes: int  # Stretches of frames the target manager reported the target lost
+    reacquisition_rate: float  # Share of the lost episodes that ended on the target, nan without any
+
+
+class _SyntheticFrames:
+    # Frames are rendered on access, so long sequences do not have to be kept in memory
+    def __init__(self, background, target, boxes, occluded):
+        self._background = background
+        self._target = target
+        self._boxes = boxes
+        self._occluded = occluded
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def __getitem__(self, i):
+        x, y, w, h = self._boxes[i]
+        frame = self._background.copy()
+        frame[y:y + h, x:x + w] = cv2.resize(self._target, (w, h))
+        if self._occluded[i]:
+            cx = x + w // 2
+            frame[:, max(0, cx - 40):cx + 40] = 128
+        return frame
+
+
+def synthetic_sequence(name, n_frames=150, size=(720, 1280), motion=True, scaling=False, occlusion=False,
+                       seed=0, speed=1.0) -> BenchmarkSequence:
+    """
+    Textured target over a smooth background with known ground truth
+
+    :param name: Sequence name
+    :param n_frames: Number of frames
+    :param size: Frame (height, width)
+    :param motion: Move the target along a Lissajous path, narrowed to keep it in smaller frames
+    :param scaling: Grow and shrink the target by up to 2x
+    :param occlusion: Pass an occluding bar over the target in the middle of the sequence
+    :param seed: Random seed of the textures
+    :param speed: Speed multiplier of the motion
+    """
+    rng = np.random.default_rng(seed)
+    height, width = size
+    background = cv2.GaussianBlur((rng.random(size + (3,)) * 255).astype(np.uint8), (0, 0), 8)
+    target = (rng.random((48, 64, 3)) * 255).astype(np.uint8)
+
+    max_scale = 1.5 if scaling else 1.0
+    max_w, max_h = int(64 * max_scale), int(48 * max_scale)
+    if width < max_w or height < max_h:
+        raise ValueError(f"Frame of {width}x{height} does not fit the {max_w}x{max_h} target")
+    # Path amplitude, the target stays in the frame at its largest
+    amplitude_x = min(300, (width - max_w) // 2) if motion else 0
+    amplitude_y = min(150, (height - max_h) // 2) if motion else 0
+
+    boxes = []
+    for i in range(n_frames):
+        scale = 1 + 0.5 * np.sin(i / 30) if scaling else 1.0
+        w, h = int(64 * scale), int(48 * scale)
+        cx = width / 2 + amplitude_x * np.sin(i * speed / 40)
+        cy = height / 2 + amplitude_y * np.sin(i * speed / 25)
+        boxes.append((int(cx - w / 2), int(cy - h / 2), w, h))
+
+    occluded = [occlusion and n_frames * 0.4 <= i < n_frames * 0.5 for i in range(n_frames)]
+    frames = _SyntheticFrames(background, target, boxes, occluded)
+    return BenchmarkSequence(name, frames, np.array(boxes, dtype=np.float64))
+
+
+def synthetic_sequences(n_frames=150) -> List[BenchmarkSequence]:
+    return [
+        synthetic_sequence("moving", n_frames),
+        synthetic_sequence("scaling", n_frames, scaling=True),
+        synthetic_sequence("occluded", n_frames, occlusion=True),
+    ]
+
+
+def load_clip(video_path: str, ground_truth_path: str, max_frames: int = None) -> BenchmarkSequence:
+    """
+    Load a recorded clip with one ``x,y,w,h`` ground truth line per frame
+    """
+    ground_truth = np.loadtxt(ground_truth_path, delimiter=",", ndmin=2)
+    capture = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < len(ground_truth) and (max_frames is None or len(frames) < max_frames):
+        grabbed, frame = capture.read()
+        if not grabbed:
+            break
+        frames.append(frame)
+    capture.release()
+
+    return BenchmarkSequence(os.path.basename(video_path), frames, ground_truth[:len(frames)])
+
+
+def make_stand_in_models(directory: str, channels=16, batch_size: int = None):
+    """
+    Write tiny random backbone and rpn head models with the input and output layout of the real ones.
+    Needs the ``onnx`` package.
+
+    :param directory: Directory to write the models to
+    :param channels: Embedding channels
+    :param batch_size: Fixed batch size of the models, any batch size if not set
+
+    :return: Paths of the backbone and the head
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    n = "N" if batch_size is None else batch_size
+
+    # Backbone: one stride 8 convolution, 127 -> 16 and 287 -> 36
+    weights = numpy_helper.from_array(rng.normal(0, 5e-4, (channels, 3, 7, 7)).astype(np.float32), "w")
+    bias = numpy_helper.from_array(np.zeros(channels, np.float32), "b")
+    graph = helper.make_graph(
+        [helper.make_node("Conv", ["data", "w", "b"], ["c"], kernel_shape=[7, 7], strides=[8, 8]),
+         helper.make_node("Relu", ["c"], ["feat"])], "backbone",
+        [helper.make_tensor_value_info("data", TensorProto.FLOAT, [n, 3, "H", "W"])],
+        [helper.make_tensor_value_info("feat", TensorProto.FLOAT, [n, channels, "h", "w"])],
+        [weights, bias])
+    backbone = os.path.join(directory, "backbone.onnx")
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), backbone)
+
+    # Head: pooled template times the central 21x21 of the search features, 1x1 convolutions to scores and boxes
+    initializers = [
+        numpy_helper.from_array(rng.normal(0, 2, (10, channels, 1, 1)).astype(np.float32), "ws"),
+        numpy_helper.from_array(rng.normal(0, 0.5, (20, channels, 1, 1)).astype(np.float32), "wl"),
+        numpy_helper.from_array(np.array([7, 7], np.int64), "starts"),
+        numpy_helper.from_array(np.array([28, 28], np.int64), "ends"),
+        numpy_helper.from_array(np.array([2, 3], np.int64), "axes"),
+    ]
+    graph = helper.make_graph(
+        [helper.make_node("GlobalAveragePool", ["data0"], ["z"]),
+         helper.make_node("Slice", ["data1", "starts", "ends", "axes"], ["xs"]),
+         helper.make_node("Mul", ["xs", "z"], ["m"]),
+         helper.make_node("Conv", ["m", "ws"], ["conv3_fwd"]),
+         helper.make_node("Conv", ["m", "wl"], ["conv7_fwd"])], "rpn",
+        [helper.make_tensor_value_info("data0", TensorProto.FLOAT, [n, channels, 16, 16]),
+         helper.make_tensor_value_info("data1", TensorProto.FLOAT, [n, channels, 36, 36])],
+        [helper.make_tensor_value_info("conv3_fwd", TensorProto.FLOAT, [n, 10, 21, 21]),
+         helper.make_tensor_value_info("conv7_fwd", TensorProto.FLOAT, [n, 20, 21, 21])],
+        initializers)
+    rpn_head = os.path.join(directory, "rpn.onnx")
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), rpn_head)
+
+    return backbone, rpn_head
+
+
+def _rss_mib():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return 0.0
+
+
+def _iou(boxes, ground_truth):
+    x0 = np.maximum(boxes[:, 0], ground_truth[:, 0])
+    y0 = np.maximum(boxes[:, 1], ground_truth[:, 1])
+    x1 = np.minimum(boxes[:, 0] + boxes[:, 2], ground_truth[:, 0] + ground_truth[:, 2])
+    y1 = np.minimum(boxes[:, 1] + boxes[:, 3], ground_truth[:, 1] + ground_truth[:, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    union = boxes[:, 2] * boxes[:, 3] + ground_truth[:, 2] * ground_truth[:, 3] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def success_auc(boxes, ground_truth):
+    """
+    Area under the success plot, the share of frames with IoU over thresholds from 0 to 1
+    """
+    iou = _iou(boxes, ground_truth)
+    return float(np.mean([np.mean(iou > t) for t in np.linspace(0, 1, 21)]))
+
+
+def precision(boxes, ground_truth, thresholds: Sequence[float]):
+    """
+    Share of frames with the center error within each threshold, px
+    """
+    error = np.hypot(boxes[:, 0] + boxes[:, 2] / 2 - ground_truth[:, 0] - ground_truth[:, 2] / 2,
+                     boxes[:, 1] + boxes[:, 3] / 2 - ground_truth[:, 1] - ground_truth[:, 3] / 2)
+    return np.array([np.mean(error <= t) for t in thresholds])
+
+
+def reacquisition_rate(lost, boxes, ground_truth, min_iou=0.3):
+    """
+    Share of the lost episodes that ended with the target reacquired, the box of the first frame
+    after an episode overlapping the ground truth by min_iou. Episodes still open at the end of
+    the sequence count as failed.
+
+    :param lost: Lost state per frame
+    :return: Number of episodes and the reacquisition rate, nan without episodes
+    """
+    lost = np.asarray(lost, dtype=bool)
+    starts = np.flatnonzero(lost & ~np.concatenate(([False], lost[:-1])))
+    ends = np.flatnonzero(~lost & np.concatenate(([False], lost[:-1])))
+    if len(starts) == 0:
+        return 0, float("nan")
+
+    iou = _iou(boxes[ends], ground_truth[ends])
+    return len(starts), float(np.sum(iou >= min_iou) / len(starts))
+
+
+class _StageTimer:
+    # Tracker.stage_hook summing the time of each search_obj stage
+    def __init__(self):
+        self.times = dict.fromkeys(("crop", "backbone", "head", "post-process"), 0.0)
+        self._last = 0.0
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def __call__(self, stage):
+        now = time.perf_counter()
+        self.times[stage] += now - self._last
+        self._last = now
+
+
+def run_sequence(sequence: BenchmarkSequence, backbone: str, rpn_head: str,
+                 session_config: SessionConfig = None) -> BenchmarkResult:
+    """
+    Track a sequence twice: stage by stage with a Tracker for the stage timings, and end to end
+    through TargetManager for FPS, accuracy and memory
+    """
+    frames, ground_truth = sequence.frames, sequence.ground_truth
+    first_roi = tuple(int(v) for v in ground_truth[0])
+
+    tracker = Tracker(backbone, rpn_head, session_config)
+    tracker.select_obj(frames[0], first_roi)
+    timer = _StageTimer()
+    tracker.stage_hook = timer
+    for i in range(1, len(frames)):
+        frame = frames[i]
+        timer.start()
+        tracker.search_obj(frame)
+    stage_ms = {stage: t / (len(frames) - 1) * 1e3 for stage, t in timer.times.items()}
+
+    target_manager = TargetManager(session_config, backbone=backbone, rpn_head=rpn_head)
+    target_manager.init_tracker(frames[0], first_roi)
+
+    # Frame loading stays out of the time and allocation figures
+    boxes = [ground_truth[0]]
+    lost = [False]
+    elapsed = 0.0
+    peak = 0
+    tracemalloc.start()
+    for i in range(1, len(frames)):
+        frame = frames[i]
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        tic = time.perf_counter()
+        boxes.append(target_manager.update_tracker(frame)[1])
+        elapsed += time.perf_counter() - tic
+        lost.append(target_manager.is_target_lost)
+
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    boxes = np.array(boxes, dtype=np.float64)
+    thresholds = np.arange(0, 51)
+    precisions = precision(boxes, ground_truth, thresholds)
+    lost_episodes, reacquired = reacquisition_rate(lost, boxes, ground_truth)
+
+    return BenchmarkResult(
+        name=sequence.name,
+        fps=(len(frames) - 1) / elapsed,
+        stage_ms=stage_ms,
+        success_auc=success_auc(boxes, ground_truth),
+        precision_20px=float(precisions[20]),
+        precision_auc=float(np.mean(precisions)),
+        peak_alloc_mib=peak / 2 ** 20,
+        rss_mib=_rss_mib(),
+        lost_episodes=lost_episodes,
+        reacquisition_rate=reacquired,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default=DEFAULT_BACKBONE)
+    parser.add_argument("--rpn-head", type=str, default=DEFAULT_RPN_HEAD)
+    parser.add_argument("--clip", type=str, nargs=2, action="append", default=[],
+                        metavar=("VIDEO", "GROUND_TRUTH"), help="Recorded clip with ground truth")
+    parser.add_argument("--frames", type=int, default=150, help="Frames per sequence")
+    args = parser.parse_args()
+
+    backbone, rpn_head = args.backbone, args.rpn_head
+    stand_in_dir = None
+    if not (os.path.exists(backbone) and os.path.exists(rpn_head)):
+        stand_in_dir = tempfile.mkdtemp()
+        try:
+            backbone, rpn_head = make_stand_in_models(stand_in_dir)
+        except ImportError:
+            os.rmdir(stand_in_dir)
+            parser.error("tracker weights not found, the stand-in models need the onnx package")
+        print("[WARNING] Tracker weights not found, using random stand-in models, accuracy is meaningless")
+
+    sequences = synthetic_sequences(args.frames) + [load_clip(video, gt, args.frames) for video, gt in args.clip]
+    # No optimised model cache for the generated models
+    session_config = SessionConfig(cache_dir=None) if stand_in_dir else None
+
+    stages = ("crop", "backbone", "head", "post-process")
+    print(f"{'sequence':<12} {'FPS':>7} " + " ".join(f"{s + ' ms':>15}" for s in stages) +
+          f" {'success AUC':>12} {'prec@20':>8} {'prec AUC':>9} {'peak MiB':>9} {'RSS MiB':>8} {'lost':>5} {'reacq':>6}")
+    for sequence in sequences:
+        r = run_sequence(sequence, backbone, rpn_head, session_config)
+        print(f"{r.name:<12} {r.fps:>7.1f} " + " ".join(f"{r.stage_ms[s]:>15.3f}" for s in stages) +
+              f" {r.success_auc:>12.3f} {r.precision_20px:>8.3f} {r.precision_auc:>9.3f} "
+              f"{r.peak_alloc_mib:>9.2f} {r.rss_mib:>8.1f} {r.lost_episodes:>5} {r.reacquisition_rate:>6.2f}")
+
+    if stand_in_dir:
+        for name in os.listdir(stand_in_dir):
+            os.remove(os.path.join(stand_in_dir, name))
+        os.rmdir(stand_in_dir)
@@ -0,0 +1,189 @@
+import numpy as np
+
+from .session_factory import SessionConfig
+from .tracker import Tracker
+
+
+class MultiTargetManager:
+    def __init__(self, backbone="resources/models/tracker/backbone.onnx",
+                 rpn_head="resources/models/tracker/rpn.onnx",
+                 session_config: SessionConfig = None, max_targets=16):
+        """
+        Tracks several targets with one backbone and one head call per frame. Search crops of all
+        targets are written into one batch buffer, templates and per-target state are kept in arrays
+        with the active targets packed at the front.
+
+        Models with a fixed batch size of one are run target by target.
+
+        :param backbone: Path to the backbone model
+        :param rpn_head: Path to the rpn head model
+        :param session_config: Session configuration of both models
+        :param max_targets: Number of targets the buffers are allocated for
+        """
+        # Sessions, anchors, crop and post-processing are shared, the tracker state is swapped per target
+        self._tracker = Tracker(backbone, rpn_head, session_config, use_io_binding=False)
+        self._max_targets = max_targets
+
+        if not self._tracker.is_batched:
+            print("[WARNING] Tracker models have a fixed batch size of 1, targets are run one by one")
+
+        search_size = self._tracker.search_size
+        self._x_crops = np.zeros((max_targets, 3, search_size, search_size), np.float32)
+        self._templates = None
+
+        self._centers = np.zeros((max_targets, 2))
+        self._sizes = np.zeros((max_targets, 2))
+        self._channel_averages = np.zeros((max_targets, 3))
+        self._scores = np.zeros(max_targets)
+        self._rois = np.zeros((max_targets, 4), np.int64)
+        self._scale_z = np.zeros(max_targets)
+
+        self._target_ids = []  # Target id of each slot
+        self._next_target_id = 0
+
+    @property
+    def target_ids(self):
+        return tuple(self._target_ids)
+
+    @property
+    def max_targets(self):
+        return self._max_targets
+
+    def __len__(self):
+        return len(self._target_ids)
+
+    def _slot(self, target_id):
+        return self._target_ids.index(target_id)
+
+    def score(self, target_id) -> float:
+        return float(self._scores[self._slot(target_id)])
+
+    def roi(self, target_id) -> list:
+        return self._rois[self._slot(target_id)].tolist()
+
+    def add_target(self, image, roi) -> int:
+        """
+        Start tracking a target
+
+        :param image: BGR frame
+        :param roi: Target bbox (x, y, w, h)
+        :return: Target id
+        """
+        n = len(self._target_ids)
+        assert n < self._max_targets, "Too many targets"
+
+        tracker = self._tracker
+        tracker.select_obj(image, roi)
+        z = tracker._z[0]
+        if self._templates is None:
+            self._templates = np.zeros((self._max_targets,) + z.shape[1:], np.float32)
+
+        self._templates[n] = z[0]
+        self._centers[n] = tracker.center_bbox
+        self._sizes[n] = tracker.size
+        self._channel_averages[n] = tracker.channel_average
+        self._scores[n] = 1.0
+        self._rois[n] = roi
+
+        target_id = self._next_target_id
+        self._next_target_id += 1
+        self._target_ids.append(target_id)
+        return target_id
+
+    def remove_target(self, target_id):
+        """
+        Stop tracking a target, the last target moves into its slot
+        """
+        slot = self._slot(target_id)
+        last = len(self._target_ids) - 1
+        if slot != last:
+            for array in (self._templates, self._centers, self._sizes, self._channel_averages,
+                          self._scores, self._rois):
+                array[slot] = array[last]
+            self._target_ids[slot] = self._target_ids[last]
+        self._target_ids.pop()
+
+    def reset(self):
+        self._target_ids.clear()
+
+    def update(self, image) -> dict:
+        """
+        Track all targets on a new frame
+
+        :param image: BGR frame
+        :return: (score, roi) by target id
+        """
+        n = len(self._target_ids)
+        if n == 0:
+            return {}
+
+        tracker = self._tracker
+        for i in range(n):
+            tracker.size = self._sizes[i]
+            self._scale_z[i], s_x = tracker.search_scale()
+            tracker.get_subwindow(image, self._centers[i], tracker.search_size, round(s_x),
+                                  self._channel_averages[i], out=self._x_crops[i:i + 1])
+
+        score, loc = tracker.run_head_batched(self._templates[:n], tracker.run_backbone_batched(self._x_crops[:n]))
+
+        results = {}
+        for i in range(n):
+            tracker.center_bbox = self._centers[i]
+            tracker.size = self._sizes[i]
+            best_score, roi = tracker.update_state(score[i:i + 1], loc[i:i + 1], self._scale_z[i], image.shape[:2])
+
+            self._centers[i] = tracker.center_bbox
+            self._sizes[i] = tracker.size
+            self._scores[i] = best_score
+            self._rois[i] = roi
+            results[self._target_ids[i]] = best_score, roi
+
+        return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default="resources/models/tracker/backbone.onnx")
+    parser.add_argument("--rpn-head", type=str, default="resources/models/tracker/rpn.onnx")
+    parser.add_argument("--frames", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frame = (rng.random((720, 1280, 3)) * 255).astype(np.uint8)
+
+    def random_rois(n):
+        return [(int(rng.integers(100, 1100)), int(rng.integers(100, 560)), 60, 40) for _ in range(n)]
+
+    manager = MultiTargetManager(args.backbone, args.rpn_head)
+    trackers = [Tracker(args.backbone, args.rpn_head) for _ in range(16)]
+
+    for n_targets in (1, 4, 16):
+        rois = random_rois(n_targets)
+
+        # Batched and independent trackers follow the same targets
+        manager.reset()
+        target_ids = [manager.add_target(frame, roi) for roi in rois]
+        for tracker, roi in zip(trackers, rois):
+            tracker.select_obj(frame, roi)
+        results = manager.update(frame)
+        for target_id, tracker in zip(target_ids, trackers):
+            score, roi = tracker.search_obj(frame)
+            assert np.allclose(results[target_id][0], score, atol=1e-4), (results[target_id][0], score)
+
+        tic = perf_counter()
+        for _ in range(args.frames):
+            manager.update(frame)
+        batched = (perf_counter() - tic) / args.frames
+
+        tic = perf_counter()
+        for _ in range(args.frames):
+            for tracker in trackers[:n_targets]:
+                tracker.search_obj(frame)
+        independent = (perf_counter() - tic) / args.frames
+
+        print(f"{n_targets:>2} targets: batched {batched * 1e3:6.2f} ms/frame "
+              f"({n_targets / batched:6.0f} targets/s), independent {independent * 1e3:6.2f} ms/frame "
+              f"({n_targets / independent:6.0f} targets/s)")
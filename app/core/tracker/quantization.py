@@ -0,0 +1,211 @@
+"""
+Reduced precision variants of the tracker models.
+
+Building the variants needs the ``onnx`` package next to ONNX Runtime, it is imported only by the
+functions that build them. INT8 models are statically quantised, calibrated on template and search
+crops recorded from a clip with the float tracker.
+
+    python -m app.core.tracker.quantization record clip.mp4 x y w h crops.npz
+    python -m app.core.tracker.quantization build crops.npz
+    python -m app.core.tracker.quantization report
+"""
+import os
+from typing import Sequence
+
+import cv2
+import numpy as np
+
+from .benchmark import DEFAULT_BACKBONE, DEFAULT_RPN_HEAD, synthetic_sequence
+from .session_factory import MODEL_VARIANTS, SessionConfig, model_variant_path
+from .tracker import Tracker
+
+
+def record_calibration_crops(frames, roi, output_path, backbone=DEFAULT_BACKBONE, rpn_head=DEFAULT_RPN_HEAD,
+                             max_crops=200):
+    """
+    Track a target with the float models and save the crops the models see
+
+    :param frames: Iterable of BGR frames
+    :param roi: Target bbox (x, y, w, h) on the first frame
+    :param output_path: .npz file with ``template`` and ``search`` crop arrays
+    :param backbone: Float backbone model
+    :param rpn_head: Float rpn head model
+    :param max_crops: Number of search crops to keep, spread over the clip
+    """
+    tracker = Tracker(backbone, rpn_head, use_io_binding=False)
+    templates, searches = [], []
+
+    for i, frame in enumerate(frames):
+        if i == 0:
+            tracker.select_obj(frame, roi)
+            s_z = round(tracker.template_size / tracker.search_scale()[0])
+            templates.append(tracker.get_subwindow(frame, tracker.center_bbox, tracker.template_size, s_z,
+                                                   tracker.channel_average)[0])
+            continue
+
+        _, s_x = tracker.search_scale()
+        searches.append(tracker.get_subwindow(frame, tracker.center_bbox, tracker.search_size, round(s_x),
+                                              tracker.channel_average)[0])
+        tracker.search_obj(frame)
+
+    step = max(1, len(searches) // max_crops)
+    np.savez_compressed(output_path, template=np.stack(templates), search=np.stack(searches[::step]))
+
+
+def build_fp16_model(model_path: str):
+    """
+    Convert a float model to float16 weights and activations, inputs and outputs stay float32
+    """
+    import onnx
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    model = convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+    output_path = model_variant_path(model_path, "fp16")
+    onnx.save(model, output_path)
+    return output_path
+
+
+def build_int8_models(crops_path: str, backbone=DEFAULT_BACKBONE, rpn_head=DEFAULT_RPN_HEAD):
+    """
+    Statically quantise both models to INT8 with per-channel weights, calibrated on recorded crops.
+    The head is calibrated on the float backbone embeddings of the same crops.
+
+    :param crops_path: .npz file written by record_calibration_crops
+    :param backbone: Float backbone model
+    :param rpn_head: Float rpn head model
+    :return: Paths of the quantised backbone and head
+    """
+    # The quantisation API imports onnx, only needed here
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class FeedReader(CalibrationDataReader):
+        def __init__(self, feeds: Sequence[dict]):
+            self._feeds = iter(feeds)
+
+        def get_next(self):
+            return next(self._feeds, None)
+
+    crops = np.load(crops_path)
+    templates = crops["template"].astype(np.float32)
+    searches = crops["search"].astype(np.float32)
+
+    backbone_feeds = [{"data": crop[np.newaxis]} for crop in list(templates) + list(searches)]
+
+    tracker = Tracker(backbone, rpn_head, SessionConfig(cache_dir=None), use_io_binding=False)
+    z = [tracker.backbone_session.run(None, {"data": t[np.newaxis]})[0] for t in templates]
+    head_feeds = [{"data0": z[i % len(z)], "data1": tracker.backbone_session.run(None, {"data": s[np.newaxis]})[0]}
+                  for i, s in enumerate(searches)]
+
+    outputs = []
+    for model_path, feeds in ((backbone, backbone_feeds), (rpn_head, head_feeds)):
+        output_path = model_variant_path(model_path, "int8")
+        # Unsigned activations and signed weights is the fast combination on x86 CPUs
+        quantize_static(model_path, output_path, FeedReader(feeds),
+                        quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        outputs.append(output_path)
+
+    return outputs
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _iou(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def variant_report(frames, roi, backbone=DEFAULT_BACKBONE, rpn_head=DEFAULT_RPN_HEAD):
+    """
+    Track a sequence with every available variant and compare latency, memory and bbox drift
+    against the float model
+
+    :return: Rows of (variant, ms per frame, MiB, mean IoU, min IoU)
+    """
+    rows = []
+    reference = None
+    for variant in MODEL_VARIANTS:
+        if not all(os.path.exists(model_variant_path(p, variant)) for p in (backbone, rpn_head)):
+            continue
+
+        rss = _rss_bytes()
+        tracker = Tracker(backbone, rpn_head, SessionConfig(cache_dir=None), variant=variant)
+        memory = _rss_bytes() - rss
+
+        tracker.select_obj(frames[0], roi)
+        bboxes = []
+        tic = cv2.getTickCount()
+        for frame in frames[1:]:
+            bboxes.append(tracker.search_obj(frame)[1])
+        latency = (cv2.getTickCount() - tic) / cv2.getTickFrequency() / (len(frames) - 1)
+
+        if reference is None:
+            reference = bboxes
+        ious = [_iou(a, b) for a, b in zip(bboxes, reference)]
+        rows.append((variant, latency * 1e3, memory / 2 ** 20, float(np.mean(ious)), float(np.min(ious))))
+        del tracker
+
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default=DEFAULT_BACKBONE)
+    parser.add_argument("--rpn-head", type=str, default=DEFAULT_RPN_HEAD)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Record calibration crops from a clip")
+    record_parser.add_argument("video", type=str)
+    record_parser.add_argument("roi", type=int, nargs=4, help="Target bbox x y w h on the first frame")
+    record_parser.add_argument("output", type=str, help="Output .npz file")
+
+    build_parser = subparsers.add_parser("build", help="Build the FP16 and INT8 variants")
+    build_parser.add_argument("crops", type=str, help="Calibration crops .npz file")
+
+    report_parser = subparsers.add_parser("report", help="Compare the variants")
+    report_parser.add_argument("--video", type=str, default=None)
+    report_parser.add_argument("--roi", type=int, nargs=4, default=None)
+    report_parser.add_argument("--frames", type=int, default=200)
+
+    args = parser.parse_args()
+
+    def read_video(path, n_frames=None):
+        capture = cv2.VideoCapture(path)
+        while n_frames is None or n_frames > 0:
+            grabbed, frame = capture.read()
+            if not grabbed:
+                break
+            if n_frames is not None:
+                n_frames -= 1
+            yield frame
+        capture.release()
+
+    if args.command == "record":
+        record_calibration_crops(read_video(args.video), args.roi, args.output, args.backbone, args.rpn_head)
+    elif args.command == "build":
+        for path in (args.backbone, args.rpn_head):
+            print(build_fp16_model(path))
+        for path in build_int8_models(args.crops, args.backbone, args.rpn_head):
+            print(path)
+    else:
+        if args.video:
+            frames, roi = list(read_video(args.video, args.frames)), args.roi
+        else:
+            sequence = synthetic_sequence("moving", args.frames)
+            frames = [sequence.frames[i] for i in range(len(sequence.frames))]
+            roi = tuple(int(v) for v in sequence.ground_truth[0])
+
+        print(f"{'variant':<8} {'ms/frame':>9} {'MiB':>7} {'mean IoU':>9} {'min IoU':>8}")
+        for variant, latency, memory, mean_iou, min_iou in variant_report(frames, roi, args.backbone, args.rpn_head):
+            print(f"{variant:<8} {latency:>9.2f} {memory:>7.1f} {mean_iou:>9.3f} {min_iou:>8.3f}")
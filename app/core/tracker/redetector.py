@@ -0,0 +1,218 @@
+import dataclasses
+import time
+from typing import Optional
+
+import numpy as np
+
+from .tracker import Tracker
+
+
+@dataclasses.dataclass
+class RedetectionConfig:
+    lost_score: float = 0.6  # Below it the target is lost and redetection starts
+    reacquire_score: float = 0.8  # Best tile score needed to move the tracker
+    tiles_per_attempt: int = 8  # Tiles evaluated in one batched call
+    max_utilization: float = 0.25  # Share of the wall time redetection may take
+
+
+@dataclasses.dataclass
+class RedetectionStats:
+    attempts: int = 0
+    reacquisitions: int = 0
+    attempt_time: float = 0.0  # Moving average, s
+    is_lost: bool = False
+
+
+class Redetector:
+    def __init__(self, tracker: Tracker, config: RedetectionConfig = None):
+        """
+        Searches the whole frame for a lost target with the stored template embedding.
+
+        The frame is covered by search windows of the current target scale, spaced by the part of
+        the window the score map covers. Each attempt crops the next tiles, nearest to the last
+        position first, into one batch and runs them through the backbone and the head in one call
+        each. Attempts are spaced so that redetection takes at most max_utilization of the time.
+
+        :param tracker: Tracker whose template and target state are used
+        :param config: Redetection settings
+        """
+        self._tracker = tracker
+        self._config = config or RedetectionConfig()
+
+        search_size = tracker.search_size
+        self._x_crops = np.zeros((self._config.tiles_per_attempt, 3, search_size, search_size), np.float32)
+        self._templates = None
+        self._template_source = None
+
+        self._tiles = []
+        self._next_tile = 0
+        self._next_attempt_time = 0.0
+
+        self._stats = RedetectionStats()
+
+    @property
+    def config(self) -> RedetectionConfig:
+        return self._config
+
+    @property
+    def stats(self) -> RedetectionStats:
+        return self._stats
+
+    @property
+    def is_lost(self) -> bool:
+        return self._stats.is_lost
+
+    def reset(self):
+        self._stats.is_lost = False
+        self._tiles = []
+
+    def _plan_tiles(self, frame_shape):
+        tracker = self._tracker
+        scale_z, s_x = tracker.search_scale()
+        # Frame pixels covered by the score map of one window
+        coverage = (tracker.score_size - 1) * tracker.stride / scale_z
+        height, width = frame_shape
+
+        xs = np.arange(coverage / 2, width + coverage / 2, coverage)
+        ys = np.arange(coverage / 2, height + coverage / 2, coverage)
+        centers = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+
+        # Nearest to the last known position first
+        distances = np.linalg.norm(centers - tracker.center_bbox, axis=1)
+        self._tiles = centers[np.argsort(distances)]
+        self._next_tile = 0
+
+    def _batch_templates(self, n):
+        z = self._tracker._z[0]
+        if self._templates is None or self._template_source is not z:
+            self._templates = np.ascontiguousarray(np.repeat(z, self._config.tiles_per_attempt, axis=0))
+            self._template_source = z
+        return self._templates[:n]
+
+    def update(self, image, score, roi):
+        """
+        Follow the tracking score and try to reacquire a lost target
+
+        :param image: BGR frame
+        :param score: Score of the regular search on the frame
+        :param roi: Bbox of the regular search
+        :return: Score and bbox, replaced by the redetected ones on reacquisition
+        """
+        config = self._config
+        stats = self._stats
+
+        if not stats.is_lost:
+            if score >= config.lost_score:
+                return score, roi
+            stats.is_lost = True
+            self._plan_tiles(image.shape[:2])
+        elif score >= config.reacquire_score:
+            # The regular search found the target again
+            stats.is_lost = False
+            return score, roi
+
+        now = time.monotonic()
+        if now < self._next_attempt_time:
+            return score, roi
+
+        tic = time.perf_counter()
+        result = self._attempt(image)
+        attempt_time = time.perf_counter() - tic
+
+        stats.attempts += 1
+        stats.attempt_time = attempt_time if stats.attempts == 1 else \
+            stats.attempt_time + (attempt_time - stats.attempt_time) * 0.1
+        self._next_attempt_time = now + attempt_time / config.max_utilization
+
+        if result is None:
+            return score, roi
+
+        stats.reacquisitions += 1
+        stats.is_lost = False
+        return result
+
+    def _attempt(self, image):
+        config = self._config
+        tracker = self._tracker
+
+        if self._next_tile >= len(self._tiles):
+            self._plan_tiles(image.shape[:2])
+        tiles = self._tiles[self._next_tile:self._next_tile + config.tiles_per_attempt]
+        self._next_tile += len(tiles)
+        n = len(tiles)
+
+        scale_z, s_x = tracker.search_scale()
+        for i, center in enumerate(tiles):
+            tracker.get_subwindow(image, center, tracker.search_size, round(s_x), tracker.channel_average,
+                                  out=self._x_crops[i:i + 1])
+
+        templates = self._batch_templates(n)
+        score, loc = tracker.run_head_batched(templates, tracker.run_backbone_batched(self._x_crops[:n]))
+
+        # Object probability of every anchor of every tile, as in RpnPostprocess.score
+        logits = score.reshape((n, 2, -1))
+        probability = 0.5 * (1 + np.tanh(0.5 * (logits[:, 1] - logits[:, 0])))
+        tile, best = np.unravel_index(np.argmax(probability), probability.shape)
+        best_score = float(probability[tile, best])
+        if best_score < config.reacquire_score:
+            return None
+
+        # Move the tracker to the detection, the size is kept
+        anchor = tracker.anchor[best]
+        delta = loc[tile].reshape((4, -1))[:, best]
+        offset = np.array([delta[0] * anchor[2] + anchor[0], delta[1] * anchor[3] + anchor[1]]) / scale_z
+        center_x, center_y, width, height = tracker._bbox_clip(
+            *(tiles[tile] + offset), tracker.size[0], tracker.size[1], image.shape[:2])
+        tracker.center_bbox = np.array([center_x, center_y])
+
+        return best_score, [int(center_x - width / 2), int(center_y - height / 2), int(width), int(height)]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default="resources/models/tracker/backbone.onnx")
+    parser.add_argument("--rpn-head", type=str, default="resources/models/tracker/rpn.onnx")
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--max-attempts", type=int, default=20)
+    args = parser.parse_args()
+
+    # A textured target on a smooth background jumps to a random place, the redetector runs
+    # attempts until it reacquires the target or gives up
+    rng = np.random.default_rng(0)
+    background = (rng.random((720, 1280, 3)) * 255).astype(np.uint8)
+    background = np.clip(background.astype(np.float32) * 0.3 + 90, 0, 255).astype(np.uint8)
+    target = (rng.random((48, 64, 3)) * 255).astype(np.uint8)
+
+    def frame_with_target(x, y):
+        frame = background.copy()
+        frame[y:y + target.shape[0], x:x + target.shape[1]] = target
+        return frame
+
+    tracker = Tracker(args.backbone, args.rpn_head)
+    config = RedetectionConfig(max_utilization=1.0)
+    redetector = Redetector(tracker, config)
+
+    successes = 0
+    attempts_to_reacquire = []
+    for _ in range(args.trials):
+        x0, y0 = int(rng.integers(0, 1200)), int(rng.integers(0, 660))
+        tracker.select_obj(frame_with_target(x0, y0), (x0, y0, target.shape[1], target.shape[0]))
+        redetector.reset()
+
+        x1, y1 = int(rng.integers(0, 1200)), int(rng.integers(0, 660))
+        frame = frame_with_target(x1, y1)
+        for attempt in range(1, args.max_attempts + 1):
+            score, roi = redetector.update(frame, 0.0, None)
+            if not redetector.is_lost:
+                error = np.hypot(roi[0] + roi[2] / 2 - (x1 + 32), roi[1] + roi[3] / 2 - (y1 + 24))
+                if error < target.shape[1]:
+                    successes += 1
+                    attempts_to_reacquire.append(attempt)
+                break
+
+    stats = redetector.stats
+    print(f"Reacquired {successes}/{args.trials}, "
+          f"mean {np.mean(attempts_to_reacquire) if attempts_to_reacquire else float('nan'):.1f} attempts, "
+          f"{stats.attempt_time * 1e3:.1f} ms per attempt of {config.tiles_per_attempt} tiles")
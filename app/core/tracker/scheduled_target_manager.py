@@ -0,0 +1,287 @@
+import dataclasses
+import time
+
+import numpy as np
+
+from .target_manager import TargetManager
+
+
+@dataclasses.dataclass
+class SchedulerConfig:
+    target_utilization: float = 0.5  # Share of the frame interval inference may take on average
+    min_score: float = 0.8  # Below it every frame is inferred
+    max_position_std: float = 0.15  # Predicted position std, in target sizes, that forces an inference
+    max_skipped_frames: int = 10
+    process_noise: float = 200.0  # Acceleration noise, px/s^2
+    measurement_noise: float = 3.0  # Tracker position noise, px
+
+
+@dataclasses.dataclass
+class SchedulerStats:
+    frames: int = 0
+    inferences: int = 0
+    forced_inferences: int = 0
+    inference_time: float = 0.0  # Moving average, s
+    utilization: float = 0.0  # Moving average of inference time over frame interval
+
+    @property
+    def inference_rate(self):
+        return self.inferences / self.frames if self.frames else 0.0
+
+
+class ConstantVelocityFilter:
+    def __init__(self, process_noise, measurement_noise):
+        """
+        Kalman filter of the target center with a constant velocity model, state (x, y, vx, vy)
+
+        :param process_noise: Acceleration noise, px/s^2
+        :param measurement_noise: Position measurement noise, px
+        """
+        self._q = process_noise ** 2
+        self._r = np.eye(2) * measurement_noise ** 2
+        self._h = np.eye(2, 4)
+
+        self.x = np.zeros(4)
+        self.p = np.eye(4)
+
+    def reset(self, center):
+        self.x[:] = center[0], center[1], 0, 0
+        self.p = np.diag([self._r[0, 0], self._r[1, 1], 1e4, 1e4])
+
+    def predict(self, dt):
+        f = np.eye(4)
+        f[0, 2] = f[1, 3] = dt
+        # Discrete white noise acceleration
+        q = self._q * np.array([[dt ** 4 / 4, 0, dt ** 3 / 2, 0],
+                                [0, dt ** 4 / 4, 0, dt ** 3 / 2],
+                                [dt ** 3 / 2, 0, dt ** 2, 0],
+                                [0, dt ** 3 / 2, 0, dt ** 2]])
+        self.x = f @ self.x
+        self.p = f @ self.p @ f.T + q
+
+    def update(self, center):
+        y = np.asarray(center, dtype=np.float64) - self._h @ self.x
+        s = self._h @ self.p @ self._h.T + self._r
+        k = self.p @ self._h.T @ np.linalg.inv(s)
+        self.x = self.x + k @ y
+        self.p = (np.eye(4) - k @ self._h) @ self.p
+
+    @property
+    def position_std(self) -> float:
+        return float(np.sqrt(max(self.p[0, 0], self.p[1, 1])))
+
+
+class ScheduledTargetManager:
+    def __init__(self, target_manager: TargetManager, config: SchedulerConfig = None):
+        """
+        Runs the tracker only on the frames that need it and forecasts the bbox on the others.
+
+        A frame is inferred when the last score is low, the predicted position is too uncertain,
+        too many frames were skipped in a row, or the inference time budget allows it. The budget
+        accumulates the frame interval times the target utilisation and is spent by inference time,
+        so on average inference takes at most that share of the frame interval, forced inferences
+        aside.
+
+        Has the TargetManager interface, so it can be used in its place.
+
+        :param target_manager: Target manager to schedule
+        :param config: Scheduling policy
+        """
+        self._target_manager = target_manager
+        self._config = config or SchedulerConfig()
+
+        self._filter = ConstantVelocityFilter(self._config.process_noise, self._config.measurement_noise)
+        self._size = np.zeros(2)
+        self._score = 0.0
+
+        self._budget = 0.0
+        self._last_timestamp = None
+        self._skipped_frames = 0
+        self._is_last_inferred = False
+
+        self._stats = SchedulerStats()
+
+    @property
+    def config(self) -> SchedulerConfig:
+        return self._config
+
+    @property
+    def stats(self) -> SchedulerStats:
+        return self._stats
+
+    @property
+    def is_last_inferred(self) -> bool:
+        return self._is_last_inferred
+
+    @property
+    def is_tracker_initialized(self):
+        return self._target_manager.is_tracker_initialized
+
+    @property
+    def is_target_lost(self):
+        # State of the last inference, forecasts keep it
+        return self._target_manager.is_target_lost
+
+    @property
+    def target_location(self):
+        return self._target_manager.target_location
+
+    def reset_tracker(self):
+        self._target_manager.reset_tracker()
+
+    def init_tracker(self, image, roi):
+        self._target_manager.init_tracker(image, roi)
+
+        self._filter.reset((roi[0] + roi[2] / 2, roi[1] + roi[3] / 2))
+        self._size[:] = roi[2], roi[3]
+        self._score = 1.0
+        self._budget = 0.0
+        self._last_timestamp = None
+        self._skipped_frames = 0
+
+    def _must_infer(self):
+        config = self._config
+        return self._score < config.min_score or \
+            self._skipped_frames >= config.max_skipped_frames or \
+            self._filter.position_std > config.max_position_std * min(self._size)
+
+    def update_tracker(self, image, timestamp: float = None):
+        """
+        :param image: BGR frame
+        :param timestamp: Capture time of the frame, time.monotonic() if not set
+        :return: Score of the last inference and the measured or predicted bbox
+        """
+        config = self._config
+        stats = self._stats
+        timestamp = time.monotonic() if timestamp is None else timestamp
+
+        dt = 0.0 if self._last_timestamp is None else max(timestamp - self._last_timestamp, 0.0)
+        self._last_timestamp = timestamp
+        self._filter.predict(dt)
+
+        # Unused budget is capped at two inferences so that idle time can not be saved up
+        self._budget = min(self._budget + dt * config.target_utilization, 2 * stats.inference_time)
+
+        must_infer = self._must_infer()
+        infer = must_infer or self._budget >= stats.inference_time
+
+        stats.frames += 1
+        self._is_last_inferred = infer
+        if infer:
+            # Skipped frames only advanced the forecast, the search starts from the predicted center.
+            # The forecast holds the size, which the tracker already has at full precision.
+            self._target_manager.seed_target(self._filter.x[:2])
+            tic = time.perf_counter()
+            self._score, roi = self._target_manager.update_tracker(image, timestamp)
+            inference_time = time.perf_counter() - tic
+
+            stats.inferences += 1
+            stats.forced_inferences += must_infer
+            stats.inference_time = inference_time if stats.inferences == 1 else \
+                stats.inference_time + (inference_time - stats.inference_time) * 0.1
+            # Forced inferences may overdraw the budget by at most one inference
+            self._budget = max(self._budget - inference_time, -stats.inference_time)
+            if dt > 0:
+                stats.utilization += (inference_time / dt - stats.utilization) * 0.1
+
+            self._filter.update((roi[0] + roi[2] / 2, roi[1] + roi[3] / 2))
+            self._size[:] = roi[2], roi[3]
+            self._skipped_frames = 0
+        else:
+            self._skipped_frames += 1
+            if dt > 0:
+                stats.utilization -= stats.utilization * 0.1
+
+        center_x, center_y = self._filter.x[:2]
+        width, height = self._size
+        return self._score, [int(center_x - width / 2), int(center_y - height / 2), int(width), int(height)]
+
+
+if __name__ == "__main__":
+    # Synthetic sequence: a target drifting with random accelerations, with a hard stretch where
+    # the tracker confidence drops, frames come at 30 FPS. The tracker stand-in takes 10 ms per
+    # inference and only finds the target inside its search window around the center it starts
+    # from, as the Tracker does, so a search started from a stale center loses the target.
+    def iou(a, b):
+        x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+        x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+        inter = max(0, x1 - x0) * max(0, y1 - y0)
+        return inter / (a[2] * a[3] + b[2] * b[3] - inter)
+
+    rng = np.random.default_rng(0)
+    n_frames, fps = 900, 30
+    position = np.array([640.0, 360.0])
+    velocity = np.array([60.0, -20.0])
+    ground_truth = []
+    for i in range(n_frames):
+        velocity += rng.normal(0, 150, 2) / fps
+        velocity = np.clip(velocity, -250, 250)
+        position = np.clip(position + velocity / fps, 100, [1180, 620])
+        ground_truth.append([position[0] - 30, position[1] - 20, 60, 40])
+
+    class WindowedTargetManager:
+        # Search window side over the context-padded target size, as in Tracker.search_scale
+        search_ratio = 287 / 127
+
+        def __init__(self):
+            self.is_tracker_initialized = False
+            self.target_location = None
+            self.frame = 0
+            self.center = np.zeros(2)
+            self.size = np.zeros(2)
+            self.lost_frames = 0
+            self.is_target_lost = False
+
+        def init_tracker(self, image, roi):
+            self.is_tracker_initialized = True
+            self.center = np.array([roi[0] + roi[2] / 2, roi[1] + roi[3] / 2])
+            self.size = np.array(roi[2:], dtype=np.float64)
+
+        def reset_tracker(self):
+            self.is_tracker_initialized = False
+
+        def seed_target(self, center, size=None):
+            self.center = np.array(center, dtype=np.float64)
+            if size is not None:
+                self.size = np.array(size, dtype=np.float64)
+
+        def update_tracker(self, image, timestamp=None):
+            time.sleep(0.01)
+            gt = ground_truth[self.frame]
+            gt_center = np.array([gt[0] + gt[2] / 2, gt[1] + gt[3] / 2])
+            pad = np.sum(self.size) / 2
+            half_window = np.sqrt(np.prod(self.size + pad)) * self.search_ratio / 2
+            if np.all(np.abs(gt_center - self.center) < half_window - self.size / 2):
+                self.center = gt_center + rng.normal(0, 2, 2)
+                score = 0.5 if 400 <= self.frame < 450 else 0.95
+                self.is_target_lost = False
+            else:
+                # Target outside the window, the search settles on background near its center
+                self.center = self.center + rng.normal(0, 2, 2)
+                score = 0.2
+                self.lost_frames += 1
+                self.is_target_lost = True
+            width, height = self.size
+            return score, [int(self.center[0] - width / 2), int(self.center[1] - height / 2),
+                           int(width), int(height)]
+
+    print(f"{'policy':<22} {'inference rate':>14} {'forced':>7} {'utilization':>11} {'mean IoU':>9} "
+          f"{'min IoU':>8} {'lost':>5}")
+    for name, config in [("every frame", SchedulerConfig(target_utilization=1e3, max_skipped_frames=0)),
+                         ("utilization 0.3", SchedulerConfig(target_utilization=0.3)),
+                         ("utilization 0.15", SchedulerConfig(target_utilization=0.15)),
+                         ("utilization 0.05", SchedulerConfig(target_utilization=0.05)),
+                         ("utilization 0", SchedulerConfig(target_utilization=0))]:
+        tracker = WindowedTargetManager()
+        manager = ScheduledTargetManager(tracker, config)
+        manager.init_tracker(None, ground_truth[0])
+
+        ious = []
+        for i in range(1, n_frames):
+            tracker.frame = i
+            _, roi = manager.update_tracker(None, timestamp=i / fps)
+            ious.append(iou(roi, ground_truth[i]))
+
+        stats = manager.stats
+        print(f"{name:<22} {stats.inference_rate:>14.2f} {stats.forced_inferences:>7} "
+              f"{stats.utilization:>11.2f} {np.mean(ious):>9.3f} {np.min(ious):>8.3f} {tracker.lost_frames:>5}")
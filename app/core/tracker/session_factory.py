@@ -0,0 +1,152 @@
+import dataclasses
+import hashlib
+import os
+from typing import Optional, Sequence
+
+import onnxruntime as ort
+
+
+@dataclasses.dataclass
+class SessionConfig:
+    providers: Sequence[str] = ("CPUExecutionProvider",)
+    intra_op_num_threads: int = 0  # 0 lets ONNX Runtime pick
+    inter_op_num_threads: int = 0
+    execution_mode: str = "sequential"  # sequential, parallel
+    graph_optimization_level: str = "all"  # disable, basic, extended, all
+    cache_dir: Optional[str] = "resources/models/tracker/cache"  # None disables the optimised model cache
+
+
+_EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+MODEL_VARIANTS = ("fp32", "fp16", "int8")
+
+
+def model_variant_path(model_path: str, variant: str = "fp32") -> str:
+    """
+    Path of a model variant, ``backbone.onnx`` becomes ``backbone.int8.onnx`` and so on.
+    The float32 variant is the model itself.
+    """
+    assert variant in MODEL_VARIANTS, f"Unknown model variant {variant}"
+    if variant == "fp32":
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
+
+def available_providers(config: SessionConfig):
+    """
+    Requested providers that this ONNX Runtime build supports, in order, with the CPU provider as the
+    last fallback
+    """
+    available = ort.get_available_providers()
+    providers = [p for p in config.providers if p in available]
+    if "CPUExecutionProvider" not in providers:
+        providers.append("CPUExecutionProvider")
+    return providers
+
+
+def _cached_model_path(model_path: str, config: SessionConfig, providers) -> str:
+    # Optimised graphs are specific to the model file, the runtime version and the providers
+    stat = os.stat(model_path)
+    key = "|".join([os.path.abspath(model_path), str(stat.st_mtime_ns), str(stat.st_size), ort.__version__,
+                    ",".join(providers), config.graph_optimization_level])
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(config.cache_dir, f"{name}.{digest}.opt.onnx")
+
+
+def create_session(model_path: str, config: SessionConfig = None) -> ort.InferenceSession:
+    """
+    Create an inference session for a model.
+
+    With a cache directory set, the first session saves its optimised graph there and later sessions
+    load it with graph optimisation turned off, so startups skip the optimisation passes.
+
+    :param model_path: Path to the ONNX model
+    :param config: Session configuration, CPU-only defaults if not set
+    """
+    config = config or SessionConfig()
+    providers = available_providers(config)
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = config.intra_op_num_threads
+    options.inter_op_num_threads = config.inter_op_num_threads
+    options.execution_mode = _EXECUTION_MODES[config.execution_mode]
+    options.graph_optimization_level = _OPTIMIZATION_LEVELS[config.graph_optimization_level]
+
+    if config.cache_dir and config.graph_optimization_level != "disable":
+        cached_path = _cached_model_path(model_path, config, providers)
+
+        if os.path.exists(cached_path):
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            return ort.InferenceSession(cached_path, sess_options=options, providers=providers)
+
+        os.makedirs(config.cache_dir, exist_ok=True)
+        options.optimized_model_filepath = cached_path
+
+    return ort.InferenceSession(model_path, sess_options=options, providers=providers)
+
+
+if __name__ == "__main__":
+    import argparse
+    import shutil
+    import tempfile
+    import time
+
+    import numpy as np
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", help="ONNX model", type=str, default="resources/models/tracker/backbone.onnx")
+    parser.add_argument("--runs", help="Inference runs per setting", type=int, default=100)
+    parser.add_argument("--input-size", help="Size of symbolic spatial input dimensions", type=int, default=287)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp()
+
+    def measure(config: SessionConfig):
+        tic = time.perf_counter()
+        session = create_session(args.model, config)
+        startup = time.perf_counter() - tic
+
+        def input_shape(shape):
+            return [d if isinstance(d, int) else (args.input_size if axis >= 2 else 1)
+                    for axis, d in enumerate(shape)]
+
+        feed = {i.name: np.random.rand(*input_shape(i.shape)).astype(np.float32) for i in session.get_inputs()}
+        session.run(None, feed)
+
+        tic = time.perf_counter()
+        for _ in range(args.runs):
+            session.run(None, feed)
+        return startup, (time.perf_counter() - tic) / args.runs
+
+    settings = [
+        ("no cache, all", SessionConfig(cache_dir=None)),
+        ("no cache, disable", SessionConfig(cache_dir=None, graph_optimization_level="disable")),
+        ("cold cache, all", SessionConfig(cache_dir=cache_dir)),
+        ("warm cache, all", SessionConfig(cache_dir=cache_dir)),
+        ("1 thread", SessionConfig(cache_dir=cache_dir, intra_op_num_threads=1)),
+        ("2 threads", SessionConfig(cache_dir=cache_dir, intra_op_num_threads=2)),
+        ("4 threads", SessionConfig(cache_dir=cache_dir, intra_op_num_threads=4)),
+        ("parallel, 2x2 threads", SessionConfig(cache_dir=cache_dir, execution_mode="parallel",
+                                                intra_op_num_threads=2, inter_op_num_threads=2)),
+    ]
+
+    print(f"Providers: {available_providers(SessionConfig())}")
+    for name, config in settings:
+        startup, latency = measure(config)
+        print(f"{name:<24} startup {startup * 1e3:8.1f} ms, per frame {latency * 1e3:7.2f} ms")
+
+    shutil.rmtree(cache_dir)
@@ -1,10 +1,30 @@
+import numpy as np
+
+from .adaptive_search import AdaptiveSearch, AdaptiveSearchConfig
+from .redetector import Redetector, RedetectionConfig
+from .session_factory import SessionConfig
+from .template_updater import TemplateUpdater, TemplateUpdateConfig
 from .tracker import Tracker
 
 
 class TargetManager:
-    def __init__(self):
-        self._tracker = Tracker(backbone="resources/models/tracker/backbone.onnx",
-                                rpn_head="resources/models/tracker/rpn.onnx")
+    def __init__(self, session_config: SessionConfig = None, redetection_config: RedetectionConfig = None,
+                 template_update_config: TemplateUpdateConfig = None,
+                 adaptive_search_config: AdaptiveSearchConfig = None,
+                 model_variant="fp32",
+                 backbone="resources/models/tracker/backbone.onnx",
+                 rpn_head="resources/models/tracker/rpn.onnx"):
+        self._tracker = Tracker(backbone=backbone,
+                                rpn_head=rpn_head,
+                                session_config=session_config,
+                                variant=model_variant)
+        self._redetector = Redetector(self._tracker, redetection_config)
+        # Template refresh is off unless configured
+        self._template_updater = TemplateUpdater(self._tracker, template_update_config) \
+            if template_update_config else None
+        # Regular search window unless configured
+        self._adaptive_search = AdaptiveSearch(self._tracker, adaptive_search_config) \
+            if adaptive_search_config else None
         self._is_tracker_initialized = False
 
         self._target_location = None
@@ -13,23 +33,86 @@ class TargetManager:
     def is_tracker_initialized(self):
         return self._is_tracker_initialized
 
+    @property
+    def is_target_lost(self):
+        return self._redetector.is_lost
+
+    @property
+    def redetection_stats(self):
+        return self._redetector.stats
+
+    @property
+    def template_update_stats(self):
+        return self._template_updater.stats if self._template_updater else None
+
+    @property
+    def search_scale(self):
+        """
+        Search window scale of the last update, relative to the regular one
+        """
+        return self._adaptive_search.scale if self._adaptive_search else 1.0
+
     @property
     def target_location(self):
         return self._target_location
 
+    @staticmethod
+    def image_target_location(image):
+        """
+        Point the target is steered to, the image center
+        """
+        return image.shape[1] // 2, image.shape[0] // 2
+
     def reset_tracker(self):
         self._is_tracker_initialized = False
 
     def init_tracker(self, image, roi):
         self._tracker.select_obj(image, roi)
+        self._redetector.reset()
+        if self._template_updater:
+            self._template_updater.reset()
+        if self._adaptive_search:
+            self._adaptive_search.reset()
         self._is_tracker_initialized = True
 
-        self._target_location = image.shape[1] // 2, image.shape[0] // 2
+        self._target_location = self.image_target_location(image)
+
+    def seed_target(self, center, size=None):
+        """
+        Move the target state the next search starts from, e.g. to a motion forecast
+
+        :param center: Target center (x, y) in frame pixels
+        :param size: Target (w, h), the tracked size if not set
+        """
+        assert self._is_tracker_initialized
+
+        self._tracker.center_bbox = np.array(center, dtype=np.float64)
+        if size is not None:
+            self._tracker.size = np.array(size, dtype=np.float64)
 
-    def update_tracker(self, image):
+    def update_tracker(self, image, timestamp: float = None):
+        """
+        :param image: BGR frame
+        :param timestamp: Capture time of the frame, unused, for the ScheduledTargetManager interface
+        :return: Score and bbox of the target
+        """
         assert self._is_tracker_initialized
 
-        score, roi = self._tracker.search_obj(image)
+        template_updater = self._template_updater
+        if self._adaptive_search:
+            templates = template_updater.templates if template_updater and template_updater.stats.templates > 1 \
+                else None
+            score, roi, _ = self._adaptive_search.search(image, templates)
+            if template_updater:
+                template_updater.stats.selected_template = self._adaptive_search.stats.template
+        elif template_updater:
+            score, roi = template_updater.search(image)
+        else:
+            score, roi = self._tracker.search_obj(image)
+        if template_updater:
+            template_updater.update(image, score)
+        # Searches the whole frame while the score stays low
+        score, roi = self._redetector.update(image, score, roi)
         roi = list(map(int, roi))
 
         return score, roi
@@ -0,0 +1,188 @@
+import dataclasses
+import time
+
+import numpy as np
+
+from .tracker import Tracker
+
+
+@dataclasses.dataclass
+class TemplateUpdateConfig:
+    bank_size: int = 3  # Templates evaluated per search, the initial one included
+    refresh_score: float = 0.9  # Search score needed to take a new template from the frame
+    min_refresh_interval: float = 2.0  # s between two template refreshes
+
+
+@dataclasses.dataclass
+class TemplateUpdateStats:
+    refreshes: int = 0
+    templates: int = 0
+    selected_template: int = 0  # Bank index that gave the last bbox, 0 is the initial template
+    refresh_time: float = 0.0  # Moving average, s
+
+
+class TemplateUpdater:
+    def __init__(self, tracker: Tracker, config: TemplateUpdateConfig = None):
+        """
+        Keeps a small bank of template embeddings against appearance drift.
+
+        The initial template always stays in the bank. While the search score is high, the target
+        crop of the current frame is embedded again at most once per min_refresh_interval and
+        replaces the oldest refreshed template. Embeddings are stored in one batch array, so a
+        search runs the backbone once and the head once for all templates, and the template with
+        the strongest response moves the target. The per-frame cost is bounded by the bank size
+        plus one template embedding per refresh interval.
+
+        :param tracker: Tracker whose template and target state are used
+        :param config: Template update settings
+        """
+        self._tracker = tracker
+        self._config = config or TemplateUpdateConfig()
+
+        self._templates = None
+        self._x_embs = None
+        self._next_slot = 1
+        self._last_refresh_time = 0.0
+
+        self._stats = TemplateUpdateStats()
+
+    @property
+    def config(self) -> TemplateUpdateConfig:
+        return self._config
+
+    @property
+    def stats(self) -> TemplateUpdateStats:
+        return self._stats
+
+    @property
+    def templates(self) -> np.ndarray:
+        """
+        Embeddings of the bank, (templates, C, H, W)
+        """
+        return self._templates[:self._stats.templates]
+
+    def reset(self):
+        """
+        Restart the bank from the tracker template, call after Tracker.select_obj
+        """
+        z = self._tracker._z[0]
+        if self._templates is None or self._templates.shape[1:] != z.shape[1:]:
+            self._templates = np.empty((self._config.bank_size,) + z.shape[1:], z.dtype)
+        self._templates[0] = z[0]
+
+        self._next_slot = 1
+        self._last_refresh_time = time.monotonic()
+        self._stats.templates = 1
+        self._stats.selected_template = 0
+
+    def search(self, image):
+        """
+        Tracker.search_obj against every template of the bank
+
+        :param image: BGR frame
+        :return: Best score and the target bbox (x, y, w, h)
+        """
+        tracker = self._tracker
+        n = self._stats.templates
+        if n == 1:
+            self._stats.selected_template = 0
+            return tracker.search_obj(image)
+
+        scale_z, s_x = tracker.search_scale()
+        x_crop = tracker.get_subwindow(image, tracker.center_bbox, tracker.search_size, round(s_x),
+                                       tracker.channel_average)
+        x = tracker.backbone_session.run(None, {'data': x_crop})[0]
+
+        if self._x_embs is None or self._x_embs.shape[1:] != x.shape[1:]:
+            self._x_embs = np.empty((self._config.bank_size,) + x.shape[1:], x.dtype)
+        self._x_embs[:n] = x
+        score, loc = tracker.run_head_batched(self._templates[:n], self._x_embs[:n])
+
+        # Object probability of every anchor of every template, as in RpnPostprocess.score
+        logits = score.reshape((n, 2, -1))
+        probability = 0.5 * (1 + np.tanh(0.5 * (logits[:, 1] - logits[:, 0])))
+        best = int(np.argmax(probability.max(axis=1)))
+        self._stats.selected_template = best
+
+        return tracker.update_state(score[best:best + 1], loc[best:best + 1], scale_z, image.shape[:2])
+
+    def update(self, image, score):
+        """
+        Take a new template from the frame if the search was confident and the interval has passed
+
+        :param image: BGR frame of the last search
+        :param score: Score of the last search
+        """
+        config = self._config
+        stats = self._stats
+        if config.bank_size < 2 or score < config.refresh_score:
+            return
+
+        now = time.monotonic()
+        if now - self._last_refresh_time < config.min_refresh_interval:
+            return
+        self._last_refresh_time = now
+
+        tracker = self._tracker
+        tic = time.perf_counter()
+        s_z = round(tracker.template_size / tracker.search_scale()[0])
+        z_crop = tracker.get_subwindow(image, tracker.center_bbox, tracker.template_size, s_z,
+                                       tracker.channel_average)
+        self._templates[self._next_slot] = tracker.backbone_session.run(None, {'data': z_crop})[0][0]
+        refresh_time = time.perf_counter() - tic
+
+        # Slot 0 keeps the initial template, the refreshed ones are replaced oldest first
+        self._next_slot = self._next_slot % (config.bank_size - 1) + 1
+        stats.templates = min(stats.templates + 1, config.bank_size)
+        stats.refreshes += 1
+        stats.refresh_time = refresh_time if stats.refreshes == 1 else \
+            stats.refresh_time + (refresh_time - stats.refresh_time) * 0.1
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+
+    from .benchmark import make_stand_in_models, success_auc, synthetic_sequence
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default="resources/models/tracker/backbone.onnx")
+    parser.add_argument("--rpn-head", type=str, default="resources/models/tracker/rpn.onnx")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    backbone, rpn_head = args.backbone, args.rpn_head
+    if not (os.path.exists(backbone) and os.path.exists(rpn_head)):
+        print("[WARNING] Tracker models not found, using random stand-in models, success figures are meaningless")
+        backbone, rpn_head = make_stand_in_models(tempfile.mkdtemp())
+
+    # A target that changes scale along the sequence, so its appearance drifts from the first frame
+    sequence = synthetic_sequence("scaling", args.frames, scaling=True)
+    first_roi = tuple(int(v) for v in sequence.ground_truth[0])
+
+    print(f"{'policy':<16} {'ms/frame':>9} {'max ms':>7} {'refreshes':>9} {'success AUC':>11}")
+    for name, config in [("fixed template", None),
+                         ("bank of 2", TemplateUpdateConfig(bank_size=2, min_refresh_interval=0.1)),
+                         ("bank of 3", TemplateUpdateConfig(bank_size=3, min_refresh_interval=0.1)),
+                         ("bank of 5", TemplateUpdateConfig(bank_size=5, min_refresh_interval=0.1))]:
+        tracker = Tracker(backbone, rpn_head)
+        updater = TemplateUpdater(tracker, config)
+        tracker.select_obj(sequence.frames[0], first_roi)
+        updater.reset()
+
+        boxes = [sequence.ground_truth[0]]
+        frame_times = []
+        for i in range(1, len(sequence.frames)):
+            frame = sequence.frames[i]
+            tic = time.perf_counter()
+            if config is None:
+                score, roi = tracker.search_obj(frame)
+            else:
+                score, roi = updater.search(frame)
+                updater.update(frame, score)
+            frame_times.append(time.perf_counter() - tic)
+            boxes.append(roi)
+
+        print(f"{name:<16} {np.mean(frame_times) * 1e3:>9.2f} {np.max(frame_times) * 1e3:>7.2f} "
+              f"{updater.stats.refreshes:>9} {success_auc(np.array(boxes, np.float64), sequence.ground_truth):>11.3f}")
@@ -3,17 +3,23 @@ Created on Jun 8, 2023
 
 @author: esamkin
 """
-import cv2
 import numpy as np
 import onnxruntime as ort
 
-from app.core.tracker.utils import softmax, get_scale, change, Anchors
+from app.core.tracker.session_factory import SessionConfig, create_session, model_variant_path
+from app.core.tracker.utils import RpnPostprocess, anchor_grid, cosine_window, get_subwindow
 
 
 class Tracker:
-    def __init__(self, backbone='backbone.onnx', rpn_head='rpn.onnx'):
-        self.backbone_session = ort.InferenceSession(backbone, providers=['CUDAExecutionProvider'])
-        self.head_session = ort.InferenceSession(rpn_head, providers=['CUDAExecutionProvider'])
+    def __init__(self, backbone='backbone.onnx', rpn_head='rpn.onnx', session_config: SessionConfig = None,
+                 use_io_binding=True, variant='fp32'):
+        # variant is one of fp32, fp16, int8, see app.core.tracker.quantization for building them
+        self.variant = variant
+        self.backbone_session = create_session(model_variant_path(backbone, variant), session_config)
+        self.head_session = create_session(model_variant_path(rpn_head, variant), session_config)
+        # Models exported with a fixed batch size of one are run item by item by the batched calls
+        self._is_batched = all(not isinstance(i.shape[0], int) or i.shape[0] != 1
+                               for i in self.backbone_session.get_inputs() + self.head_session.get_inputs())
         self.template_size = 127
         self.search_size = 287
         self.context_amount = 0.5
@@ -28,10 +34,86 @@ class Tracker:
         self.score_size = (self.search_size - self.template_size) // self.stride + 1
         self.anchor_num = len(self.anchor_ratio) * len(self.scale)
         self.best_score_id = None
-        self.anchor = self._generate_anchor()
-        hanning = np.hanning(self.score_size)
-        window = np.outer(hanning, hanning)
-        self.window = np.tile(window.flatten(), self.anchor_num)
+        # Shared read-only tables, built by the first tracker of this configuration, and the
+        # in-place post-processing buffers
+        self._postprocess = RpnPostprocess(self.stride, tuple(self.anchor_ratio), tuple(self.scale),
+                                           self.score_size, self.penalty_1, self.penalty_2)
+        self.anchor = self._postprocess.anchor
+        self.window = self._postprocess.window
+        self._patch_buffers = {}
+        # Called with the stage name at the end of each search_obj stage, e.g. to time them
+        self.stage_hook = None
+
+        self.use_io_binding = use_io_binding
+        if self.use_io_binding:
+            self._init_io_binding()
+
+    @property
+    def is_batched(self) -> bool:
+        """
+        True if both models take batches of any size
+        """
+        return self._is_batched
+
+    def run_backbone_batched(self, crops):
+        """
+        Embeddings of a batch of crops, in one backbone call if the models are batched, crop by crop
+        otherwise
+
+        :param crops: Search or template crops, (N, 3, H, W) float32
+        :return: Embeddings, (N, C, h, w)
+        """
+        if self._is_batched:
+            return self.backbone_session.run(None, {'data': crops})[0]
+        return np.concatenate([self.backbone_session.run(None, {'data': crops[i:i + 1]})[0]
+                               for i in range(len(crops))])
+
+    def run_head_batched(self, templates, embeddings):
+        """
+        Raw rpn outputs of template and search embedding pairs, in one head call if the models are
+        batched, pair by pair otherwise
+
+        :param templates: Template embeddings, (N, C, H, W)
+        :param embeddings: Search embeddings, (N, C, h, w)
+        :return: Scores (N, 2 * anchor_num, score_size, score_size) and box deltas (N, 4 * anchor_num, ...)
+        """
+        if self._is_batched:
+            return self.head_session.run(['conv3_fwd', 'conv7_fwd'], {'data0': templates, 'data1': embeddings})
+        outputs = [self.head_session.run(['conv3_fwd', 'conv7_fwd'],
+                                         {'data0': templates[i:i + 1], 'data1': embeddings[i:i + 1]})
+                   for i in range(len(templates))]
+        return np.concatenate([o[0] for o in outputs]), np.concatenate([o[1] for o in outputs])
+
+    def _init_io_binding(self):
+        """
+        Preallocate the search crop, the search embedding and the RPN outputs, and bind them to
+        both sessions, so a search runs without allocating tensors. The backbone output buffer is
+        bound straight as the head input. Buffer shapes come from one warm-up run on blank crops.
+        """
+        z = np.zeros((1, 3, self.template_size, self.template_size), np.float32)
+        self._x_crop = np.zeros((1, 3, self.search_size, self.search_size), np.float32)
+
+        z_emb = self.backbone_session.run(None, {'data': z})[0]
+        self._x_emb = self.backbone_session.run(None, {'data': self._x_crop})[0]
+        score, loc = self.head_session.run(['conv3_fwd', 'conv7_fwd'], {'data0': z_emb, 'data1': self._x_emb})
+        self._score_out = np.empty_like(score)
+        self._loc_out = np.empty_like(loc)
+
+        # OrtValues share memory with the numpy buffers and have to outlive the bindings
+        self._x_crop_ort = ort.OrtValue.ortvalue_from_numpy(self._x_crop)
+        self._x_emb_ort = ort.OrtValue.ortvalue_from_numpy(self._x_emb)
+        self._score_ort = ort.OrtValue.ortvalue_from_numpy(self._score_out)
+        self._loc_ort = ort.OrtValue.ortvalue_from_numpy(self._loc_out)
+        self._z_ort = None
+
+        self._backbone_binding = self.backbone_session.io_binding()
+        self._backbone_binding.bind_ortvalue_input('data', self._x_crop_ort)
+        self._backbone_binding.bind_ortvalue_output(self.backbone_session.get_outputs()[0].name, self._x_emb_ort)
+
+        self._head_binding = self.head_session.io_binding()
+        self._head_binding.bind_ortvalue_input('data1', self._x_emb_ort)
+        self._head_binding.bind_ortvalue_output('conv3_fwd', self._score_ort)
+        self._head_binding.bind_ortvalue_output('conv7_fwd', self._loc_ort)
 
     def select_obj(self, img, bbox):
         self.center_bbox = np.array([bbox[0] + (bbox[2] - 1) / 2, bbox[1] + (bbox[3] - 1) / 2])
@@ -51,40 +133,81 @@ class Tracker:
             None,
             {'data': z})
 
-    def search_obj(self, x):
+        if self.use_io_binding:
+            # Template embedding is bound once and reused by every search
+            self._z_ort = ort.OrtValue.ortvalue_from_numpy(self._z[0])
+            self._head_binding.bind_ortvalue_input('data0', self._z_ort)
+
+    def search_scale(self):
+        """
+        Search window for the current target size
+
+        :return: Scale of the template crop relative to the frame and the search crop size in frame pixels
+        """
         # calculate z crop size
         w_z = self.size[0] + self.context_amount * np.sum(self.size)
         h_z = self.size[1] + self.context_amount * np.sum(self.size)
         s_z = np.sqrt(w_z * h_z)
         scale_z = self.template_size / s_z
         s_x = s_z * (self.search_size / self.template_size)
-        x_crop = self.get_subwindow(x, self.center_bbox,
-                                    self.search_size,
-                                    round(s_x), self.channel_average)
-        self._x = self.backbone_session.run(
-            None,
-            {'data': x_crop})
-
-        self.score, self.loc = self.head_session.run(
-            ['conv3_fwd', 'conv7_fwd'],
-            {'data0': self._z[0], 'data1': self._x[0]})
-
-        self._get_score()
-        self._convert_bbox()
-
-        # scale penalty，
-        s_c = change(get_scale(self.loc[2, :], self.loc[3, :]) /
-                     (get_scale(self.size[0] * scale_z, self.size[1] * scale_z)))
-
-        # proportion penalty.
-        r_c = change((self.size[0] / self.size[1]) /
-                     (self.loc[2, :] / self.loc[3, :]))
-        penalty = np.exp(-(r_c * s_c - 1) * self.penalty_1)
-        self.score *= penalty
-        # window penalty
-        self.score = self.score * (1 - self.penalty_2) + \
-                     self.window * self.penalty_2
-        best_score_idx = np.argmax(self.score)
+        return scale_z, s_x
+
+    def _end_stage(self, stage):
+        if self.stage_hook is not None:
+            self.stage_hook(stage)
+
+    def search_obj(self, x):
+        """
+        Search the frame around the current target state in the stages crop, backbone, head and
+        post-process, stage_hook is called at the end of each
+
+        :param x: BGR frame
+        :return: Best score and the target bbox (x, y, w, h)
+        """
+        scale_z, s_x = self.search_scale()
+        if self.use_io_binding:
+            self.get_subwindow(x, self.center_bbox,
+                               self.search_size,
+                               round(s_x), self.channel_average, out=self._x_crop)
+            self._end_stage("crop")
+            self.backbone_session.run_with_iobinding(self._backbone_binding)
+            self._end_stage("backbone")
+            self.head_session.run_with_iobinding(self._head_binding)
+            self._end_stage("head")
+
+            self._x = [self._x_emb]
+            self.score, self.loc = self._score_out, self._loc_out
+        else:
+            x_crop = self.get_subwindow(x, self.center_bbox,
+                                        self.search_size,
+                                        round(s_x), self.channel_average)
+            self._end_stage("crop")
+            self._x = self.backbone_session.run(
+                None,
+                {'data': x_crop})
+            self._end_stage("backbone")
+
+            self.score, self.loc = self.head_session.run(
+                ['conv3_fwd', 'conv7_fwd'],
+                {'data0': self._z[0], 'data1': self._x[0]})
+            self._end_stage("head")
+
+        result = self.update_state(self.score, self.loc, scale_z, x.shape[:2])
+        self._end_stage("post-process")
+        return result
+
+    def update_state(self, score, loc, scale_z, boundary):
+        """
+        Decode the rpn outputs of one search and move the target
+
+        :param score: Raw rpn scores of the search, (1, 2 * anchor_num, score_size, score_size)
+        :param loc: Raw rpn box deltas of the search, (1, 4 * anchor_num, score_size, score_size)
+        :param scale_z: Scale returned by search_scale for the search
+        :param boundary: Frame (height, width)
+        :return: Best score and the target bbox (x, y, w, h)
+        """
+        self.score, self.loc, penalty = self._postprocess(score, loc, self.size, scale_z)
+        best_score_idx = int(np.argmax(self.score))
         bbox = self.loc[:, best_score_idx] / scale_z
         penalty_lr = penalty[best_score_idx] * self.score[best_score_idx] * self.penalty_3
         center_x = bbox[0] + self.center_bbox[0]
@@ -93,7 +216,7 @@ class Tracker:
         width = self.size[0] * (1 - penalty_lr) + bbox[2] * penalty_lr
         height = self.size[1] * (1 - penalty_lr) + bbox[3] * penalty_lr
         center_x, center_y, width, height = self._bbox_clip(
-            center_x, center_y, width, height, x.shape[:2])
+            center_x, center_y, width, height, boundary)
 
         # update for new x
         self.center_bbox = np.array([center_x, center_y])
@@ -103,57 +226,10 @@ class Tracker:
                 int(center_y - height / 2),
                 int(width),
                 int(height)]
-        best_score = self.score[best_score_idx]
+        best_score = float(self.score[best_score_idx])
 
         return best_score, bbox
 
-    def _get_score(self, ):
-        """
-        Transform tensor from rpn to subconfidence.
-        Produse max_confidence and it's possition.  
-        """
-        self.score = np.transpose(self.score, (1, 2, 3, 0)).reshape((2, -1))
-        self.score = np.transpose(self.score, axes=(1, 0))
-        self.score = softmax(self.score, axis=1)[:, 1]
-
-    def _convert_bbox(self, ):
-        self.loc = np.transpose(self.loc, (1, 2, 3, 0)).reshape((4, -1))
-        self.loc[0, :] = self.loc[0, :] * self.anchor[:, 2] + self.anchor[:, 0]
-        self.loc[1, :] = self.loc[1, :] * self.anchor[:, 3] + self.anchor[:, 1]
-        self.loc[2, :] = np.exp(self.loc[2, :]) * self.anchor[:, 2]
-        self.loc[3, :] = np.exp(self.loc[3, :]) * self.anchor[:, 3]
-
-    def _generate_anchor(self):
-        """
-        generate score map anchors based on predefined configuration
-
-        Parameters
-        ----------
-            score_size : int
-                score map size
-
-        Returns
-        ----------
-            score map anchor
-        """
-
-        anchors = Anchors(self.stride,
-                          self.anchor_ratio,
-                          self.scale)
-        anchor = anchors.anchors
-        x_min, y_min, x_max, y_max = anchor[:, 0], anchor[:, 1], anchor[:, 2], anchor[:, 3]
-        anchor = np.stack([(x_min + x_max) * 0.5, (y_min + y_max) * 0.5, x_max - x_min, y_max - y_min], 1)
-        total_stride = anchors.stride
-        anchor_num = anchor.shape[0]
-        anchor = np.tile(anchor, self.score_size * self.score_size).reshape((-1, 4))
-        ori = - (self.score_size // 2) * total_stride
-        x_x, y_y = np.meshgrid([ori + total_stride * dx for dx in range(self.score_size)],
-                               [ori + total_stride * dy for dy in range(self.score_size)])
-        x_x, y_y = np.tile(x_x.flatten(), (self.anchor_num, 1)).flatten(), \
-            np.tile(y_y.flatten(), (self.anchor_num, 1)).flatten()
-        anchor[:, 0], anchor[:, 1] = x_x.astype(np.float32), y_y.astype(np.float32)
-        return anchor
-
     def _bbox_clip(self, center_x, center_y, width, height, boundary):
         center_x = max(0, min(center_x, boundary[1]))
         center_y = max(0, min(center_y, boundary[0]))
@@ -161,91 +237,54 @@ class Tracker:
         height = max(10, min(height, boundary[0]))
         return center_x, center_y, width, height
 
-    def get_subwindow(self, img, pos, model_sz, original_sz, avg_chans):
-        """
-        Adjust the position of the frame to prevent the boundary from being exceeded.
-        If the boundary is exceeded,
-        the average value of each channel of the image is used to replace the exceeded value.
-        Parameters
-        ----------
-        im : np.ndarray
-            BGR based image
-        pos : list
-            center position
-        model_sz : array
-            exemplar size, x is 127, z is 287 in ours
-        original_sz: array
-            original size
-        avg_chans : array
-            channel average
-        ctx : mxnet.Context
-            Context such as mx.cpu(), mx.gpu(0).
-        Returns
-        -------
-            rejust window though avg channel
-        """
-        if isinstance(pos, float):
-            pos = [pos, pos]
-        im_sz = img.shape
-        original_c = (original_sz + 1) / 2
-        context_xmin = np.floor(pos[0] - original_c + 0.5)
-        context_xmax = context_xmin + original_sz - 1
-        context_ymin = np.floor(pos[1] - original_c + 0.5)
-        context_ymax = context_ymin + original_sz - 1
-        left_pad = int(max(0., -context_xmin))
-        top_pad = int(max(0., -context_ymin))
-        right_pad = int(max(0., context_xmax - im_sz[1] + 1))
-        bottom_pad = int(max(0., context_ymax - im_sz[0] + 1))
-
-        context_xmin = context_xmin + left_pad
-        context_xmax = context_xmax + left_pad
-        context_ymin = context_ymin + top_pad
-        context_ymax = context_ymax + top_pad
-        im_h, im_w, im_c = img.shape
-
-        if any([top_pad, bottom_pad, left_pad, right_pad]):
-            # If there is a pad, use the average channels to complete
-            size = (im_h + top_pad + bottom_pad, im_w + left_pad + right_pad, im_c)
-            te_im = np.zeros(size, np.uint8)
-            te_im[top_pad:top_pad + im_h, left_pad:left_pad + im_w, :] = img
-            if top_pad:
-                te_im[0:top_pad, left_pad:left_pad + im_w, :] = avg_chans
-            if bottom_pad:
-                te_im[im_h + top_pad:, left_pad:left_pad + im_w, :] = avg_chans
-            if left_pad:
-                te_im[:, 0:left_pad, :] = avg_chans
-            if right_pad:
-                te_im[:, im_w + left_pad:, :] = avg_chans
-            im_patch = te_im[int(context_ymin):int(context_ymax + 1),
-                       int(context_xmin):int(context_xmax + 1), :]
-        else:
-            # If there is no pad, crop Directly
-            im_patch = img[int(context_ymin):int(context_ymax + 1),
-                       int(context_xmin):int(context_xmax + 1), :]
-        if not np.array_equal(model_sz, original_sz):
-            im_patch = cv2.resize(im_patch, (model_sz, model_sz))
-        im_patch = im_patch.transpose(2, 0, 1)
-        im_patch = im_patch[np.newaxis, :, :, :]
-        im_patch = im_patch.astype(np.float32)
-        return im_patch
+    def get_subwindow(self, img, pos, model_sz, original_sz, avg_chans, out=None):
+        """
+        Window of the frame around pos scaled to the model input, see utils.get_subwindow. The
+        warped patch buffers are kept per tracker.
+        """
+        return get_subwindow(img, pos, model_sz, original_sz, avg_chans, out=out, patch_buffers=self._patch_buffers)
 
 
 if __name__ == '__main__':
+    import argparse
+    import tracemalloc
     from time import time
 
-    net = Tracker()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default="resources/models/tracker/backbone.onnx")
+    parser.add_argument("--rpn-head", type=str, default="resources/models/tracker/rpn.onnx")
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    def build_tables():
+        anchor_grid(8, (0.33, 0.5, 1, 2, 3), (8,), 21)
+        cosine_window(21, 5)
+        cosine_window(21, 5, 0.4)
+
+    anchor_grid.cache_clear()
+    cosine_window.cache_clear()
+    tic = time()
+    build_tables()
+    cold_time = time() - tic
+    tic = time()
+    build_tables()
+    print(f"Anchor and window tables: {cold_time * 1e6:.0f} us built, {(time() - tic) * 1e6:.1f} us cached")
 
-    X = np.random.normal(0, 1, (287, 287, 3)).astype('float32')
-    Z = np.random.normal(0, 1, (127, 127, 3)).astype('float32')
+    X = (np.random.rand(720, 1280, 3) * 255).astype(np.uint8)
 
-    net.select_obj(Z, (64, 64, 127, 127))
+    for use_io_binding in (False, True):
+        net = Tracker(args.backbone, args.rpn_head, use_io_binding=use_io_binding)
+        net.select_obj(X, (600, 320, 80, 60))
+        net.search_obj(X)
 
-    net.search_obj(X)
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        tic = time()
+        for i in range(args.frames):
+            net.search_obj(X)
+        elapsed = (time() - tic) / args.frames
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
 
-    n = 200
-    tic = time()
-    print(net.anchor.shape)
-    for i in range(n):
-        print(net.search_obj(X))
-    print((time() - tic) / n)
-    print(net.score.shape, net.loc.shape, net.score)
+        print(f"IOBinding {use_io_binding!s:<5}: {elapsed * 1e3:.2f} ms/frame, "
+              f"peak traced allocation {peak / 1024:.0f} KiB")
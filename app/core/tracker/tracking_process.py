@@ -0,0 +1,280 @@
+import ctypes
+from typing import Tuple
+
+import multiprocess as mp
+import numpy as np
+
+from .target_manager import TargetManager
+
+
+class FrameRing:
+    def __init__(self, n_slots: int, frame_shape: Tuple[int, int, int]):
+        """
+        Fixed-size frame slots in shared memory. The writer fills the slots round robin, readers map
+        them as numpy arrays without copying. Each slot has a version counter that is odd while the
+        slot is written, so a reader can tell whether a slot was overwritten while it was using it.
+
+        The ring must be created before the reader process is started.
+
+        :param n_slots: Number of slots
+        :param frame_shape: Shape of a uint8 frame
+        """
+        self._n_slots = n_slots
+        self._frame_shape = tuple(frame_shape)
+        self._frame_size = int(np.prod(frame_shape))
+
+        self._buffer = mp.RawArray(ctypes.c_uint8, n_slots * self._frame_size)
+        self._versions = mp.RawArray(ctypes.c_uint64, n_slots)
+        self._next_slot = 0
+
+        self._views = None
+
+    @property
+    def frame_shape(self):
+        return self._frame_shape
+
+    def __getstate__(self):
+        # Numpy pickles the views by value, a process started later would read copies of the frames
+        state = self.__dict__.copy()
+        state["_views"] = None
+        return state
+
+    def _slot_views(self):
+        # Created lazily so that every process maps the buffer after it started
+        if self._views is None:
+            frames = np.frombuffer(self._buffer, dtype=np.uint8).reshape((self._n_slots,) + self._frame_shape)
+            self._views = list(frames)
+        return self._views
+
+    def write(self, frame: np.ndarray) -> Tuple[int, int]:
+        """
+        Copy a frame into the next slot
+
+        :return: Slot index and the slot version of the frame
+        """
+        assert frame.shape == self._frame_shape, f"Frame shape {frame.shape} does not fit {self._frame_shape}"
+
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % self._n_slots
+
+        self._versions[slot] += 1
+        np.copyto(self._slot_views()[slot], frame)
+        self._versions[slot] += 1
+        return slot, self._versions[slot]
+
+    def view(self, slot: int) -> np.ndarray:
+        return self._slot_views()[slot]
+
+    def is_valid(self, slot: int, version: int) -> bool:
+        """
+        True if the slot still holds the frame written with this version
+        """
+        return self._versions[slot] == version
+
+
+def _tracking_process(connection, ring: FrameRing, target_manager_kwargs):
+    target_manager = TargetManager(**target_manager_kwargs)
+
+    while True:
+        command, *args = connection.recv()
+
+        if command == "stop":
+            break
+
+        if command == "reset":
+            target_manager.reset_tracker()
+            continue
+
+        if command == "seed":
+            target_manager.seed_target(*args)
+            continue
+
+        slot, version = args[:2]
+        frame = ring.view(slot)
+        if command == "init":
+            target_manager.init_tracker(frame, args[2])
+            connection.send(ring.is_valid(slot, version))
+        elif command == "update":
+            score, roi = target_manager.update_tracker(frame)
+            # A result from a frame overwritten mid-search is not trusted
+            connection.send((score, roi, target_manager.is_target_lost) if ring.is_valid(slot, version) else None)
+
+
+class ProcessTargetManager:
+    def __init__(self, frame_shape=(720, 1280, 3), n_slots=4, **target_manager_kwargs):
+        """
+        TargetManager running in its own process, so tracking does not hold the GIL of this one.
+
+        Frames go through a shared-memory ring, only commands and (score, roi) results cross the
+        pipe. Calls block the calling thread while the tracker process works, without holding the
+        GIL, so the GUI and controller threads keep running.
+
+        The tracker process is spawned, so it does not inherit the threads and GL state of this
+        one. If it dies, the call raises ChildProcessError and a new tracker process is started
+        uninitialised.
+
+        :param frame_shape: Shape of the frames, fixed by the ring slots
+        :param n_slots: Number of ring slots
+        :param target_manager_kwargs: Arguments of the TargetManager in the tracker process
+        """
+        self._context = mp.get_context("spawn")
+        self._ring = FrameRing(n_slots, frame_shape)
+        self._target_manager_kwargs = target_manager_kwargs
+        self._start_process()
+
+        self._is_tracker_initialized = False
+        self._target_location = None
+        self._last_result = 0.0, [0, 0, 0, 0]
+        self._is_target_lost = False
+
+    @property
+    def is_tracker_initialized(self):
+        return self._is_tracker_initialized
+
+    @property
+    def is_target_lost(self):
+        return self._is_target_lost
+
+    @property
+    def target_location(self):
+        return self._target_location
+
+    @staticmethod
+    def image_target_location(image):
+        return TargetManager.image_target_location(image)
+
+    def _start_process(self):
+        self._connection, child_connection = self._context.Pipe()
+        self._process = self._context.Process(target=_tracking_process,
+                                              args=(child_connection, self._ring, self._target_manager_kwargs),
+                                              daemon=True)
+        self._process.start()
+        # The child holds its end, ours has to see EOF when the child exits
+        child_connection.close()
+
+    def _request(self, command, reply=True):
+        """
+        Send a command to the tracker process
+
+        :return: Reply of the tracker process, None if no reply is expected
+        """
+        try:
+            self._connection.send(command)
+            return self._connection.recv() if reply else None
+        except (EOFError, OSError) as error:
+            self._process.join(timeout=1)
+            exitcode = self._process.exitcode
+            self._connection.close()
+            # The template was lost with the process, the new one waits for an initialisation
+            self._is_tracker_initialized = False
+            self._start_process()
+            raise ChildProcessError(f"Tracker process exited with code {exitcode}, restarted") from error
+
+    def reset_tracker(self):
+        self._is_tracker_initialized = False
+        self._request(("reset",), reply=False)
+
+    def init_tracker(self, image, roi):
+        slot, version = self._ring.write(image)
+        if not self._request(("init", slot, version, tuple(roi))):
+            # Calls are serialised, the slot can only be overwritten by another thread
+            self._is_tracker_initialized = False
+            raise ChildProcessError("Frame was overwritten while the tracker process initialised on it")
+        self._is_tracker_initialized = True
+        self._is_target_lost = False
+
+        self._target_location = self.image_target_location(image)
+
+    def seed_target(self, center, size=None):
+        assert self._is_tracker_initialized
+        self._request(("seed", tuple(center), None if size is None else tuple(size)), reply=False)
+
+    def update_tracker(self, image, timestamp: float = None):
+        assert self._is_tracker_initialized
+
+        slot, version = self._ring.write(image)
+        result = self._request(("update", slot, version))
+        if result is not None:
+            score, roi, self._is_target_lost = result
+            self._last_result = score, roi
+
+        return self._last_result
+
+    def stop(self):
+        if self._process.is_alive():
+            try:
+                self._connection.send(("stop",))
+            except OSError:
+                pass
+            self._process.join(timeout=1)
+        if self._process.is_alive():
+            self._process.terminate()
+
+    def __del__(self):
+        if hasattr(self, "_process"):
+            self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+    import time
+    from threading import Event, Thread
+
+    from .benchmark import make_stand_in_models, synthetic_sequence
+    from .session_factory import SessionConfig
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default="resources/models/tracker/backbone.onnx")
+    parser.add_argument("--rpn-head", type=str, default="resources/models/tracker/rpn.onnx")
+    parser.add_argument("--frames", type=int, default=300, help="GUI frames per run")
+    args = parser.parse_args()
+
+    backbone, rpn_head = args.backbone, args.rpn_head
+    if not (os.path.exists(backbone) and os.path.exists(rpn_head)):
+        backbone, rpn_head = make_stand_in_models(tempfile.mkdtemp())
+    kwargs = dict(session_config=SessionConfig(cache_dir=None), backbone=backbone, rpn_head=rpn_head)
+
+    sequence = synthetic_sequence("moving", 100)
+    frames = [sequence.frames[i] for i in range(len(sequence.frames))]
+    first_roi = tuple(int(v) for v in sequence.ground_truth[0])
+
+    def gui_frame_times(target_manager):
+        # A GUI thread doing a fixed amount of Python work per frame next to a tracking thread
+        stop = Event()
+
+        def track():
+            # Frames arrive at 30 FPS, the tracker skips to the latest one when it falls behind
+            target_manager.init_tracker(frames[0], first_roi)
+            start = time.perf_counter()
+            while not stop.is_set():
+                i = int((time.perf_counter() - start) * 30)
+                target_manager.update_tracker(frames[i % (len(frames) - 1) + 1])
+                time.sleep(max(0.0, start + (i + 1) / 30 - time.perf_counter()))
+
+        tracking_thread = None
+        if target_manager is not None:
+            tracking_thread = Thread(target=track, daemon=True)
+            tracking_thread.start()
+            time.sleep(0.5)
+
+        frame_times = []
+        for _ in range(args.frames):
+            tic = time.perf_counter()
+            sum(i * i for i in range(20000))
+            frame_times.append(time.perf_counter() - tic)
+
+        stop.set()
+        if tracking_thread:
+            tracking_thread.join()
+        return np.array(frame_times) * 1e3
+
+    for name, make in [("no tracking", lambda: None),
+                       ("tracker thread", lambda: TargetManager(**kwargs)),
+                       ("tracker process", lambda: ProcessTargetManager(frames[0].shape, **kwargs))]:
+        manager = make()
+        times = gui_frame_times(manager)
+        if isinstance(manager, ProcessTargetManager):
+            manager.stop()
+        print(f"{name:<16} GUI frame time: median {np.median(times):6.2f} ms, p99 {np.percentile(times, 99):6.2f} ms")
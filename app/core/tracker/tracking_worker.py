@@ -0,0 +1,249 @@
+import dataclasses
+import time
+from threading import Condition, Thread
+from typing import Optional
+
+import numpy as np
+
+from .target_manager import TargetManager
+
+
+@dataclasses.dataclass
+class TrackingResult:
+    frame_id: int
+    score: float
+    roi: list
+    timestamp: float  # Capture time of the frame, time.monotonic()
+    latency: float  # From frame submission to the result, s
+    is_target_lost: bool = False  # The target manager is searching the frame for the target
+
+
+@dataclasses.dataclass
+class TrackingStats:
+    submitted_frames: int = 0
+    processed_frames: int = 0
+    dropped_frames: int = 0
+    inference_fps: float = 0.0
+    last_latency: float = 0.0
+    failures: int = 0  # Target manager calls that raised, each leaves the tracker uninitialised
+    last_error: str = ""
+
+
+class TrackingWorker:
+    def __init__(self, target_manager: TargetManager):
+        """
+        Runs the tracker on its own thread. Frames are handed over through a single slot, a frame
+        that has not been picked up yet is replaced by a newer one, so the tracker always works on
+        the latest frame and skips the ones it can not keep up with. Results are polled without
+        blocking.
+
+        The tracker is only touched by the worker thread, initialisation and reset requests are
+        queued and applied before the next frame. A target manager call that raises leaves the
+        tracker uninitialised, the error is counted in the stats and the worker keeps running.
+
+        :param target_manager: Target manager to run
+        """
+        self._target_manager = target_manager
+
+        self._condition = Condition()
+        self._pending_frame = None
+        self._pending_init = None
+        self._pending_reset = False
+        # State requested by the caller, the worker catches up before the next frame
+        self._is_tracker_initialized = False
+
+        # Bumped on every initialisation and reset, results of older generations are discarded
+        self._generation = 0
+        self._result: Optional[TrackingResult] = None
+        self._result_generation = 0
+        self._polled_result = None
+
+        self._next_frame_id = 0
+        self._stats = TrackingStats()
+        self._last_result_time = 0.0
+
+        self._stopped = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def is_tracker_initialized(self) -> bool:
+        return self._is_tracker_initialized
+
+    @property
+    def result(self) -> Optional[TrackingResult]:
+        """
+        Latest result of the current tracker initialisation
+        """
+        with self._condition:
+            return self._result if self._result_generation == self._generation else None
+
+    @property
+    def stats(self) -> TrackingStats:
+        with self._condition:
+            return dataclasses.replace(self._stats)
+
+    def poll(self) -> Optional[TrackingResult]:
+        """
+        :return: Result published since the last poll, None if there is none
+        """
+        result = self.result
+        if result is None or result is self._polled_result:
+            return None
+
+        self._polled_result = result
+        return result
+
+    def init_tracker(self, image: np.ndarray, roi):
+        with self._condition:
+            self._generation += 1
+            self._pending_init = image, roi
+            self._pending_reset = False
+            self._is_tracker_initialized = True
+            self._pending_frame = None
+            self._condition.notify()
+
+    def reset_tracker(self):
+        with self._condition:
+            self._generation += 1
+            self._pending_init = None
+            self._pending_reset = True
+            self._is_tracker_initialized = False
+            self._pending_frame = None
+            self._condition.notify()
+
+    def submit(self, image: np.ndarray, frame_id: int = None, timestamp: float = None) -> int:
+        """
+        Hand a frame to the tracker, replacing a frame that has not been picked up yet
+
+        :param image: BGR frame
+        :param frame_id: Frame number, consecutive numbers are assigned if not set
+        :param timestamp: Capture time, time.monotonic(), submission time if not set
+        :return: Frame number
+        """
+        now = time.monotonic()
+        with self._condition:
+            if frame_id is None:
+                frame_id = self._next_frame_id
+            self._next_frame_id = frame_id + 1
+
+            if self._pending_frame is not None:
+                self._stats.dropped_frames += 1
+            self._stats.submitted_frames += 1
+
+            self._pending_frame = image, frame_id, now if timestamp is None else timestamp, now
+            self._condition.notify()
+
+        return frame_id
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _fail(self, generation, error):
+        print(f"[WARNING] Tracking failed: {error!r}")
+        with self._condition:
+            self._stats.failures += 1
+            self._stats.last_error = repr(error)
+            # A later initialisation request stands, it is applied on the next loop
+            if generation == self._generation:
+                self._generation += 1
+                self._is_tracker_initialized = False
+                self._pending_frame = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and self._pending_frame is None and \
+                        self._pending_init is None and not self._pending_reset:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+                generation = self._generation
+                init, self._pending_init = self._pending_init, None
+                reset, self._pending_reset = self._pending_reset, False
+                frame, self._pending_frame = self._pending_frame, None
+
+            try:
+                if reset:
+                    self._target_manager.reset_tracker()
+
+                if init is not None:
+                    self._target_manager.init_tracker(*init)
+
+                if frame is None or not self._target_manager.is_tracker_initialized:
+                    continue
+
+                image, frame_id, timestamp, submitted = frame
+                score, roi = self._target_manager.update_tracker(image, timestamp)
+                is_target_lost = self._target_manager.is_target_lost
+            except Exception as error:
+                self._fail(generation, error)
+                continue
+            now = time.monotonic()
+
+            with self._condition:
+                # Drop the result if the tracker was re-initialised or reset meanwhile
+                if generation != self._generation:
+                    continue
+
+                self._result = TrackingResult(frame_id, float(score), roi, timestamp, now - submitted, is_target_lost)
+                self._result_generation = generation
+
+                stats = self._stats
+                if stats.processed_frames:
+                    # Exponential moving average of the processing rate
+                    fps = 1 / max(now - self._last_result_time, 1e-6)
+                    stats.inference_fps += (fps - stats.inference_fps) * 0.1
+                self._last_result_time = now
+                stats.processed_frames += 1
+                stats.last_latency = now - submitted
+
+
+if __name__ == "__main__":
+    # Render loop at 60 Hz next to a tracker stand-in with a 50 ms inference time, the render rate
+    # stays at 60 Hz while the tracker processes the latest frames at its own rate
+    class SlowTargetManager:
+        def __init__(self):
+            self.is_tracker_initialized = False
+            self.is_target_lost = False
+
+        def init_tracker(self, image, roi):
+            self.is_tracker_initialized = True
+
+        def reset_tracker(self):
+            self.is_tracker_initialized = False
+
+        def update_tracker(self, image, timestamp=None):
+            time.sleep(0.05)
+            return 0.9, [int(image[0, 0, 0]), 0, 10, 10]
+
+    worker = TrackingWorker(SlowTargetManager())
+    frame = np.zeros((720, 1280, 3), np.uint8)
+    worker.init_tracker(frame, (0, 0, 10, 10))
+
+    n_frames = 180
+    results = 0
+    max_frame_time = 0
+    tic = time.monotonic()
+    for i in range(n_frames):
+        frame_start = time.monotonic()
+
+        worker.submit(frame)
+        if worker.poll() is not None:
+            results += 1
+
+        max_frame_time = max(max_frame_time, time.monotonic() - frame_start)
+        time.sleep(max(0.0, tic + (i + 1) / 60 - time.monotonic()))
+    elapsed = time.monotonic() - tic
+
+    worker.stop()
+    stats = worker.stats
+    print(f"Render: {n_frames / elapsed:.1f} FPS, longest tracker call on the render thread "
+          f"{max_frame_time * 1e3:.2f} ms")
+    print(f"Tracker: {stats.inference_fps:.1f} FPS, latency {stats.last_latency * 1e3:.1f} ms, "
+          f"{stats.processed_frames} processed, {stats.dropped_frames} dropped, {results} results polled")
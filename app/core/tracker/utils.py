@@ -3,6 +3,9 @@ Created on Jun 8, 2023
 
 @author: esamkin
 '''
+import functools
+
+import cv2
 import numpy as np
 
 
@@ -36,16 +39,12 @@ class Anchors:
         Anchor ratios
     scales : tuple
         Anchor scales
-    size : int
-        anchor size
     """
 
-    def __init__(self, stride, ratios, scales, image_center=0, size=0):
+    def __init__(self, stride, ratios, scales):
         self.stride = stride
         self.ratios = ratios
         self.scales = scales
-        self.image_center = image_center
-        self.size = size
         self.anchor_num = len(self.scales) * len(self.ratios)
         self.anchors = None
         self.generate_anchors()
@@ -65,53 +64,216 @@ class Anchors:
                 self.anchors[count][:] = [-w * 0.5, -h * 0.5, w * 0.5, h * 0.5][:]
                 count += 1
 
-    def generate_all_anchors(self, im_c, size):
+
+def _read_only(a):
+    a.flags.writeable = False
+    return a
+
+
+@functools.lru_cache(maxsize=None)
+def anchor_grid(stride, ratios: tuple, scales: tuple, score_size):
+    """
+    Anchors of every score map position, anchor type major. Computed once per configuration and
+    shared read-only by all trackers of the process.
+
+    :return: (cx, cy, w, h) table of shape (4, N) and its (N, 4) transposed view
+    """
+    anchors = Anchors(stride, ratios, scales)
+    _, _, w, h = cor2center(anchors.anchors.T)
+
+    ori = - (score_size // 2) * stride
+    x_x, y_y = np.meshgrid(ori + stride * np.arange(score_size), ori + stride * np.arange(score_size))
+
+    table = np.empty((4, anchors.anchor_num, score_size * score_size), np.float32)
+    table[0] = x_x.ravel()
+    table[1] = y_y.ravel()
+    table[2] = w[:, np.newaxis]
+    table[3] = h[:, np.newaxis]
+    table = _read_only(table.reshape((4, -1)))
+    return table, table.T
+
+
+@functools.lru_cache(maxsize=None)
+def cosine_window(score_size, anchor_num, influence=1.0):
+    """
+    Hanning window over the score map repeated for every anchor type, scaled by its influence.
+    Cached and read-only like anchor_grid.
+    """
+    hanning = np.hanning(score_size)
+    window = np.tile(np.outer(hanning, hanning).ravel(), anchor_num) * influence
+    return _read_only(window.astype(np.float32))
+
+
+class RpnPostprocess:
+    """
+    Decoding and penalising of the raw rpn outputs, done in place in preallocated buffers of one
+    value per anchor. Needs only the anchor and window tables, no inference session.
+    """
+
+    def __init__(self, stride, ratios: tuple, scales: tuple, score_size, penalty_1, penalty_2):
+        self.penalty_1 = penalty_1
+        self.penalty_2 = penalty_2
+        anchor_num = len(ratios) * len(scales)
+        self.anchor_table, self.anchor = anchor_grid(stride, tuple(ratios), tuple(scales), score_size)
+        self.window = cosine_window(score_size, anchor_num)
+        self._window_term = cosine_window(score_size, anchor_num, penalty_2)
+
+        n = self.anchor.shape[0]
+        self._score_buf = np.empty(n, np.float32)
+        self._loc_buf = np.empty((4, n), np.float32)
+        self._penalty_buf = np.empty(n, np.float32)
+        self._ratio_buf = np.empty(n, np.float32)
+        self._tmp_buf = np.empty(n, np.float32)
+
+    def __call__(self, score, loc, size, scale_z):
+        """
+        :param score: Raw rpn scores, (1, 2 * anchor_num, score_size, score_size)
+        :param loc: Raw rpn box deltas, (1, 4 * anchor_num, score_size, score_size)
+        :param size: Current target (w, h) in frame pixels
+        :param scale_z: Scale of the search window relative to the frame
+        :return: Penalised score per anchor, decoded (cx, cy, w, h) boxes of shape (4, N) in search
+            crop pixels and the scale and aspect ratio penalty per anchor. All three are buffers
+            overwritten by the next call.
+        """
+        score = self.score(score)
+        loc = self.decode(loc)
+        penalty = self.penalise(score, loc, size, scale_z)
+        return score, loc, penalty
+
+    def score(self, score):
         """
-        generate all anchors
-
-        Parameters
-        ----------
-        im_c: int
-            image center
-        size:
-            image size
+        Transform tensor from rpn to subconfidence.
+        The rpn gives (background, object) logit pairs per anchor, the object probability of the
+        two-class softmax is the sigmoid of the logit difference, computed as 0.5 * (1 + tanh(d / 2))
+        so that large logits can not overflow.
         """
-        if self.image_center == im_c and self.size == size:
-            return False
-        self.image_center = im_c
-        self.size = size
+        logits = score.reshape((2, -1))
+        out = self._score_buf
+        np.subtract(logits[1], logits[0], out=out)
+        out *= 0.5
+        np.tanh(out, out=out)
+        out += 1
+        out *= 0.5
+        return out
 
-        a0x = im_c - size // 2 * self.stride
-        ori = np.array([a0x] * 4, dtype=np.float32)
-        zero_anchors = self.anchors + ori
+    def decode(self, loc):
+        delta = loc.reshape((4, -1))
+        anchor = self.anchor_table
+        out = self._loc_buf
+        np.multiply(delta[0], anchor[2], out=out[0])
+        out[0] += anchor[0]
+        np.multiply(delta[1], anchor[3], out=out[1])
+        out[1] += anchor[1]
+        np.exp(delta[2], out=out[2])
+        out[2] *= anchor[2]
+        np.exp(delta[3], out=out[3])
+        out[3] *= anchor[3]
+        return out
+
+    def penalise(self, score, loc, size, scale_z):
+        """
+        Apply the scale, aspect ratio and cosine window penalties to the scores in place
+
+        :return: Scale and aspect ratio penalty per anchor
+        """
+        w, h = loc[2], loc[3]
+        s_c, r_c, tmp = self._penalty_buf, self._ratio_buf, self._tmp_buf
 
-        x1 = zero_anchors[:, 0]
-        y1 = zero_anchors[:, 1]
-        x2 = zero_anchors[:, 2]
-        y2 = zero_anchors[:, 3]
+        # scale penalty, change(get_scale(w, h) / get_scale(target w, target h))
+        target_w, target_h = size[0] * scale_z, size[1] * scale_z
+        target_pad = (target_w + target_h) * 0.5
+        target_scale = np.sqrt((target_w + target_pad) * (target_h + target_pad))
+        np.add(w, h, out=tmp)
+        tmp *= 0.5
+        np.add(w, tmp, out=s_c)
+        tmp += h
+        s_c *= tmp
+        np.sqrt(s_c, out=s_c)
+        s_c *= 1 / target_scale
+        np.reciprocal(s_c, out=tmp)
+        np.maximum(s_c, tmp, out=s_c)
 
-        x1, y1, x2, y2 = map(lambda x: x.reshape(self.anchor_num, 1, 1),
-                             [x1, y1, x2, y2])
-        cx, cy, w, h = cor2center([x1, y1, x2, y2])
+        # proportion penalty, change(target w / h ratio / (w / h))
+        np.divide(h, w, out=r_c)
+        r_c *= size[0] / size[1]
+        np.reciprocal(r_c, out=tmp)
+        np.maximum(r_c, tmp, out=r_c)
+
+        penalty = s_c
+        penalty *= r_c
+        penalty -= 1
+        penalty *= -self.penalty_1
+        np.exp(penalty, out=penalty)
+
+        score *= penalty
+        # window penalty
+        score *= 1 - self.penalty_2
+        score += self._window_term
+        return penalty
+
+
+def get_subwindow(img, pos, model_sz, original_sz, avg_chans, out=None, patch_buffers: dict = None):
+    """
+    Adjust the position of the frame to prevent the boundary from being exceeded.
+    If the boundary is exceeded,
+    the average value of each channel of the image is used to replace the exceeded value.
+    Parameters
+    ----------
+    im : np.ndarray
+        BGR based image
+    pos : list
+        center position
+    model_sz : array
+        exemplar size, x is 127, z is 287 in ours
+    original_sz: array
+        original size
+    avg_chans : array
+        channel average
+    out : np.ndarray
+        optional (1, 3, model_sz, model_sz) float32 buffer to write the window into
+    patch_buffers : dict
+        optional cache of the warped patches, reused by calls with the same size and frame type
+    Returns
+    -------
+        rejust window though avg channel
+    """
+    if isinstance(pos, float):
+        pos = [pos, pos]
+    original_c = (original_sz + 1) / 2
+    context_xmin = np.floor(pos[0] - original_c + 0.5)
+    context_ymin = np.floor(pos[1] - original_c + 0.5)
 
-        disp_x = np.arange(0, size).reshape(1, 1, -1) * self.stride
-        disp_y = np.arange(0, size).reshape(1, -1, 1) * self.stride
+    # Same sampling grid as cv2.resize of the cropped window, pixels outside the frame
+    # take the channel average, so no padded copy of the frame is needed
+    scale = original_sz / model_sz
+    warp = np.array([[scale, 0, context_xmin + 0.5 * scale - 0.5],
+                     [0, scale, context_ymin + 0.5 * scale - 0.5]])
 
-        cx = cx + disp_x
-        cy = cy + disp_y
+    # Integer frames are padded with the truncated average, as the padded copy used to be
+    border_value = tuple(int(c) if np.issubdtype(img.dtype, np.integer) else float(c) for c in avg_chans)
 
-        # broadcast
-        zero = np.zeros((self.anchor_num, size, size), dtype=np.float32)
-        cx, cy, w, h = map(lambda x: x + zero, [cx, cy, w, h])
-        x1, y1, x2, y2 = center2cor([cx, cy, w, h])
+    key = (model_sz, img.dtype, img.shape[2])
+    patch = patch_buffers.get(key) if patch_buffers is not None else None
+    if patch is None:
+        patch = np.empty((model_sz, model_sz, img.shape[2]), img.dtype)
+    # warpAffine writes into patch when it fits the result, the returned array is used either way
+    patch = cv2.warpAffine(img, warp, (model_sz, model_sz), dst=patch,
+                           flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                           borderMode=cv2.BORDER_CONSTANT,
+                           borderValue=border_value)
+    if patch_buffers is not None:
+        patch_buffers[key] = patch
 
-        self.all_anchors = (np.stack([x1, y1, x2, y2]).astype(np.float32),
-                            np.stack([cx, cy, w, h]).astype(np.float32))
-        return True
+    if out is None:
+        out = np.empty((1, 3, model_sz, model_sz), np.float32)
+    # Transpose and cast in one copy
+    np.copyto(out[0], patch.transpose(2, 0, 1), casting='unsafe')
+    return out
 
 
 def softmax(x, axis=1):
-    e_x = np.exp(x)
+    # Shift by the max so that large logits do not overflow
+    e_x = np.exp(x - x.max(axis=axis, keepdims=True))
     return np.divide(e_x, e_x.sum(axis=axis, keepdims=True))
 
 
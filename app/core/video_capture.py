@@ -1,8 +1,11 @@
+import dataclasses
+import time
 from abc import abstractmethod
-
-from threading import Thread
+from threading import Condition, Event, Thread
+from typing import Callable, Optional, Tuple
 
 import cv2
+import numpy as np
 
 
 class VideoCaptureBase:
@@ -17,11 +20,15 @@ class VideoCaptureBase:
 
 class VideoCaptureCV(VideoCaptureBase):
     def __init__(self, src=0, width=1280, height=720):
-        self.camera = cv2.VideoCapture(src)
+        if hasattr(src, "read"):
+            # Opened source, a cv2.VideoCapture or anything with its read and release methods
+            self.camera = src
+        else:
+            self.camera = cv2.VideoCapture(src)
 
-        self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
-        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
+            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
 
     def read(self) -> tuple:
         return self.camera.read()
@@ -30,13 +37,63 @@ class VideoCaptureCV(VideoCaptureBase):
         self.camera.release()
 
 
+@dataclasses.dataclass
+class VideoFrame:
+    frame: np.ndarray  # Full resolution BGR frame for analysis and recording
+    sequence: int  # Increases by one with every captured frame, the first frame is 1
+    timestamp: float  # Capture time, time.monotonic()
+    preview: Optional[np.ndarray] = None  # BGRA frame fitted to the preview size, None if no size is set
+
+
+def make_preview(frame: np.ndarray, max_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Frame for display: fitted into max_size with the aspect ratio kept, never enlarged, in BGRA.
+    Four bytes per pixel is the order textures are stored in, and keeps rows aligned for any width.
+
+    :param frame: BGR frame
+    :param max_size: Largest (width, height) of the preview, pixels
+    """
+    height, width = frame.shape[:2]
+    scale = min(max_size[0] / width, max_size[1] / height, 1.0)
+    preview_width, preview_height = max(1, round(width * scale)), max(1, round(height * scale))
+    if (preview_width, preview_height) != (width, height):
+        # Area averaging only for whole factors, at other scales it is several times slower than bilinear
+        whole = width % preview_width == 0 and height % preview_height == 0
+        frame = cv2.resize(frame, (preview_width, preview_height),
+                           interpolation=cv2.INTER_AREA if whole else cv2.INTER_LINEAR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+
+
 class VideoCaptureCVStream(VideoCaptureCV):
-    def __init__(self, src=0, width=1280, height=720):
+    def __init__(self, src=0, width=1280, height=720, retry_interval=0.1):
+        """
+        Reads the source in a thread and publishes every frame with a sequence number and its
+        capture time. Consumers ask for a frame newer than the last one they used, so they can skip
+        work when there is none. Once a preview size is set, every frame also carries a preview made
+        in the capture thread, so the GUI thread neither converts nor resizes frames. Subscribers
+        are called with every frame in the capture thread, for consumers that must not skip any.
+
+        :param src: Device index, file, url or opened source
+        :param width: Requested frame width
+        :param height: Requested frame height
+        :param retry_interval: Wait after a failed read before trying again, s
+        """
         super().__init__(src, width, height)
 
-        self._grabbed, self._frame = self.camera.read()
+        self._retry_interval = retry_interval
+
+        self._condition = Condition()
+        self._latest: Optional[VideoFrame] = None
+        self._sequence = 0
+        self._preview_size: Optional[Tuple[int, int]] = None
+        self._subscribers: Tuple[Callable[[VideoFrame], object], ...] = ()
+
+        self._stopped = Event()
 
-        self._stopped = False
+        # The first frame is read here, so read() has a frame right after construction
+        grabbed, frame = self.camera.read()
+        if grabbed:
+            self._publish(frame)
 
         self._thread = Thread(target=self.update, daemon=False, args=())
 
@@ -46,28 +103,131 @@ class VideoCaptureCVStream(VideoCaptureCV):
         self._thread.start()
         return self
 
+    @property
+    def preview_size(self) -> Optional[Tuple[int, int]]:
+        return self._preview_size
+
+    @preview_size.setter
+    def preview_size(self, size: Optional[Tuple[int, int]]):
+        """
+        Largest (width, height) of the frame previews, used from the next captured frame, None for no previews
+        """
+        self._preview_size = tuple(int(v) for v in size) if size else None
+
+    def add_subscriber(self, callback: Callable[[VideoFrame], object]):
+        """
+        Call back with every frame from now on, starting with the latest one if there is one. The
+        callback runs in the capture thread and must return quickly, like FrameRecorder.add_frame.
+        """
+        with self._condition:
+            self._subscribers += (callback,)
+            if self._latest is not None:
+                callback(self._latest)
+
+    def remove_subscriber(self, callback: Callable[[VideoFrame], object]):
+        with self._condition:
+            self._subscribers = tuple(s for s in self._subscribers if s != callback)
+
+    def _publish(self, frame):
+        timestamp = time.monotonic()
+        preview_size = self._preview_size
+        preview = make_preview(frame, preview_size) if preview_size else None
+        with self._condition:
+            self._sequence += 1
+            self._latest = VideoFrame(frame, self._sequence, timestamp, preview)
+            # Under the condition, so a new subscriber gets the frames in order
+            for callback in self._subscribers:
+                callback(self._latest)
+            self._condition.notify_all()
+
     def update(self):
-        while not self._stopped:
-            self._grabbed, self._frame = self.camera.read()
-        self._grabbed, self._frame = False, None
+        while not self._stopped.is_set():
+            # Blocks until the source has the next frame
+            grabbed, frame = self.camera.read()
+            if grabbed:
+                self._publish(frame)
+            else:
+                # No device or end of the stream, retry without spinning
+                self._stopped.wait(self._retry_interval)
+
+        with self._condition:
+            self._condition.notify_all()
+
+    def latest(self) -> Optional[VideoFrame]:
+        """
+        Last captured frame, None before the first one
+        """
+        with self._condition:
+            return self._latest
+
+    def read_new(self, last_sequence: int, timeout: float = None) -> Optional[VideoFrame]:
+        """
+        Wait for a frame newer than the last one the caller used
+
+        :param last_sequence: Sequence number of the last frame the caller used, 0 for none
+        :param timeout: Longest wait, s, 0 to return at once, None to wait until a frame comes
+        :return: Latest frame, None if no newer frame came in time or the capture was stopped
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._stopped.is_set() or
+                                     (self._latest is not None and self._latest.sequence > last_sequence),
+                                     timeout)
+            if self._latest is None or self._latest.sequence <= last_sequence:
+                return None
+            return self._latest
 
     def read(self):
-        return self._grabbed, self._frame
+        latest = self.latest()
+        return (True, latest.frame) if latest else (False, None)
 
     def stop(self):
-        self._stopped = True
+        self._stopped.set()
         self._thread.join()
+        self.release()
 
 
 if __name__ == "__main__":
-    capture = VideoCaptureCVStream(0)
-    while True:
-        grabbed, frame = capture.read()
-
-        if not grabbed:
-            break
-
-        cv2.imshow("Frame", frame)
-        key = cv2.waitKey(1)
-        if key == ord('q'):
-            capture.stop()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src", type=int, default=None,
+                        help="Capture device to show, previews are timed on a drawn frame if not set")
+    parser.add_argument("--preview-size", type=int, nargs=2, action="append", default=None,
+                        help="Preview width and height to compare with the full frame upload")
+    args = parser.parse_args()
+
+    if args.src is not None:
+        capture = VideoCaptureCVStream(args.src)
+        last_sequence = 0
+        while True:
+            video_frame = capture.read_new(last_sequence, timeout=1.0)
+            if video_frame is None:
+                break
+            last_sequence = video_frame.sequence
+
+            cv2.imshow("Frame", video_frame.frame)
+            key = cv2.waitKey(1)
+            if key == ord('q'):
+                break
+        capture.stop()
+    else:
+        # Work per shown frame: the full frame converted to RGB in the GUI thread, against a preview
+        # made in the capture thread that the GUI uploads as it is
+        frame = np.zeros((720, 1280, 3), np.uint8)
+        cv2.putText(frame, "1", (40, 120), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 4)
+        height, width = frame.shape[:2]
+
+        def mean_time(fn, repeats=100):
+            tic = time.perf_counter()
+            for _ in range(repeats):
+                fn()
+            return (time.perf_counter() - tic) / repeats
+
+        print(f"{'texture':<14} {'GUI thread ms':>13} {'capture thread ms':>17} {'upload KB':>9}")
+        full_time = mean_time(lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        print(f"{f'{width}x{height} RGB':<14} {full_time * 1e3:>13.2f} {0:>17.2f} {frame.nbytes / 1024:>9.0f}")
+        for preview_size in args.preview_size or [(1280, 720), (960, 540), (640, 360), (427, 240)]:
+            preview = make_preview(frame, preview_size)
+            preview_time = mean_time(lambda: make_preview(frame, preview_size))
+            print(f"{f'{preview.shape[1]}x{preview.shape[0]} BGRA':<14} {0:>13.2f} {preview_time * 1e3:>17.2f} "
+                  f"{preview.nbytes / 1024:>9.0f}")
@@ -0,0 +1,334 @@
+"""
+Frame sources for VideoCaptureCVStream, selected by a spec string ``kind[:argument][,key=value...]``
+
+    camera:2                              capture device 2
+    file:clip.mp4                         video file at its own frame rate
+    file:clip.mp4,pace=False,loop=True    as fast as it decodes, from the start again at the end
+    synthetic:fps=60,width=640,height=360 moving textured target on a smooth background
+    shm:fg_frames                         frames written to shared memory by another process
+    mjpeg:http://localhost:8080/screenshot?stream=y    FlightGear's screen over HTTP
+
+Options are split only at the commas that start a ``key=value`` option, so the argument may hold
+other commas, like paths and urls do. An argument that itself holds ``,key=`` is quoted:
+
+    file:"takes,pace=2.mp4",loop=True
+
+Another process feeds a shared-memory source with SharedMemoryFrameWriter, or from any other source:
+
+    python -m app.core.video_sources feed fg_frames file:clip.mp4
+"""
+import ast
+import re
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict
+
+import cv2
+import numpy as np
+
+from .mjpeg_source import MjpegVideoSource
+from .video_capture import VideoCaptureBase, VideoCaptureCV, VideoCaptureCVStream
+
+
+class FileVideoSource(VideoCaptureBase):
+    def __init__(self, path: str, pace=True, loop=False, fps: float = None):
+        """
+        :param path: Video file
+        :param pace: Deliver frames at the file frame rate, as fast as they decode otherwise
+        :param loop: Start from the beginning at the end of the file
+        :param fps: Frame rate of the pacing, the file frame rate if not set
+        """
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise IOError(f"Can not open video file {path}")
+
+        self._pace = pace
+        self._loop = loop
+        self._interval = 1 / (fps or self._capture.get(cv2.CAP_PROP_FPS) or 30)
+        self._start_time = None
+        self._frames = 0
+
+    def read(self) -> tuple:
+        grabbed, frame = self._capture.read()
+        if not grabbed and self._loop:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            grabbed, frame = self._capture.read()
+        if not grabbed:
+            return False, None
+
+        if self._pace:
+            # Frames are due on a fixed schedule from the first one, so sleep errors do not add up
+            now = time.monotonic()
+            if self._start_time is None:
+                self._start_time = now
+            due = self._start_time + self._frames * self._interval
+            if due > now:
+                time.sleep(due - now)
+        self._frames += 1
+
+        return True, frame
+
+    def release(self):
+        self._capture.release()
+
+
+class SyntheticVideoSource(VideoCaptureBase):
+    def __init__(self, width=1280, height=720, fps=30.0, pace=True, seed=0):
+        """
+        Textured target moving along a Lissajous path over a smooth background. Frames depend only
+        on their number and the seed.
+
+        :param width: Frame width
+        :param height: Frame height
+        :param fps: Frame rate, also sets the target speed per frame
+        :param pace: Deliver frames at fps, as fast as they are drawn otherwise
+        :param seed: Random seed of the textures
+        """
+        rng = np.random.default_rng(seed)
+        self._background = cv2.GaussianBlur((rng.random((height, width, 3)) * 255).astype(np.uint8), (0, 0), 8)
+        self._target = (rng.random((48, 64, 3)) * 255).astype(np.uint8)
+
+        self._fps = fps
+        self._pace = pace
+        self._start_time = None
+        self._frames = 0
+
+        self.target_bbox = None  # Target (x, y, w, h) on the last frame
+
+    def bbox(self, frame_number):
+        height, width = self._background.shape[:2]
+        target_height, target_width = self._target.shape[:2]
+        t = frame_number / self._fps
+        cx = width / 2 + width * 0.3 * np.sin(t * 0.75)
+        cy = height / 2 + height * 0.3 * np.sin(t * 1.2)
+        return int(cx - target_width / 2), int(cy - target_height / 2), target_width, target_height
+
+    def read(self) -> tuple:
+        if self._pace:
+            now = time.monotonic()
+            if self._start_time is None:
+                self._start_time = now
+            due = self._start_time + self._frames / self._fps
+            if due > now:
+                time.sleep(due - now)
+
+        x, y, w, h = self.target_bbox = self.bbox(self._frames)
+        frame = self._background.copy()
+        frame[y:y + h, x:x + w] = self._target
+        self._frames += 1
+
+        return True, frame
+
+    def release(self):
+        pass
+
+
+# Header of a shared frame: version, height, width, channels. The version is odd while a frame is written.
+_HEADER_SIZE = 4 * 8
+
+
+class SharedMemoryFrameWriter:
+    def __init__(self, name: str, frame_shape):
+        """
+        Named shared memory holding the last frame, read by SharedMemoryVideoSource in other processes
+
+        :param name: Shared memory name
+        :param frame_shape: Shape of the uint8 frames
+        """
+        self._shm = SharedMemory(name, create=True, size=_HEADER_SIZE + int(np.prod(frame_shape)))
+        self._header = np.ndarray(4, np.uint64, self._shm.buf)
+        self._frame = np.ndarray(frame_shape, np.uint8, self._shm.buf, _HEADER_SIZE)
+        self._header[:] = 0, *frame_shape
+
+    def write(self, frame: np.ndarray):
+        assert frame.shape == self._frame.shape, f"Frame shape {frame.shape} does not fit {self._frame.shape}"
+        self._header[0] += 1
+        np.copyto(self._frame, frame)
+        self._header[0] += 1
+
+    def close(self):
+        del self._header, self._frame
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedMemoryVideoSource(VideoCaptureBase):
+    def __init__(self, name: str, timeout=1.0, poll_interval=0.001):
+        """
+        Frames written by a SharedMemoryFrameWriter in another process
+
+        :param name: Shared memory name
+        :param timeout: Longest wait for a new frame before a read fails, s
+        :param poll_interval: Interval of checking for a new frame, s
+        """
+        self._shm = SharedMemory(name)
+        # The writer owns the memory, the reader must not unlink it at exit
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        self._header = np.ndarray(4, np.uint64, self._shm.buf)
+        frame_shape = tuple(int(v) for v in self._header[1:])
+        self._frame = np.ndarray(frame_shape, np.uint8, self._shm.buf, _HEADER_SIZE)
+
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._last_version = 0
+
+    def read(self) -> tuple:
+        deadline = time.monotonic() + self._timeout
+        while time.monotonic() < deadline:
+            version = int(self._header[0])
+            if version % 2 == 0 and version > self._last_version:
+                frame = self._frame.copy()
+                # Taken again if the writer started the next frame during the copy
+                if int(self._header[0]) == version:
+                    self._last_version = version
+                    return True, frame
+                continue
+            time.sleep(self._poll_interval)
+        return False, None
+
+    def release(self):
+        del self._header, self._frame
+        self._shm.close()
+
+
+VIDEO_SOURCES: Dict[str, Callable[..., VideoCaptureBase]] = {
+    "camera": VideoCaptureCV,
+    "file": FileVideoSource,
+    "synthetic": SyntheticVideoSource,
+    "shm": SharedMemoryVideoSource,
+    "mjpeg": MjpegVideoSource,
+}
+
+
+def register_video_source(kind: str, factory: Callable[..., VideoCaptureBase]):
+    VIDEO_SOURCES[kind] = factory
+
+
+def _parse_value(value: str):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+_KEY = re.compile(r"[A-Za-z_]\w*=")
+# Commas that start a key=value option
+_OPTION_SEPARATOR = re.compile(r",(?=[A-Za-z_]\w*=)")
+_QUOTED_ARGUMENT = re.compile(r"""("[^"]*"|'[^']*')(,|$)""")
+
+
+def parse_video_source(spec: str):
+    """
+    :param spec: ``kind[:argument][,key=value...]``, see the module docstring
+    :return: Kind, positional arguments and keyword arguments of the source
+    """
+    kind, _, options = spec.partition(":")
+
+    args, kwargs = [], {}
+    quoted = _QUOTED_ARGUMENT.match(options)
+    if quoted:
+        args.append(ast.literal_eval(quoted.group(1)))
+        options = options[quoted.end():]
+
+    for option in filter(None, _OPTION_SEPARATOR.split(options)):
+        # key=value options, anything else is the positional argument, commas included
+        if _KEY.match(option):
+            key, _, value = option.partition("=")
+            kwargs[key] = _parse_value(value)
+        else:
+            args.append(_parse_value(option))
+
+    return kind, args, kwargs
+
+
+def create_video_source(spec: str) -> VideoCaptureBase:
+    """
+    :param spec: ``kind[:argument][,key=value...]``, see the module docstring
+    """
+    kind, args, kwargs = parse_video_source(spec)
+    if kind not in VIDEO_SOURCES:
+        raise ValueError(f"Unknown video source {kind}, one of {', '.join(VIDEO_SOURCES)}")
+
+    return VIDEO_SOURCES[kind](*args, **kwargs)
+
+
+def create_video_capture(spec: str) -> VideoCaptureCVStream:
+    """
+    Capture thread over the source of the spec
+    """
+    return VideoCaptureCVStream(create_video_source(spec))
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocess as mp
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    feed_parser = subparsers.add_parser("feed", help="Write frames of a source to shared memory")
+    feed_parser.add_argument("name", type=str, help="Shared memory name")
+    feed_parser.add_argument("source", type=str, help="Source spec")
+
+    bench_parser = subparsers.add_parser("bench", help="Throughput of sources through the capture thread")
+    bench_parser.add_argument("--source", type=str, action="append", default=[], help="Source spec")
+    bench_parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    def feed(name, spec, frames=None):
+        source = create_video_source(spec)
+        writer = None
+        try:
+            while frames is None or frames > 0:
+                grabbed, frame = source.read()
+                if not grabbed:
+                    break
+                if writer is None:
+                    writer = SharedMemoryFrameWriter(name, frame.shape)
+                writer.write(frame)
+                if frames is not None:
+                    frames -= 1
+            # Readers get the last frame before the memory goes away
+            time.sleep(0.5)
+        finally:
+            source.release()
+            if writer:
+                writer.close()
+
+    if args.command == "feed":
+        feed(args.name, args.source)
+    else:
+        specs = args.source or ["synthetic", "synthetic:pace=False", "shm:bench_frames"]
+        print(f"{'source':<28} {'FPS':>7} {'frame interval std ms':>22} {'skipped':>8}")
+        for spec in specs:
+            feeder = None
+            if spec.startswith("shm:"):
+                # Fed by a synthetic source at 60 FPS in another process
+                feeder = mp.Process(target=feed, args=(spec[4:], "synthetic:fps=60", int(args.seconds * 60 + 120)))
+                feeder.start()
+                for _ in range(100):
+                    try:
+                        SharedMemory(spec[4:]).close()
+                        break
+                    except FileNotFoundError:
+                        time.sleep(0.05)
+
+            capture = create_video_capture(spec)
+            last_sequence, timestamps, handled = 0, [], 0
+            tic = time.monotonic()
+            while time.monotonic() - tic < args.seconds:
+                video_frame = capture.read_new(last_sequence, timeout=1.0)
+                if video_frame is None:
+                    break
+                handled += 1
+                last_sequence = video_frame.sequence
+                timestamps.append(video_frame.timestamp)
+            capture.stop()
+            if feeder:
+                feeder.join()
+
+            intervals = np.diff(timestamps)
+            print(f"{spec:<28} {len(intervals) / (timestamps[-1] - timestamps[0]):>7.1f} "
+                  f"{np.std(intervals) * 1e3:>22.2f} {last_sequence - handled:>8}")
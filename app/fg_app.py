@@ -1,20 +1,23 @@
 from typing import Optional
 
-import cv2
-
 import glfw
 import imgui
 
-from app.core import VideoCaptureCVStream
-from app.core.tracker import TargetManager
+from app.core import VideoFrame, create_video_capture, make_preview, FrameRecorder, TelemetrySampler
+from app.core.tracker import TargetManager, ScheduledTargetManager, TrackingWorker, ProcessTargetManager
 
 from app.core.autopilot import Port
 from app.core.autopilot.fg_controller import FGController
+from app.core.autopilot.fg_simulator import FGSimulator
 
 from app.core.autopilot.fg_brain import BrainBase
+from app.core.autopilot.fg_brain import StorageBrain
 from app.core.autopilot.fg_brain import ManualBrain
 from app.core.autopilot.fg_brain import AutopilotBrain
 from app.core.autopilot.fg_brain import TrackingAutopilotBrain
+from app.core.autopilot.fg_brain import NavigationBrain
+from app.core.autopilot.fg_navigation import Route
+from app.core.autopilot.fg_gain_schedule import load_gain_schedules
 
 from app.gui import ImGuiApp
 
@@ -24,23 +27,47 @@ from app.gui.objects.windows.image_windows import TrackerImageWindow
 
 
 class FGApp(ImGuiApp):
-    def __init__(self, window_width, window_height, fullscreen):
+    def __init__(self, window_width, window_height, fullscreen, route_file=None, gain_schedule_file=None,
+                 external_fdm=False, tracker_process=False, tracker_scheduling=False, video_source="camera:2",
+                 record_path=None):
         super().__init__(window_width, window_height, fullscreen)
 
-        self._video_capture = VideoCaptureCVStream(src=2)
+        self._external_fdm = external_fdm
+        self._tracker_process = tracker_process
+        self._tracker_scheduling = tracker_scheduling
+
+        # See app.core.video_sources for the source specs
+        self._video_capture = create_video_capture(video_source)
 
-        #self._target_manager = TargetManager()
+        # Created with the first tracking connection, the tracker models are loaded only when needed
+        self._tracking_worker: Optional[TrackingWorker] = None
+        self._last_frame_sequence = 0
         self._is_tracking = False
 
         self._brains = {
             BrainBase.BrainType.MANUAL: ManualBrain(),
             BrainBase.BrainType.AUTOPILOT: AutopilotBrain(),
-            BrainBase.BrainType.TRACKING: TrackingAutopilotBrain()
+            BrainBase.BrainType.TRACKING: TrackingAutopilotBrain(),
+            BrainBase.BrainType.NAVIGATION: NavigationBrain(Route.from_file(route_file) if route_file else None)
         }
         self._brain = BrainBase()
 
+        if gain_schedule_file:
+            gain_schedules = load_gain_schedules(gain_schedule_file)
+            for brain_type in (BrainBase.BrainType.AUTOPILOT, BrainBase.BrainType.NAVIGATION):
+                self._brains[brain_type].set_gain_schedules(gain_schedules)
+                self._brains[brain_type].set_gain_scheduling(True)
+
         self._controller: Optional[FGController] = None
 
+        # Frames and telemetry are recorded from the start, telemetry is sampled once connected
+        self._recorder = FrameRecorder(record_path, StorageBrain.TELEMETRY_FIELDS + FGController.STATUS_FIELDS) \
+            if record_path else None
+        if self._recorder:
+            # Every captured frame is recorded, not only the ones the GUI gets to show
+            self._video_capture.add_subscriber(self._recorder.add_frame)
+        self._telemetry_sampler: Optional[TelemetrySampler] = None
+
         self._settings_window = UserWindow(self._on_connect_clicked, self._on_stop_clicked, self._on_brain_changed)
 
         self._image_window = ZoomImageWindow()
@@ -50,9 +77,17 @@ class FGApp(ImGuiApp):
 
         self._video_capture.stop()
 
+        if self._tracking_worker:
+            self._tracking_worker.stop()
+
         if self._controller:
             self._controller.stop()
 
+        if self._telemetry_sampler:
+            self._telemetry_sampler.stop()
+        if self._recorder:
+            self._recorder.stop()
+
     def _on_connect_clicked(self,
                             host: str,
                             fdm_out_port: int, fdm_in_port: int,
@@ -64,18 +99,37 @@ class FGApp(ImGuiApp):
         if self._controller:
             self._controller.stop()
 
-        self._controller = FGController(self._brain)
+        self._controller = FGSimulator(self._brain) if self._external_fdm else FGController(self._brain)
         self._controller.connect(host=host,
                                  fdm_port=Port(fdm_out_port, fdm_in_port),
                                  ctrls_port=Port(ctrls_out_port, ctrls_in_port),
                                  disconnect_callback=self._disconnect_callback)
         self._controller.start()
 
+        if self._recorder:
+            if self._telemetry_sampler:
+                self._telemetry_sampler.stop()
+            self._telemetry_sampler = TelemetrySampler(self._recorder,
+                                                       [self._brain.telemetry_block, self._controller.status_block])
+
         if isinstance(self._brain, TrackingAutopilotBrain):
+            if self._tracking_worker is None:
+                self._tracking_worker = TrackingWorker(self._create_target_manager())
             self._image_window = TrackerImageWindow(self._on_roi_selected)
         else:
             self._image_window = ZoomImageWindow()
             
+    def _create_target_manager(self):
+        if self._tracker_process:
+            # Ring slots are sized by the current capture frames
+            grabbed, frame = self._video_capture.read()
+            target_manager = ProcessTargetManager(frame.shape if grabbed else (720, 1280, 3))
+        else:
+            target_manager = TargetManager()
+
+        # Skipping confident frames is opt-in, by default every frame the worker takes is inferred
+        return ScheduledTargetManager(target_manager) if self._tracker_scheduling else target_manager
+
     def _disconnect_callback(self, disconnect):
         if disconnect:
             print("=====================+NO CONNECTION==========================")
@@ -97,28 +151,50 @@ class FGApp(ImGuiApp):
 
         grabbed, frame = self._video_capture.read()
         if grabbed:
-            self._target_manager.init_tracker(frame, selected_roi)
-            self._brain.set_target_location(self._target_manager.target_location)
+            self._tracking_worker.init_tracker(frame, selected_roi)
+            self._brain.set_target_location(TargetManager.image_target_location(frame))
 
-    def _update_target_manager(self, frame):
-        if not isinstance(self._brain, TrackingAutopilotBrain):
+    def _update_target_manager(self, video_frame: Optional[VideoFrame]):
+        if not isinstance(self._brain, TrackingAutopilotBrain) or self._tracking_worker is None:
+            return
+
+        if not self._tracking_worker.is_tracker_initialized:
+            if self._is_tracking:
+                # The tracker failed, see the tracking stats, the target has to be selected again
+                self._is_tracking = False
+                self._brain.set_object_bbox(None)
+                self._image_window.set_bbox_color(self._image_window.DEFAULT_BBOX_COLOR)
             return
 
-        if self._target_manager.is_tracker_initialized:
-            score, roi = self._target_manager.update_tracker(frame)
+        # Results of earlier frames are still polled when there is no new frame
+        if video_frame is not None:
+            self._tracking_worker.submit(video_frame.frame, frame_id=video_frame.sequence,
+                                         timestamp=video_frame.timestamp)
 
-            if score < 0.6 and self._is_tracking:
-                self._toggle_tracking()
-                return
+        result = self._tracking_worker.poll()
+        if result is None:
+            return
 
+        if result.is_target_lost:
+            # The target manager searches the whole frame for the target meanwhile
             if self._is_tracking:
-                self._brain.set_object_bbox(roi)
+                self._brain.set_object_bbox(None)
+                self._image_window.set_bbox_color(self._image_window.DEFAULT_BBOX_COLOR)
+            return
+
+        if self._is_tracking:
+            self._brain.set_object_bbox(result.roi)
+            self._image_window.set_bbox_color(self._image_window.TRACKING_BBOX_COLOR)
 
-            self._image_window.selected_roi = roi
+        self._image_window.selected_roi = result.roi
 
-    def _update_image_window(self, frame):
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        self._image_window.upload_image(rgb_frame)
+    def _update_image_window(self, video_frame: VideoFrame):
+        # The capture thread makes the preview once the window has set its size, the full frame
+        # stays for the tracker and the recorder
+        preview = video_frame.preview
+        if preview is None:
+            preview = make_preview(video_frame.frame, self._image_window.preview_size)
+        self._image_window.upload_image(preview, video_frame.frame.shape)
 
     def _toggle_tracking(self):
         if not isinstance(self._brain, TrackingAutopilotBrain):
@@ -126,7 +202,7 @@ class FGApp(ImGuiApp):
         if not isinstance(self._image_window, TrackerImageWindow):
             return
 
-        if self._target_manager.is_tracker_initialized:
+        if self._tracking_worker and self._tracking_worker.is_tracker_initialized:
             self._is_tracking = not self._is_tracking
 
             if self._is_tracking:
@@ -145,7 +221,8 @@ class FGApp(ImGuiApp):
 
         self._is_tracking = False
 
-        self._target_manager.reset_tracker()
+        if self._tracking_worker:
+            self._tracking_worker.reset_tracker()
 
         self._brain.set_object_bbox(None)
 
@@ -168,13 +245,20 @@ class FGApp(ImGuiApp):
         self._image_window.size = imgui.Vec2(display_size[0] * image_window_width_scale, display_size[1])
         self._settings_window.position = imgui.Vec2(display_size[0] * image_window_width_scale, 0)
         self._settings_window.size = imgui.Vec2(display_size[0] * (1 - image_window_width_scale), display_size[1])
-
-        grabbed, frame = self._video_capture.read()
-        if grabbed:
-            #self._update_target_manager(frame)
-            self._update_image_window(frame)
+        self._video_capture.preview_size = self._image_window.preview_size
+
+        # Nothing to convert or upload until the capture thread has a new frame
+        video_frame = self._video_capture.read_new(self._last_frame_sequence, timeout=0)
+        if video_frame is not None:
+            self._last_frame_sequence = video_frame.sequence
+            self._update_image_window(video_frame)
+        self._update_target_manager(video_frame)
         self._image_window.draw()
 
+        if self._controller:
+            self._settings_window.set_watchdog_stats(self._controller.watchdog_stats)
+        if self._tracking_worker:
+            self._settings_window.set_tracking_stats(self._tracking_worker.stats)
         self._settings_window.draw()
 
 
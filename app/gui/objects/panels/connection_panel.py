@@ -18,10 +18,19 @@ class ConnectionPanel(Panel):
         self._available_brains_types = [e.value for e in BrainBase.BrainType]
         self._selected_brain_idx = 0
 
+        self._watchdog_stats = None
+        self._tracking_stats = None
+
         self._on_connect_callback = on_connect_callback
         self._on_stop_callback = on_stop_callback
         self._on_brain_changed_callback = on_brain_changed
 
+    def set_watchdog_stats(self, watchdog_stats):
+        self._watchdog_stats = watchdog_stats
+
+    def set_tracking_stats(self, tracking_stats):
+        self._tracking_stats = tracking_stats
+
     def _draw_host_input(self):
         imgui.text("Host")
         imgui.push_item_width(-1)
@@ -72,6 +81,26 @@ class ConnectionPanel(Panel):
         if imgui.button("Stop", button_width):
             self._on_stop_callback()
 
+    def _draw_watchdog_stats(self):
+        stats = self._watchdog_stats
+
+        if stats.is_failsafe:
+            imgui.text_colored("FAILSAFE", 1.0, 0.2, 0.2)
+        imgui.text(f"FDM age: {stats.fdm_age_s * 1000:.0f} ms, ctrls age: {stats.ctrls_age_s * 1000:.0f} ms")
+        imgui.text(f"Timeouts: FDM {stats.fdm_timeouts}, ctrls {stats.ctrls_timeouts}")
+        imgui.text(f"Late frames: {stats.late_frames}, failsafe packets: {stats.failsafe_transmissions}")
+        imgui.text(f"Recoveries: {stats.recoveries} (last {stats.last_recovery_s:.2f} s, "
+                   f"max {stats.max_recovery_s:.2f} s)")
+
+    def _draw_tracking_stats(self):
+        stats = self._tracking_stats
+
+        imgui.text(f"GUI: {imgui.get_io().framerate:.0f} FPS, tracker: {stats.inference_fps:.1f} FPS")
+        imgui.text(f"Tracker latency: {stats.last_latency * 1000:.0f} ms")
+        imgui.text(f"Tracked frames: {stats.processed_frames}, dropped {stats.dropped_frames}")
+        if stats.failures:
+            imgui.text(f"Tracker failures: {stats.failures}, last {stats.last_error}")
+
     def _draw_content(self):
         # Host
         self._draw_host_input()
@@ -92,3 +121,13 @@ class ConnectionPanel(Panel):
 
         # Buttons
         self._draw_buttons()
+
+        # Watchdog
+        if self._watchdog_stats:
+            imgui.dummy(0, 2)
+            self._draw_watchdog_stats()
+
+        # Tracker
+        if self._tracking_stats:
+            imgui.dummy(0, 2)
+            self._draw_tracking_stats()
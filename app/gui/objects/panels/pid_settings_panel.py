@@ -5,14 +5,21 @@ from .panel import Panel
 
 
 class PIDSettingsPanel(Panel):
-    def __init__(self, on_changed_callback: callable):
+    def __init__(self, on_changed_callback: callable,
+                 on_gain_scheduling_toggled: callable = None, on_gain_schedule_changed: callable = None):
         super().__init__(name="PID Controller")
 
         self._pitch_pid_c = PIDControllerCoefficient(0.1, 0.005, 0.001)
         self._yaw_pid_c = PIDControllerCoefficient(0.1, 0, 0)
         self._roll_pid_c = PIDControllerCoefficient(0.05, 0.005, 0.001)
 
+        self._gain_schedules = {}
+        self._is_gain_scheduling = False
+        self._operating_point = (0, 0, 0)
+
         self._on_changed_callback = on_changed_callback
+        self._on_gain_scheduling_toggled = on_gain_scheduling_toggled
+        self._on_gain_schedule_changed = on_gain_schedule_changed
 
     # TODO: Set by type
     def set_pitch_pid_c(self, pid_c: PIDControllerCoefficient):
@@ -24,6 +31,13 @@ class PIDSettingsPanel(Panel):
     def set_roll_pid_c(self, pid_c: PIDControllerCoefficient):
         self._roll_pid_c = pid_c
 
+    def set_gain_schedules(self, gain_schedules: dict, is_gain_scheduling: bool):
+        self._gain_schedules = gain_schedules
+        self._is_gain_scheduling = is_gain_scheduling
+
+    def set_operating_point(self, vcas, alt, alpha):
+        self._operating_point = (vcas, alt, alpha)
+
     @staticmethod
     def _draw_pid_coefficients(pid_name, pid_c):
         imgui.text(f"{pid_name} PID (Kp, Ki, Kd)")
@@ -36,6 +50,30 @@ class PIDSettingsPanel(Panel):
 
         return pitch_changed, pid_c
 
+    def _draw_gain_schedules(self):
+        changed, self._is_gain_scheduling = imgui.checkbox("Gain scheduling", self._is_gain_scheduling)
+        if changed and self._on_gain_scheduling_toggled:
+            self._on_gain_scheduling_toggled(self._is_gain_scheduling)
+
+        if not self._is_gain_scheduling:
+            return
+
+        vcas, alt, _ = self._operating_point
+        imgui.text(f"Airspeed {vcas:.0f} kt, altitude {alt:.0f} m")
+
+        # Edit the grid node nearest to the current operating point
+        for axis, schedule in self._gain_schedules.items():
+            node = schedule.nearest_node(*self._operating_point)
+            node_vcas, node_alt, _ = schedule.node_point(node)
+
+            imgui.push_id(f"schedule_{axis}")
+            changed, pid_c = self._draw_pid_coefficients(f"{axis.capitalize()} @ {node_vcas:.0f} kt, {node_alt:.0f} m",
+                                                         schedule.node_gains(node))
+            imgui.pop_id()
+
+            if changed and self._on_gain_schedule_changed:
+                self._on_gain_schedule_changed(axis, node, pid_c)
+
     def _draw_content(self):
         pitch_changed, self._pitch_pid_c = self._draw_pid_coefficients("Pitch", self._pitch_pid_c)
         yaw_changed, self._yaw_pid_c = self._draw_pid_coefficients("Yaw", self._yaw_pid_c)
@@ -43,3 +81,7 @@ class PIDSettingsPanel(Panel):
 
         if pitch_changed or yaw_changed or roll_changed:
             self._on_changed_callback(self._pitch_pid_c, self._yaw_pid_c, self._roll_pid_c)
+
+        if self._gain_schedules:
+            imgui.dummy(0, 2)
+            self._draw_gain_schedules()
@@ -24,7 +24,9 @@ class UserWindow(Window):
 
         self._connection_panel = ConnectionPanel(on_connect_callback, on_stop_callback, on_brain_changed)
         self._autopilot_settings_panel = AutopilotSettingsPanel(self._on_autopilot_settings_changed)
-        self._pid_settings_panel = PIDSettingsPanel(self._on_pid_controller_change)
+        self._pid_settings_panel = PIDSettingsPanel(self._on_pid_controller_change,
+                                                    self._on_gain_scheduling_toggled,
+                                                    self._on_gain_schedule_change)
 
         self._oscilloscope_panel = OscilloscopePanel()
 
@@ -40,6 +42,13 @@ class UserWindow(Window):
             self._pid_settings_panel.set_pitch_pid_c(self._brain.pitch_pid_c)
             self._pid_settings_panel.set_yaw_pid_c(self._brain.yaw_pid_c)
             self._pid_settings_panel.set_roll_pid_c(self._brain.roll_pid_c)
+            self._pid_settings_panel.set_gain_schedules(self._brain.gain_schedules, self._brain.is_gain_scheduling)
+
+    def set_watchdog_stats(self, watchdog_stats):
+        self._connection_panel.set_watchdog_stats(watchdog_stats)
+
+    def set_tracking_stats(self, tracking_stats):
+        self._connection_panel.set_tracking_stats(tracking_stats)
 
     def _set_show_oscilloscope_window(self, is_show):
         self._is_show_oscilloscope_window = is_show
@@ -63,6 +72,14 @@ class UserWindow(Window):
             self._brain.yaw_pid_c = yaw_pid_c
             self._brain.roll_pid_c = roll_pid_c
 
+    def _on_gain_scheduling_toggled(self, enabled):
+        if isinstance(self._brain, PilotBrain):
+            self._brain.set_gain_scheduling(enabled)
+
+    def _on_gain_schedule_change(self, axis, node, pid_c):
+        if isinstance(self._brain, PilotBrain):
+            self._brain.gain_schedules[axis].set_node_gains(node, pid_c)
+
     def _begin_window(self):
         imgui.set_next_window_position(self.position.x, self.position.y, imgui.ALWAYS)
         imgui.set_next_window_size(self.size.x, self.size.y)
@@ -82,6 +99,7 @@ class UserWindow(Window):
         imgui.dummy(0, 4)
 
         if isinstance(self._brain, PilotBrain):
+            self._pid_settings_panel.set_operating_point(self._brain.vcas, self._brain.alt, self._brain.alpha)
             self._pid_settings_panel.draw()
 
             imgui.dummy(0, 4)
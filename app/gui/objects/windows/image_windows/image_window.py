@@ -8,6 +8,9 @@ from app.gui.utils import ImTex
 
 
 class ImageWindow(Window):
+    # Pixel buffers of the asynchronous texture uploads, 0 uploads straight from the image
+    TEXTURE_STREAM_BUFFERS = 2
+
     def __init__(self, x=0, y=0):
         super().__init__(x=x, y=y)
 
@@ -21,6 +24,11 @@ class ImageWindow(Window):
         self._uv1: imgui.Vec2 = imgui.Vec2(1, 1)
 
         self._image_texture = ImTex(1, 1)
+        self._texture_format = ImTex.TexFormat.RGB
+
+        # Size of the image the texture shows, the texture may be a smaller preview of it.
+        # Image coordinates of the window are in this size.
+        self._source_size: imgui.Vec2 = imgui.Vec2(1, 1)
 
     @property
     def _texture_width(self):
@@ -30,16 +38,32 @@ class ImageWindow(Window):
     def _texture_height(self):
         return self._image_texture.get_size().y
 
+    @property
+    def _source_width(self):
+        return self._source_size.x
+
+    @property
+    def _source_height(self):
+        return self._source_size.y
+
+    @property
+    def preview_size(self) -> tuple[int, int]:
+        """
+        Texture size in pixels that shows the image at full detail in the window
+        """
+        fb_scale = imgui.get_io().display_fb_scale
+        return max(1, round(self.size.x * fb_scale.x)), max(1, round(self.size.y * fb_scale.y))
+
     @staticmethod
     def _uv_size(window: ImageWindow) -> imgui.Vec2:
-        uv_width = window._texture_width * (window._uv1[0] - window._uv0[0])
-        uv_height = window._texture_height * (window._uv1[1] - window._uv0[1])
+        uv_width = window._source_width * (window._uv1[0] - window._uv0[0])
+        uv_height = window._source_height * (window._uv1[1] - window._uv0[1])
         return imgui.Vec2(uv_width, uv_height)
 
     @staticmethod
     def _uv_offset(window: ImageWindow) -> imgui.Vec2:
-        uv_offset_x = window._uv0[0] * window._texture_width
-        uv_offset_y = window._uv0[1] * window._texture_height
+        uv_offset_x = window._uv0[0] * window._source_width
+        uv_offset_y = window._uv0[1] * window._source_height
         return imgui.Vec2(uv_offset_x, uv_offset_y)
 
     @staticmethod
@@ -68,16 +92,31 @@ class ImageWindow(Window):
         window_position = ImageWindow.image2window(window, image_x, image_y)
         return Window.window2screen(window, window_position.x, window_position.y)
 
-    def upload_image(self, image):
+    def upload_image(self, image, source_shape=None):
+        """
+        :param image: RGB image, or a BGRA preview
+        :param source_shape: Shape of the image the preview was made from, the image shape if not set
+        """
+        source_shape = source_shape or image.shape
+        self._source_size = imgui.Vec2(source_shape[1], source_shape[0])
         self._init_texture(image)
 
     def _init_texture(self, image):
-        if image.shape[1] != self._texture_width or image.shape[0] != self._texture_height:
+        assert image.shape[2] in (3, 4)
+        tex_format = ImTex.TexFormat.RGB if image.shape[2] == 3 else ImTex.TexFormat.BGRA
+
+        if image.shape[1] != self._texture_width or image.shape[0] != self._texture_height or \
+                tex_format != self._texture_format:
             self._image_texture.release_tex_id()
-            self._image_texture = ImTex(image.shape[1], image.shape[0])
-            assert image.shape[2] == 3
+            stream_buffers = 0 if ImTex.is_software_renderer() else self.TEXTURE_STREAM_BUFFERS
+            if tex_format == ImTex.TexFormat.RGB:
+                self._image_texture = ImTex(image.shape[1], image.shape[0], stream_buffers=stream_buffers)
+            else:
+                self._image_texture = ImTex(image.shape[1], image.shape[0], ImTex.TexFormat.RGBA, tex_format,
+                                            stream_buffers=stream_buffers)
+            self._texture_format = tex_format
 
-        self._image_texture.upload_data(image.data)
+        self._image_texture.upload_data(image.data, tex_format)
 
     def _begin_window(self):
         imgui.set_next_window_position(self.position.x, self.position.y, imgui.ALWAYS)
@@ -97,11 +136,11 @@ class ImageWindow(Window):
         imgui.pop_style_var(2)
 
     def _draw_content(self):
-        aspect_ratio_x = self.size.x / self._texture_width
-        aspect_ratio_y = self.size.y / self._texture_height
+        aspect_ratio_x = self.size.x / self._source_width
+        aspect_ratio_y = self.size.y / self._source_height
 
-        self._image_width = self._texture_width * min(aspect_ratio_x, aspect_ratio_y)
-        self._image_height = self._texture_height * min(aspect_ratio_x, aspect_ratio_y)
+        self._image_width = self._source_width * min(aspect_ratio_x, aspect_ratio_y)
+        self._image_height = self._source_height * min(aspect_ratio_x, aspect_ratio_y)
 
         self._image_pos_x = self.size.x / 2 - self._image_width / 2
         self._image_pos_y = self.size.y / 2 - self._image_height / 2
@@ -84,7 +84,7 @@ class TrackerImageWindow(ZoomImageWindow):
         draw_list.add_rect(p1.x, p1.y, p2.x, p2.y, foreground_color, thickness=1)
         draw_list.add_rect_filled(p1.x, p1.y, p2.x, p2.y, background_color)
 
-        image_center = self.image2screen(self, self._texture_width / 2, self._texture_height / 2)
+        image_center = self.image2screen(self, self._source_width / 2, self._source_height / 2)
         draw_list.add_line((p1.x + p2.x) / 2, (p1.y + p2.y) / 2,
                            image_center.x, image_center.y,
                            foreground_color, thickness=1)
@@ -54,8 +54,8 @@ class ZoomImageWindow(ImageWindow):
         anchor_pos_screen = imgui.get_mouse_pos()
         anchor_pos_texture = self.screen2image(self, anchor_pos_screen.x, anchor_pos_screen.y)
 
-        anchor_pos_texture_plane = imgui.Vec2(anchor_pos_texture.x / self._texture_width,
-                                              anchor_pos_texture.y / self._texture_height)
+        anchor_pos_texture_plane = imgui.Vec2(anchor_pos_texture.x / self._source_width,
+                                              anchor_pos_texture.y / self._source_height)
 
         anchor_pos_uv_plane = imgui.Vec2((anchor_pos_texture_plane[0] - self._uv0[0]) / (self._uv1[0] - self._uv0[0]),
                                          (anchor_pos_texture_plane[1] - self._uv0[1]) / (self._uv1[1] - self._uv0[1]))
@@ -73,6 +73,12 @@ class ZoomImageWindow(ImageWindow):
 
         self.__clip_uv()
 
+    @property
+    def preview_size(self) -> tuple[int, int]:
+        # A zoomed in view shows a part of the texture over the whole window
+        width, height = super().preview_size
+        return round(width * self._current_scale), round(height * self._current_scale)
+
     def _draw_content(self):
         super()._draw_content()
 
@@ -1,6 +1,10 @@
+import ctypes
 import enum
+from typing import Optional
 
+import numpy as np
 import OpenGL.GL as gl
+from OpenGL.error import GLError
 
 import imgui
 
@@ -13,8 +17,13 @@ class ImTex:
         BGRA = gl.GL_BGRA
 
     def __init__(self, width: int, height: int,
-                 src_format: TexFormat = TexFormat.RGB, dst_format: TexFormat = TexFormat.RGB, data=None):
-
+                 src_format: TexFormat = TexFormat.RGB, dst_format: TexFormat = TexFormat.RGB, data=None,
+                 stream_buffers=0, persistent_mapping: Optional[bool] = None):
+        """
+        :param stream_buffers: Pixel buffer objects the uploads go through, 2 or 3 for asynchronous
+            uploads, 0 to upload straight from client memory
+        :param persistent_mapping: Keep the pixel buffers mapped, where the driver supports it if not set
+        """
         self.__tex_size: imgui.Vec2 = imgui.Vec2(width, height)
 
         self.__tex_id: gl.GLuint64 = gl.glGenTextures(1)
@@ -28,13 +37,48 @@ class ImTex:
 
         self.check_errors()
 
+        self.__stream: Optional[_PixelBufferRing] = None
+        if stream_buffers:
+            try:
+                # Four bytes per pixel fit every upload format
+                self.__stream = _PixelBufferRing(stream_buffers, width * height * 4, persistent_mapping)
+            except (GLError, ValueError, MemoryError) as e:
+                print(f"[WARNING] Texture streaming is not available, uploading from client memory: {e}")
+
+    @property
+    def is_streaming(self) -> bool:
+        return self.__stream is not None
+
+    @property
+    def is_persistent(self) -> bool:
+        return self.__stream is not None and self.__stream.persistent
+
     def release_tex_id(self):
         gl.glDeleteTextures(1, self.__tex_id)
+        if self.__stream:
+            self.__stream.release()
+            self.__stream = None
 
     def upload_data(self, data, tex_format: TexFormat = TexFormat.RGB):
         gl.glBindTexture(gl.GL_TEXTURE_2D, self.__tex_id)
-        gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.__tex_size.x, self.__tex_size.y,
-                           tex_format.value, gl.GL_UNSIGNED_BYTE, data)
+        if self.__stream is None:
+            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.__tex_size.x, self.__tex_size.y,
+                               tex_format.value, gl.GL_UNSIGNED_BYTE, data)
+        else:
+            # The frame is staged in the next pixel buffer and the texture is filled from it, so the
+            # call returns without the driver copying from client memory, while the previous buffer
+            # may still be read
+            index = self.__stream.stage(np.frombuffer(data, np.uint8))
+            if index is None:
+                # The GPU has not released the buffer yet, this frame goes from client memory
+                gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.__tex_size.x, self.__tex_size.y,
+                                   tex_format.value, gl.GL_UNSIGNED_BYTE, data)
+            else:
+                gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.__tex_size.x, self.__tex_size.y,
+                                   tex_format.value, gl.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+                self.__stream.fence(index)
+                # Other uploads, like the font atlas, must read client memory again
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
         self.check_errors()
 
     def get_tex_id(self) -> gl.GLuint64:
@@ -43,6 +87,14 @@ class ImTex:
     def get_size(self) -> imgui.Vec2:
         return self.__tex_size
 
+    @staticmethod
+    def is_software_renderer() -> bool:
+        """
+        Mesa's CPU renderers copy textures in the calling thread anyway, pixel buffers only add a copy there
+        """
+        renderer = (gl.glGetString(gl.GL_RENDERER) or b"").decode().lower()
+        return any(name in renderer for name in ("llvmpipe", "softpipe", "swrast", "swr"))
+
     @staticmethod
     def check_errors():
         match gl.glGetError():
@@ -54,3 +106,182 @@ class ImTex:
                 raise ValueError("Invalid operation")
             case gl.GL_OUT_OF_MEMORY:
                 raise MemoryError("Out of memory")
+
+
+def _has_buffer_storage() -> bool:
+    if not bool(gl.glBufferStorage):
+        return False
+    if (gl.glGetIntegerv(gl.GL_MAJOR_VERSION), gl.glGetIntegerv(gl.GL_MINOR_VERSION)) >= (4, 4):
+        return True
+    return any(gl.glGetStringi(gl.GL_EXTENSIONS, i) == b"GL_ARB_buffer_storage"
+               for i in range(gl.glGetIntegerv(gl.GL_NUM_EXTENSIONS)))
+
+
+class _PixelBufferRing:
+    # Wait for the GPU to finish reading a buffer before it is written again, ns, tried twice
+    FENCE_TIMEOUT = 100_000_000
+
+    def __init__(self, count: int, size: int, persistent: Optional[bool] = None):
+        """
+        Pixel unpack buffers used in turn. With persistent mapping (GL 4.4 or ARB_buffer_storage)
+        the buffers stay mapped and a fence per buffer tells when the GPU has read it. Otherwise
+        every stage maps the buffer with invalidation, so the driver hands out fresh memory instead
+        of waiting for the previous upload from it.
+
+        :param count: Number of buffers, 2 or 3
+        :param size: Size of each buffer, bytes
+        :param persistent: Keep the buffers mapped, where supported if not set
+        """
+        assert 2 <= count <= 3, "Two or three pixel buffers"
+        self._size = size
+        self._persistent = _has_buffer_storage() if persistent is None else persistent
+        self._buffers = [int(b) for b in np.atleast_1d(gl.glGenBuffers(count))]
+        self._fences = [None] * count
+        self._mapped = []
+        self._index = 0
+        self._fallbacks = 0
+
+        flags = gl.GL_MAP_WRITE_BIT | gl.GL_MAP_PERSISTENT_BIT | gl.GL_MAP_COHERENT_BIT
+        try:
+            for buffer in self._buffers:
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, buffer)
+                if self._persistent:
+                    gl.glBufferStorage(gl.GL_PIXEL_UNPACK_BUFFER, size, None, flags)
+                    address = gl.glMapBufferRange(gl.GL_PIXEL_UNPACK_BUFFER, 0, size, flags)
+                    if not address:
+                        raise ValueError("Pixel buffer can not be mapped")
+                    self._mapped.append(np.ctypeslib.as_array((ctypes.c_ubyte * size).from_address(address)))
+                else:
+                    gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, size, None, gl.GL_STREAM_DRAW)
+            ImTex.check_errors()
+        except (GLError, ValueError, MemoryError):
+            self.release()
+            raise
+        finally:
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+
+    @property
+    def persistent(self) -> bool:
+        return self._persistent
+
+    @property
+    def fallbacks(self) -> int:
+        """
+        Uploads that went from client memory because the GPU still read the buffer
+        """
+        return self._fallbacks
+
+    def stage(self, data: np.ndarray) -> Optional[int]:
+        """
+        Copy the data into the next buffer and leave it bound as the pixel unpack buffer
+
+        :param data: Bytes of the upload
+        :return: Buffer index, to fence once the upload from it is issued, or None when the buffer is
+            still read by the GPU and the upload has to go from client memory
+        """
+        if len(data) > self._size:
+            raise ValueError(f"Upload of {len(data)} bytes does not fit pixel buffers of {self._size}")
+
+        index = self._index
+        if self._persistent and self._fences[index] is not None:
+            fence = self._fences[index]
+            status = gl.glClientWaitSync(fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, self.FENCE_TIMEOUT)
+            if status == gl.GL_TIMEOUT_EXPIRED:
+                # The flush went out with the first wait
+                status = gl.glClientWaitSync(fence, 0, self.FENCE_TIMEOUT)
+            if status not in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+                # Writing now would change a frame being uploaded, the buffer is tried again next time
+                self._fallbacks += 1
+                return None
+            gl.glDeleteSync(fence)
+            self._fences[index] = None
+
+        self._index = (index + 1) % len(self._buffers)
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, self._buffers[index])
+
+        if self._persistent:
+            np.copyto(self._mapped[index][:len(data)], data)
+        else:
+            address = gl.glMapBufferRange(gl.GL_PIXEL_UNPACK_BUFFER, 0, self._size,
+                                          gl.GL_MAP_WRITE_BIT | gl.GL_MAP_INVALIDATE_BUFFER_BIT)
+            ctypes.memmove(address, data.ctypes.data, len(data))
+            gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
+
+        return index
+
+    def fence(self, index: int):
+        if self._persistent:
+            self._fences[index] = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def release(self):
+        for fence in self._fences:
+            if fence is not None:
+                gl.glDeleteSync(fence)
+        self._fences = [None] * len(self._buffers)
+        self._mapped.clear()
+        # Deleting a buffer also unmaps it
+        gl.glDeleteBuffers(len(self._buffers), self._buffers)
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Texture upload timings on a headless EGL context. The platform is chosen when OpenGL is "
+                    "first imported, run with PYOPENGL_PLATFORM=egl EGL_PLATFORM=surfaceless, and "
+                    "LIBGL_ALWAYS_SOFTWARE=1 for llvmpipe on machines without a GPU")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+    if os.environ.get("PYOPENGL_PLATFORM") != "egl":
+        parser.error("PYOPENGL_PLATFORM=egl is not set")
+
+    from OpenGL import EGL
+
+    display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    EGL.eglInitialize(display, None, None)
+    config, n_configs = EGL.EGLConfig(), EGL.EGLint()
+    EGL.eglChooseConfig(display, (EGL.EGLint * 5)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                                  EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE),
+                        ctypes.pointer(config), 1, ctypes.pointer(n_configs))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT,
+                                   (EGL.EGLint * 7)(EGL.EGL_CONTEXT_MAJOR_VERSION, 3, EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+                                                    EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK,
+                                                    EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT, EGL.EGL_NONE))
+    EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context)
+    print(f"{gl.glGetString(gl.GL_RENDERER).decode()}, {gl.glGetString(gl.GL_VERSION).decode()}, "
+          f"persistent mapping {'available' if _has_buffer_storage() else 'not available'}")
+    if ImTex.is_software_renderer():
+        print("Software renderer, the image window uploads from client memory")
+
+    modes = [("client memory", 0, None), ("2 PBO, mapped per upload", 2, False)]
+    if _has_buffer_storage():
+        modes += [("2 PBO, persistent", 2, True), ("3 PBO, persistent", 3, True)]
+
+    rng = np.random.default_rng(0)
+    print(f"{'texture':<10} {'upload':<25} {'ms/upload':>9} {'p95 ms':>7} {'uploads/s':>9}")
+    for width, height in [(1280, 720), (640, 360)]:
+        # Previews as the capture thread makes them, a few different ones so no upload repeats the last
+        frames = [rng.integers(0, 256, (height, width, 4), np.uint8) for _ in range(4)]
+
+        for name, stream_buffers, persistent in modes:
+            tex = ImTex(width, height, ImTex.TexFormat.RGBA, ImTex.TexFormat.BGRA,
+                        stream_buffers=stream_buffers, persistent_mapping=persistent)
+            for frame in frames:
+                tex.upload_data(frame, ImTex.TexFormat.BGRA)
+            gl.glFinish()
+
+            upload_times = []
+            tic = time.perf_counter()
+            for i in range(args.frames):
+                upload_tic = time.perf_counter()
+                tex.upload_data(frames[i % len(frames)], ImTex.TexFormat.BGRA)
+                upload_times.append(time.perf_counter() - upload_tic)
+            gl.glFinish()
+            elapsed = time.perf_counter() - tic
+            tex.release_tex_id()
+
+            print(f"{f'{width}x{height}':<10} {name:<25} {np.mean(upload_times) * 1e3:>9.3f} "
+                  f"{np.percentile(upload_times, 95) * 1e3:>7.3f} {args.frames / elapsed:>9.0f}")
@@ -68,7 +68,7 @@ class FGConnection:
             self.fg_rx_cb = rx_cb
 
             return self.event_pipe
-        except FGConnectionError:
+        except FGConnectionError as e:
             print(e)
             if self._disconnect_callback:
                     self._disconnect_callback(True)
@@ -85,6 +85,15 @@ class FGConnection:
         self.fg_tx_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.fg_tx_addr = (fg_host, fg_port)
         
+    def send(self, data: Dict[str, Any]):
+        """
+        Send a packet to FlightGear outside of the RX/TX loop, i.e. when we are the source of the data
+
+        :param data: Packet fields, same as the ones returned by the RX callback
+        """
+        tx_msg = self.fg_net_struct.build(data)
+        self.fg_tx_sock.sendto(tx_msg, self.fg_tx_addr)
+
     def set_disconnect_callback(self, disconnect_callback: callable):
         """
         Set up a callback that will be called when the connection is lost
@@ -118,11 +127,11 @@ class FGConnection:
             if self.fg_tx_sock is not None and s is not None:
                 tx_msg = self.fg_net_struct.build(dict(**s))
                 self.fg_tx_sock.sendto(tx_msg, self.fg_tx_addr)
-        except FGConnectionError:
+        except FGConnectionError as e:
+            # Keep waiting for FG, staleness is handled by the owner of the connection
             print(e)
             if self._disconnect_callback:
                     self._disconnect_callback(True)
-            exit()
         except FGCommunicationError as e:
             print(e)
             exit()
@@ -148,10 +157,12 @@ class FGConnection:
         """
         Stop the RX/TX loop
         """
-        self.rx_proc.kill()
+        if self.rx_proc is not None:
+            self.rx_proc.kill()
         
     def __del__(self):
-        self.rx_proc.terminate()
+        if self.rx_proc is not None:
+            self.rx_proc.terminate()
 
 
 class FDMConnection(FGConnection):
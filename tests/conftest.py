@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def stand_in_models(tmp_path_factory):
+    pytest.importorskip("onnx")
+    from app.core.tracker.benchmark import make_stand_in_models
+
+    return make_stand_in_models(str(tmp_path_factory.mktemp("batched")))
+
+
+@pytest.fixture(scope="session")
+def fixed_batch_models(tmp_path_factory):
+    # Same weights as stand_in_models, exported with a batch size of one
+    pytest.importorskip("onnx")
+    from app.core.tracker.benchmark import make_stand_in_models
+
+    return make_stand_in_models(str(tmp_path_factory.mktemp("fixed_batch")), batch_size=1)
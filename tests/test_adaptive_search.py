@@ -0,0 +1,33 @@
+import numpy as np
+
+from app.core.tracker.adaptive_search import AdaptiveSearch, AdaptiveSearchConfig
+from app.core.tracker.benchmark import synthetic_sequence
+from app.core.tracker.session_factory import SessionConfig
+from app.core.tracker.tracker import Tracker
+
+
+def track(models, sequence, templates=None):
+    tracker = Tracker(*models, SessionConfig(cache_dir=None), use_io_binding=False)
+    # Every level on every frame
+    search = AdaptiveSearch(tracker, AdaptiveSearchConfig(low_score=2.0))
+    tracker.select_obj(sequence.frames[0], tuple(int(v) for v in sequence.ground_truth[0]))
+    search.reset()
+
+    results = []
+    for i in range(1, len(sequence.frames)):
+        score, bbox, scale = search.search(sequence.frames[i], templates)
+        results.append((score, bbox, scale))
+    assert search.stats.levels == len(results) * len(search.config.scales)
+    return results
+
+
+def test_fixed_batch_models_match_batched(stand_in_models, fixed_batch_models):
+    sequence = synthetic_sequence("moving", 6)
+
+    batched = track(stand_in_models, sequence)
+    fixed_batch = track(fixed_batch_models, sequence)
+
+    for (score, bbox, scale), (expected_score, expected_bbox, expected_scale) in zip(fixed_batch, batched):
+        assert np.isclose(score, expected_score, rtol=1e-4)
+        assert bbox == expected_bbox
+        assert scale == expected_scale
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from app.core.tracker.benchmark import reacquisition_rate, synthetic_sequence
+
+
+def test_reacquisition_rate_counts_episodes():
+    ground_truth = np.tile([100.0, 100.0, 60.0, 40.0], (10, 1))
+    boxes = ground_truth.copy()
+    # Episode 1 on frames 2-3 ends on the target, episode 2 on frames 5-6 ends off it, episode 3
+    # is still open at the end
+    boxes[7] = [400, 400, 60, 40]
+    lost = [False, False, True, True, False, True, True, False, False, True]
+
+    episodes, rate = reacquisition_rate(lost, boxes, ground_truth)
+
+    assert episodes == 3
+    assert rate == 1 / 3
+
+
+def test_reacquisition_rate_without_losses():
+    ground_truth = np.tile([100.0, 100.0, 60.0, 40.0], (4, 1))
+
+    episodes, rate = reacquisition_rate([False] * 4, ground_truth, ground_truth)
+
+    assert episodes == 0
+    assert np.isnan(rate)
+
+
+@pytest.mark.parametrize("size", [(720, 1280), (240, 320), (72, 96)])
+@pytest.mark.parametrize("scaling", [False, True])
+def test_synthetic_target_stays_in_frame(size, scaling):
+    sequence = synthetic_sequence("moving", 200, size=size, scaling=scaling, occlusion=True, speed=3.0)
+    height, width = size
+
+    x, y, w, h = sequence.ground_truth.T
+    assert x.min() >= 0 and y.min() >= 0
+    assert (x + w).max() <= width and (y + h).max() <= height
+    for i in range(0, len(sequence.frames), 7):
+        assert sequence.frames[i].shape == size + (3,)
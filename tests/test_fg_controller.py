@@ -0,0 +1,120 @@
+import socket
+import struct
+import time
+
+import pytest
+
+from app.core.autopilot import Port
+from app.core.autopilot.fg_brain import AutopilotBrain, TrackingAutopilotBrain
+from app.core.autopilot.fg_controller import FGController, WatchdogConfig
+from flightgear_python.fg_if import CtrlsConnection, FDMConnection
+
+
+class FakeFlightGear:
+    # Sends FDM and ctrls packets like FlightGear's native sockets and receives the ctrls sent back
+    def __init__(self):
+        self.fdm_struct = FDMConnection(FGController.FDM_VERSION).fg_net_struct
+        self.ctrls_struct = CtrlsConnection(FGController.CTRLS_VERSION).fg_net_struct
+
+        self._fdm_packet = struct.pack(">i", FGController.FDM_VERSION) + bytes(self.fdm_struct.sizeof() - 4)
+        ctrls = self.ctrls_struct.parse(struct.pack(">i", FGController.CTRLS_VERSION) +
+                                        bytes(self.ctrls_struct.sizeof() - 4))
+        ctrls.elevator, ctrls.aileron, ctrls.rudder = 0.3, -0.2, 0.1
+        self._ctrls_packet = self.ctrls_struct.build(dict(**ctrls))
+
+        self._out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._in = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._in.bind(("127.0.0.1", 0))
+        self._in.settimeout(0.05)
+
+        self.fdm_port = Port(self._free_port(), self._free_port())
+        self.ctrls_port = Port(self._free_port(), self._in.getsockname()[1])
+
+    @staticmethod
+    def _free_port():
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def run(self, seconds, fdm=True, ctrls=True, rate=50):
+        """
+        Send packets for the time given and return the ctrls packets received meanwhile
+        """
+        received = []
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if fdm:
+                self._out.sendto(self._fdm_packet, ("127.0.0.1", self.fdm_port.port_out))
+            if ctrls:
+                self._out.sendto(self._ctrls_packet, ("127.0.0.1", self.ctrls_port.port_out))
+            next_time = time.monotonic() + 1 / rate
+            while time.monotonic() < next_time:
+                try:
+                    received.append(self.ctrls_struct.parse(self._in.recv(2048)))
+                except socket.timeout:
+                    pass
+        return received
+
+    def close(self):
+        self._out.close()
+        self._in.close()
+
+
+@pytest.fixture
+def fake_fg():
+    fg = FakeFlightGear()
+    yield fg
+    fg.close()
+
+
+def _connect(brain, fake_fg):
+    controller = FGController(brain, WatchdogConfig(fdm_timeout_s=0.2, ctrls_timeout_s=0.2))
+    controller.connect("127.0.0.1", fake_fg.fdm_port, fake_fg.ctrls_port)
+    controller.start()
+    return controller
+
+
+def _is_neutral(ctrls):
+    return ctrls.elevator == 0 and ctrls.aileron == 0 and ctrls.rudder == 0
+
+
+def test_failsafe_reaches_stalled_flightgear(fake_fg):
+    brain = AutopilotBrain()
+    brain.set_target_pitch(20)
+    brain.set_target_throttle(0.6)
+    controller = _connect(brain, fake_fg)
+    try:
+        flying = fake_fg.run(0.5)
+        assert flying and not controller.watchdog_stats.is_failsafe
+        assert not _is_neutral(flying[-1])
+
+        # FG stops sending anything: no ctrls callback runs, the watchdog still sends the failsafe output
+        stalled = fake_fg.run(1.0, fdm=False, ctrls=False)
+        stats = controller.watchdog_stats
+        assert stats.is_failsafe and stats.failsafe_transmissions > 0
+        assert len(stalled) >= stats.failsafe_transmissions // 2
+        assert all(_is_neutral(c) for c in stalled[-5:])
+        assert stalled[-1].throttle[0] == pytest.approx(flying[-1].throttle[0])
+
+        # Released once FG sends again and the control loop answers
+        fake_fg.run(0.5)
+        assert not controller.watchdog_stats.is_failsafe
+        assert controller.watchdog_stats.recoveries == 1
+    finally:
+        controller.stop()
+
+
+def test_failsafe_overrides_brain_without_output(fake_fg):
+    # No target, the brain leaves the controls to FG and returns None
+    controller = _connect(TrackingAutopilotBrain(), fake_fg)
+    try:
+        # Nothing is sent back, FG keeps its own controls
+        assert not fake_fg.run(0.5)
+        assert not controller.watchdog_stats.is_failsafe
+
+        # FDM stale while ctrls still flow
+        overridden = fake_fg.run(0.7, fdm=False)
+        assert controller.watchdog_stats.is_failsafe
+        assert all(_is_neutral(c) for c in overridden[-5:])
+    finally:
+        controller.stop()
@@ -0,0 +1,20 @@
+from app.core.autopilot.fg_brain import AutopilotBrain
+from app.core.autopilot.fg_simulator import FGSimulator
+
+
+def test_status_block_is_kept_up_to_date():
+    brain = AutopilotBrain()
+    brain.set_target_pitch(5)
+    brain.set_target_throttle(0.6)
+    simulator = FGSimulator(brain, physics_rate=240, control_rate=60, realtime=False)
+
+    for _ in range(240):
+        simulator.step()
+
+    status = simulator.status_block
+    stats = simulator.watchdog_stats
+    assert status["ctrls_transmissions"] == 60
+    assert status["fdm_time"] > 0 and status["ctrls_time"] > 0
+    assert stats.ctrls_transmissions == 60
+    assert not stats.is_failsafe and status["failsafe"] == 0
+    assert stats.late_frames == 0
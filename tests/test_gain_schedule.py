@@ -0,0 +1,36 @@
+import pytest
+
+from app.core.autopilot.fg_gain_schedule import build_gain_schedules
+
+pytest.importorskip("scipy")
+
+
+def write_runs(path, rows, use_alpha=False):
+    header = "axis,vcas,alt_m," + ("alpha_rad," if use_alpha else "") + "K_p,K_i,K_d"
+    path.write_text("\n".join([header] + [",".join(map(str, row)) for row in rows]) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("rows", [
+    # On a line
+    [("pitch", 50 + 25 * i, 1000, 0.1 * i, 0.01, 0.001) for i in range(5)],
+    # One operating point, tuned twice
+    [("pitch", 100, 1000, 0.1, 0.01, 0.001), ("pitch", 100, 1000, 0.3, 0.01, 0.001)],
+])
+def test_degenerate_runs_use_nearest_gains(tmp_path, rows):
+    schedule = build_gain_schedules(write_runs(tmp_path / "runs.csv", rows), n_nodes=(8, 8))["pitch"]
+
+    expected = {}
+    for _, vcas, alt_m, k_p, _, _ in rows:
+        expected.setdefault((vcas, alt_m), []).append(k_p)
+    for (vcas, alt_m), k_ps in expected.items():
+        assert schedule.lookup(vcas, alt_m).K_p == pytest.approx(sum(k_ps) / len(k_ps))
+
+
+def test_node_counts_must_match_axes(tmp_path):
+    rows = [("pitch", vcas, alt_m, 0.1, 0.01, 0.001) for vcas in (50, 150) for alt_m in (0, 3000)]
+    runs = write_runs(tmp_path / "runs.csv", rows)
+
+    with pytest.raises(ValueError):
+        build_gain_schedules(runs, n_nodes=(8, 8, 8))
+    assert build_gain_schedules(runs)["pitch"].shape[:2] == (16, 16)
@@ -0,0 +1,106 @@
+import ctypes
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The platform is chosen when OpenGL is first imported, a headless EGL context needs it set before
+if "OpenGL" in sys.modules and os.environ.get("PYOPENGL_PLATFORM") != "egl":
+    pytest.skip("OpenGL is already imported for another platform", allow_module_level=True)
+os.environ["PYOPENGL_PLATFORM"] = "egl"
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+os.environ.setdefault("LIBGL_ALWAYS_SOFTWARE", "1")
+
+try:
+    import OpenGL.GL as gl
+    from OpenGL import EGL
+except (ImportError, AttributeError) as e:
+    pytest.skip(f"EGL is not available: {e}", allow_module_level=True)
+
+from app.gui.utils import imtex
+from app.gui.utils.imtex import ImTex
+
+WIDTH, HEIGHT = 64, 48
+
+
+@pytest.fixture(scope="module")
+def gl_context():
+    try:
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        if not display or not EGL.eglInitialize(display, None, None):
+            pytest.skip("No EGL display")
+        config, n_configs = EGL.EGLConfig(), EGL.EGLint()
+        EGL.eglChooseConfig(display, (EGL.EGLint * 5)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                                      EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE),
+                            ctypes.pointer(config), 1, ctypes.pointer(n_configs))
+        if n_configs.value < 1 or not EGL.eglBindAPI(EGL.EGL_OPENGL_API):
+            pytest.skip("No EGL config for desktop OpenGL")
+        context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT,
+                                       (EGL.EGLint * 7)(EGL.EGL_CONTEXT_MAJOR_VERSION, 3,
+                                                        EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+                                                        EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK,
+                                                        EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT, EGL.EGL_NONE))
+        if context == EGL.EGL_NO_CONTEXT or \
+                not EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context):
+            pytest.skip("No surfaceless OpenGL 3.3 context")
+    except EGL.EGLError as e:
+        pytest.skip(f"EGL is not available: {e}")
+    yield
+    EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+    EGL.eglDestroyContext(display, context)
+    EGL.eglTerminate(display)
+
+
+def frames(count=4):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (HEIGHT, WIDTH, 4), np.uint8) for _ in range(count)]
+
+
+def texture_image(tex):
+    gl.glBindTexture(gl.GL_TEXTURE_2D, tex.get_tex_id())
+    image = gl.glGetTexImage(gl.GL_TEXTURE_2D, 0, gl.GL_BGRA, gl.GL_UNSIGNED_BYTE)
+    return np.frombuffer(image, np.uint8).reshape((HEIGHT, WIDTH, 4))
+
+
+def make_texture(stream_buffers, persistent):
+    if persistent and not imtex._has_buffer_storage():
+        pytest.skip("No persistent mapping")
+    tex = ImTex(WIDTH, HEIGHT, ImTex.TexFormat.RGBA, ImTex.TexFormat.BGRA,
+                stream_buffers=stream_buffers, persistent_mapping=persistent)
+    assert tex.is_streaming == bool(stream_buffers)
+    return tex
+
+
+@pytest.mark.parametrize("stream_buffers, persistent", [(0, None), (2, False), (2, True), (3, True)])
+def test_texture_holds_last_upload(gl_context, stream_buffers, persistent):
+    tex = make_texture(stream_buffers, persistent)
+    try:
+        uploads = frames()
+        for i in range(10):
+            tex.upload_data(uploads[i % len(uploads)], ImTex.TexFormat.BGRA)
+            assert np.array_equal(texture_image(tex), uploads[i % len(uploads)])
+    finally:
+        tex.release_tex_id()
+
+
+def test_busy_buffer_falls_back_to_client_memory(gl_context, monkeypatch):
+    tex = make_texture(2, True)
+    try:
+        uploads = frames()
+        # Every buffer gets a fence first
+        for frame in uploads[:2]:
+            tex.upload_data(frame, ImTex.TexFormat.BGRA)
+
+        monkeypatch.setattr(imtex.gl, "glClientWaitSync", lambda *args: gl.GL_TIMEOUT_EXPIRED)
+        tex.upload_data(uploads[2], ImTex.TexFormat.BGRA)
+        assert np.array_equal(texture_image(tex), uploads[2])
+        assert gl.glGetIntegerv(gl.GL_PIXEL_UNPACK_BUFFER_BINDING) == 0
+
+        # Once the GPU is done with it the buffer is used again
+        monkeypatch.undo()
+        tex.upload_data(uploads[3], ImTex.TexFormat.BGRA)
+        assert np.array_equal(texture_image(tex), uploads[3])
+        assert tex._ImTex__stream.fallbacks == 1
+    finally:
+        tex.release_tex_id()
@@ -0,0 +1,125 @@
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+
+import cv2
+import numpy as np
+import pytest
+
+from app.core.mjpeg_source import MjpegVideoSource, _MultipartParser
+
+
+def jpeg_like(rng, size):
+    # Encoded noise of about the size given
+    side = max(8, int(np.sqrt(size / 3)))
+    return cv2.imencode(".jpg", rng.integers(0, 256, (side, side, 3), dtype=np.uint8))[1].tobytes()
+
+
+def with_thumbnail(rng, jpeg):
+    # EXIF APP1 segment holding a thumbnail with its own end marker, right after the start marker
+    payload = b"Exif\x00\x00" + jpeg_like(rng, 300)
+    return jpeg[:2] + b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload + jpeg[2:]
+
+
+def stream(parts, with_length):
+    data = b""
+    for part, length in zip(parts, with_length):
+        headers = b"--fgframe\r\nContent-Type: image/jpeg\r\n"
+        if length:
+            headers += b"Content-Length: %d\r\n" % len(part)
+        data += headers + b"\r\n" + part + b"\r\n"
+    return data + b"--fgframe\r\n"
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parts_survive_any_chunking(seed):
+    rng = np.random.default_rng(seed)
+    parts = [jpeg_like(rng, int(rng.integers(10, 3000))) for _ in range(20)]
+    data = stream(parts, [i % 3 == 0 for i in range(len(parts))])
+
+    parser = _MultipartParser(b"--fgframe")
+    received = []
+    cuts = np.sort(rng.choice(np.arange(1, len(data)), 400, replace=False))
+    for chunk in np.split(np.frombuffer(data, np.uint8), cuts):
+        parser.feed(chunk.tobytes(), lambda part: received.append(bytes(part)))
+
+    assert received == parts
+
+
+def test_thumbnail_end_marker_does_not_end_body():
+    rng = np.random.default_rng(0)
+    part = with_thumbnail(rng, jpeg_like(rng, 20_000))
+    thumbnail_end = part.index(b"\xff\xd9") + 2
+    assert thumbnail_end < len(part) - 2
+    data = stream([part], [False])[:-len(b"--fgframe\r\n")]
+    headers_end = data.index(b"\r\n\r\n") + 4
+
+    parser = _MultipartParser(b"--fgframe")
+    received = []
+    # A chunk ends right after the thumbnail
+    parser.feed(data[:headers_end + thumbnail_end], lambda body: received.append(bytes(body)))
+    assert received == []
+
+    # The end marker of the image completes the part without waiting for the next delimiter
+    parser.feed(data[headers_end + thumbnail_end:], lambda body: received.append(bytes(body)))
+    assert received == [part]
+
+
+def test_body_without_length_scans_each_byte_once():
+    rng = np.random.default_rng(0)
+    part = jpeg_like(rng, 200_000)
+    data = stream([part], [False])
+    parser = _MultipartParser(b"--fgframe")
+
+    # Count the bytes the delimiter search looks at
+    scanned = []
+    find = bytearray.find
+
+    class CountingBuffer(bytearray):
+        def find(self, sub, start=0, *args):
+            scanned.append(len(self) - start)
+            return find(self, sub, start, *args)
+
+    parser._buffer = CountingBuffer()
+    received = []
+    for i in range(0, len(data), 1000):
+        parser.feed(data[i:i + 1000], lambda body: received.append(bytes(body)))
+
+    assert received == [part]
+    assert sum(scanned) < 3 * len(data)
+
+
+def test_release_wakes_blocked_receiver():
+    sent_headers = Event()
+
+    class StallingHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=--fgframe")
+            self.end_headers()
+            self.wfile.flush()
+            sent_headers.set()
+            # No frames, the receiver stays blocked in recv until the client goes away
+            try:
+                while self.rfile.read(1):
+                    pass
+            except (ConnectionError, socket.timeout):
+                pass
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StallingHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        source = MjpegVideoSource(f"http://127.0.0.1:{server.server_address[1]}/", timeout=0.1)
+        assert sent_headers.wait(5)
+        # Let the receiver block on the socket
+        time.sleep(0.1)
+
+        source.release()
+
+        assert not source._receiver.is_alive()
+    finally:
+        server.shutdown()
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from app.core.tracker.session_factory import SessionConfig
+from app.core.tracker.tracker import Tracker
+
+
+@pytest.fixture
+def trackers(stand_in_models, fixed_batch_models):
+    return (Tracker(*stand_in_models, SessionConfig(cache_dir=None), use_io_binding=False),
+            Tracker(*fixed_batch_models, SessionConfig(cache_dir=None), use_io_binding=False))
+
+
+def test_is_batched(trackers):
+    batched, fixed_batch = trackers
+
+    assert batched.is_batched
+    assert not fixed_batch.is_batched
+
+
+def test_fixed_batch_runs_match_batched(trackers):
+    batched, fixed_batch = trackers
+    rng = np.random.default_rng(0)
+    template_crops = (rng.random((3, 3, 127, 127)) * 255).astype(np.float32)
+    search_crops = (rng.random((3, 3, 287, 287)) * 255).astype(np.float32)
+
+    outputs = []
+    for tracker in trackers:
+        templates = tracker.run_backbone_batched(template_crops)
+        embeddings = tracker.run_backbone_batched(search_crops)
+        outputs.append((templates, embeddings) + tuple(tracker.run_head_batched(templates, embeddings)))
+
+    for expected, actual in zip(*outputs):
+        assert actual.shape == expected.shape
+        assert np.allclose(actual, expected, rtol=1e-4, atol=1e-5)
@@ -0,0 +1,115 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.core.tracker.utils import get_subwindow
+
+
+def baseline_subwindow(img, pos, model_sz, original_sz, avg_chans):
+    # Tracker.get_subwindow before the affine warp, verbatim
+    if isinstance(pos, float):
+        pos = [pos, pos]
+    im_sz = img.shape
+    original_c = (original_sz + 1) / 2
+    context_xmin = np.floor(pos[0] - original_c + 0.5)
+    context_xmax = context_xmin + original_sz - 1
+    context_ymin = np.floor(pos[1] - original_c + 0.5)
+    context_ymax = context_ymin + original_sz - 1
+    left_pad = int(max(0., -context_xmin))
+    top_pad = int(max(0., -context_ymin))
+    right_pad = int(max(0., context_xmax - im_sz[1] + 1))
+    bottom_pad = int(max(0., context_ymax - im_sz[0] + 1))
+
+    context_xmin = context_xmin + left_pad
+    context_xmax = context_xmax + left_pad
+    context_ymin = context_ymin + top_pad
+    context_ymax = context_ymax + top_pad
+    im_h, im_w, im_c = img.shape
+
+    if any([top_pad, bottom_pad, left_pad, right_pad]):
+        # If there is a pad, use the average channels to complete
+        size = (im_h + top_pad + bottom_pad, im_w + left_pad + right_pad, im_c)
+        te_im = np.zeros(size, np.uint8)
+        te_im[top_pad:top_pad + im_h, left_pad:left_pad + im_w, :] = img
+        if top_pad:
+            te_im[0:top_pad, left_pad:left_pad + im_w, :] = avg_chans
+        if bottom_pad:
+            te_im[im_h + top_pad:, left_pad:left_pad + im_w, :] = avg_chans
+        if left_pad:
+            te_im[:, 0:left_pad, :] = avg_chans
+        if right_pad:
+            te_im[:, im_w + left_pad:, :] = avg_chans
+        im_patch = te_im[int(context_ymin):int(context_ymax + 1),
+                   int(context_xmin):int(context_xmax + 1), :]
+    else:
+        # If there is no pad, crop Directly
+        im_patch = img[int(context_ymin):int(context_ymax + 1),
+                   int(context_xmin):int(context_xmax + 1), :]
+    if not np.array_equal(model_sz, original_sz):
+        im_patch = cv2.resize(im_patch, (model_sz, model_sz))
+    im_patch = im_patch.transpose(2, 0, 1)
+    im_patch = im_patch[np.newaxis, :, :, :]
+    im_patch = im_patch.astype(np.float32)
+    return im_patch
+
+
+@pytest.fixture(scope="module")
+def frame():
+    # Smooth, so the comparison is about the sampling grid and not about noise
+    rng = np.random.default_rng(0)
+    return cv2.GaussianBlur((rng.random((720, 1280, 3)) * 255).astype(np.uint8), (0, 0), 3)
+
+
+WINDOWS = [((640, 360), 287, 287), ((640, 360), 287, 400), ((640, 360), 127, 90), ((10, 10), 287, 500),
+           ((1270, 700), 127, 300), ((-50, 30), 287, 350), ((640.5, 360.5), 287, 311)]
+
+
+@pytest.mark.parametrize("pos, model_sz, original_sz", WINDOWS)
+def test_matches_baseline_crop(frame, pos, model_sz, original_sz):
+    avg_chans = np.mean(frame, axis=(0, 1))
+    expected = baseline_subwindow(frame, pos, model_sz, original_sz, avg_chans)
+    crop = get_subwindow(frame, pos, model_sz, original_sz, avg_chans)
+
+    assert crop.shape == expected.shape == (1, 3, model_sz, model_sz)
+    diff = np.abs(crop - expected)
+    # Rounding differs by one level. On the outer ring the old resize replicated the edge of its
+    # crop, the warp samples the neighbouring frame pixels.
+    assert diff[..., 1:-1, 1:-1].max() <= 1
+    assert diff.mean() < 0.2
+    if model_sz == original_sz:
+        assert diff.max() == 0
+
+
+def test_patch_cache_follows_frame_type(frame):
+    # Crops of the same size from frames of different types must not share the warped patch
+    patch_buffers = {}
+    avg_chans = np.mean(frame, axis=(0, 1))
+    pos, model_sz, original_sz = (640, 360), 127, 200
+    float_frame = frame.astype(np.float32) / 255
+
+    expected_uint8 = baseline_subwindow(frame, pos, model_sz, original_sz, avg_chans)
+    expected_float = baseline_subwindow(float_frame, pos, model_sz, original_sz, avg_chans / 255)
+
+    for _ in range(2):
+        crop = get_subwindow(frame, pos, model_sz, original_sz, avg_chans, patch_buffers=patch_buffers)
+        assert np.abs(crop - expected_uint8).max() <= 1
+
+        crop = get_subwindow(float_frame, pos, model_sz, original_sz, avg_chans / 255, patch_buffers=patch_buffers)
+        assert np.abs(crop - expected_float).max() < 1e-5
+
+    assert len(patch_buffers) == 2
+
+
+def test_float_frame_border_keeps_fraction():
+    # Float frames take the exact channel average outside the frame
+    frame = np.full((100, 100, 3), 0.25, np.float32)
+    crop = get_subwindow(frame, (0, 0), 50, 100, np.array([0.25, 0.5, 0.75]))
+    assert crop[0, :, 0, 0] == pytest.approx([0.25, 0.5, 0.75])
+    assert crop[0, :, -1, -1] == pytest.approx([0.25, 0.25, 0.25])
+
+
+def test_writes_into_out(frame):
+    out = np.zeros((1, 3, 127, 127), np.float32)
+    result = get_subwindow(frame, (640, 360), 127, 127, np.mean(frame, axis=(0, 1)), out=out)
+    assert result is out
+    assert np.array_equal(out[0], frame[296:423, 576:703].transpose(2, 0, 1))
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from app.core.tracker.utils import RpnPostprocess, change, get_scale, softmax
+
+STRIDE = 8
+RATIOS = (0.33, 0.5, 1, 2, 3)
+SCALES = (8,)
+SCORE_SIZE = 21
+PENALTY_1 = 0.16
+PENALTY_2 = 0.4
+
+
+def reference_postprocess(anchor, window, score, loc, size, scale_z):
+    # Post-processing as it was done with temporaries, with a max-shifted softmax in float64
+    score = np.transpose(score, (1, 2, 3, 0)).reshape((2, -1)).T
+    score = softmax(score.astype(np.float64), axis=1)[:, 1]
+    loc = np.transpose(loc, (1, 2, 3, 0)).reshape((4, -1)).astype(np.float64)
+    loc[0, :] = loc[0, :] * anchor[:, 2] + anchor[:, 0]
+    loc[1, :] = loc[1, :] * anchor[:, 3] + anchor[:, 1]
+    loc[2, :] = np.exp(loc[2, :]) * anchor[:, 2]
+    loc[3, :] = np.exp(loc[3, :]) * anchor[:, 3]
+    s_c = change(get_scale(loc[2, :], loc[3, :]) / (get_scale(size[0] * scale_z, size[1] * scale_z)))
+    r_c = change((size[0] / size[1]) / (loc[2, :] / loc[3, :]))
+    penalty = np.exp(-(r_c * s_c - 1) * PENALTY_1)
+    score = score * penalty * (1 - PENALTY_2) + window * PENALTY_2
+    return score, loc, penalty
+
+
+@pytest.fixture
+def postprocess():
+    return RpnPostprocess(STRIDE, RATIOS, SCALES, SCORE_SIZE, PENALTY_1, PENALTY_2)
+
+
+def rpn_outputs(rng, logit_scale):
+    anchor_num = len(RATIOS) * len(SCALES)
+    score = rng.normal(0, logit_scale, (1, 2 * anchor_num, SCORE_SIZE, SCORE_SIZE)).astype(np.float32)
+    loc = rng.normal(0, 0.3, (1, 4 * anchor_num, SCORE_SIZE, SCORE_SIZE)).astype(np.float32)
+    return score, loc
+
+
+# Logits of 100 overflow an unshifted softmax
+@pytest.mark.parametrize("logit_scale", [1, 100])
+@pytest.mark.parametrize("size, scale_z", [((80.0, 60.0), 0.9), ((20.0, 45.0), 2.5)])
+def test_matches_reference_postprocess(postprocess, logit_scale, size, scale_z):
+    score, loc = rpn_outputs(np.random.default_rng(logit_scale), logit_scale)
+    size = np.array(size)
+
+    expected_score, expected_loc, expected_penalty = reference_postprocess(
+        postprocess.anchor, postprocess.window, score, loc, size, scale_z)
+    out_score, out_loc, penalty = postprocess(score, loc, size, scale_z)
+
+    assert np.all(np.isfinite(out_score))
+    assert np.allclose(out_score, expected_score, rtol=1e-5, atol=1e-6)
+    assert np.allclose(out_loc, expected_loc, rtol=1e-5, atol=1e-4)
+    assert np.allclose(penalty, expected_penalty, rtol=1e-5, atol=1e-6)
+    assert np.argmax(out_score) == np.argmax(expected_score)
+
+
+def test_leaves_rpn_outputs_untouched(postprocess):
+    score, loc = rpn_outputs(np.random.default_rng(0), 1)
+    score_copy, loc_copy = score.copy(), loc.copy()
+
+    postprocess(score, loc, np.array([80.0, 60.0]), 0.9)
+
+    assert np.array_equal(score, score_copy)
+    assert np.array_equal(loc, loc_copy)
+
+
+def test_reuses_buffers(postprocess):
+    rng = np.random.default_rng(0)
+    first = postprocess(*rpn_outputs(rng, 1), np.array([80.0, 60.0]), 0.9)
+    second = postprocess(*rpn_outputs(rng, 1), np.array([80.0, 60.0]), 0.9)
+
+    assert all(a is b for a, b in zip(first, second))
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from app.core.tracker.benchmark import make_stand_in_models, synthetic_sequence
+from app.core.tracker.session_factory import SessionConfig
+from app.core.tracker.target_manager import TargetManager
+from app.core.tracker.tracking_process import ProcessTargetManager
+from app.core.tracker.tracking_worker import TrackingWorker
+
+pytest.importorskip("onnx")
+
+FRAME_SHAPE = (240, 320, 3)
+
+
+@pytest.fixture(scope="module")
+def sequence():
+    return synthetic_sequence("static", 4, size=FRAME_SHAPE[:2], motion=False)
+
+
+@pytest.fixture
+def manager_kwargs(tmp_path):
+    backbone, rpn_head = make_stand_in_models(str(tmp_path))
+    return dict(session_config=SessionConfig(cache_dir=None), backbone=backbone, rpn_head=rpn_head)
+
+
+@pytest.fixture
+def manager(manager_kwargs):
+    manager = ProcessTargetManager(FRAME_SHAPE, **manager_kwargs)
+    yield manager
+    manager.stop()
+
+
+def kill_child(manager):
+    manager._process.kill()
+    manager._process.join()
+
+
+def first_roi(sequence):
+    return tuple(int(v) for v in sequence.ground_truth[0])
+
+
+def test_dead_child_raises_and_restarts(manager, manager_kwargs, sequence):
+    manager.init_tracker(sequence.frames[0], first_roi(sequence))
+    manager.update_tracker(sequence.frames[1])
+
+    kill_child(manager)
+    with pytest.raises(ChildProcessError):
+        manager.update_tracker(sequence.frames[2])
+    assert not manager.is_tracker_initialized
+
+    # The new child has to read the frames written after it started, not copies of earlier ones
+    frames = [synthetic_sequence("static", 1, size=FRAME_SHAPE[:2], motion=False, seed=seed).frames[0]
+              for seed in range(1, 5)]
+    reference = TargetManager(**manager_kwargs)
+    manager.init_tracker(frames[0], first_roi(sequence))
+    reference.init_tracker(frames[0], first_roi(sequence))
+    for frame in frames[1:]:
+        score, roi = manager.update_tracker(frame)
+        expected_score, expected_roi = reference.update_tracker(frame)
+        assert score == pytest.approx(expected_score, abs=1e-4)
+        assert roi == pytest.approx(expected_roi, abs=1)
+
+
+def wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_worker_survives_dead_child(manager, sequence):
+    worker = TrackingWorker(manager)
+    try:
+        worker.init_tracker(sequence.frames[0], first_roi(sequence))
+        worker.submit(sequence.frames[1])
+        wait_for(lambda: worker.result is not None)
+
+        kill_child(manager)
+        worker.submit(sequence.frames[2])
+        wait_for(lambda: worker.stats.failures == 1)
+        assert not worker.is_tracker_initialized
+        assert "ChildProcessError" in worker.stats.last_error
+
+        worker.init_tracker(sequence.frames[0], first_roi(sequence))
+        worker.submit(sequence.frames[3])
+        wait_for(lambda: worker.result is not None)
+        assert worker.stats.failures == 1
+    finally:
+        worker.stop()
@@ -0,0 +1,153 @@
+import queue
+from threading import Thread
+
+import numpy as np
+import pytest
+
+from app.core.video_capture import VideoCaptureCVStream
+
+TIMEOUT = 5.0
+
+
+class FakeCamera:
+    """
+    Source handing out the frames the test pushes, read blocks until the next one is pushed, None
+    is a failed read
+    """
+
+    def __init__(self):
+        self._frames = queue.Queue()
+        self.events = []
+
+    def push(self, frame):
+        self._frames.put(frame)
+
+    def read(self):
+        frame = self._frames.get(timeout=TIMEOUT)
+        self.events.append("read")
+        return frame is not None, frame
+
+    def release(self):
+        self.events.append("release")
+
+
+def make_frame(value):
+    return np.full((36, 64, 3), value, np.uint8)
+
+
+@pytest.fixture
+def camera():
+    camera = FakeCamera()
+    camera.push(make_frame(1))
+    return camera
+
+
+@pytest.fixture
+def capture(camera):
+    capture = VideoCaptureCVStream(camera, retry_interval=0)
+    yield capture
+    if capture._thread.is_alive():
+        camera.push(make_frame(0))
+        capture.stop()
+
+
+def wait_for_sequence(capture, sequence):
+    video_frame = capture.latest()
+    while video_frame.sequence < sequence:
+        video_frame = capture.read_new(video_frame.sequence, timeout=TIMEOUT)
+        assert video_frame is not None, "Timed out"
+    return video_frame
+
+
+def test_first_frame_is_read_on_construction(capture):
+    video_frame = capture.latest()
+
+    assert video_frame.sequence == 1
+    assert capture.read() == (True, video_frame.frame)
+    assert capture.read_new(1, timeout=0) is None
+
+
+def test_sequence_counts_published_frames_only(camera, capture):
+    frames = [make_frame(2), None, make_frame(3)]
+    for frame in frames:
+        camera.push(frame)
+
+    video_frame = wait_for_sequence(capture, 3)
+
+    assert video_frame.sequence == 3
+    assert video_frame.frame is frames[2]
+    assert camera.events == ["read"] * 4
+
+
+def test_slow_consumer_gets_latest_frame(camera, capture):
+    for value in (2, 3, 4):
+        camera.push(make_frame(value))
+    wait_for_sequence(capture, 4)
+
+    video_frame = capture.read_new(1, timeout=0)
+
+    assert video_frame.sequence == 4
+    assert video_frame.frame[0, 0, 0] == 4
+
+
+def test_blocking_read_wakes_on_next_frame(camera, capture):
+    results = []
+    reader = Thread(target=lambda: results.append(capture.read_new(1)))
+    reader.start()
+
+    camera.push(make_frame(2))
+    reader.join(TIMEOUT)
+
+    assert not reader.is_alive()
+    assert results[0].sequence == 2
+
+
+def test_preview_made_in_capture_thread(camera, capture):
+    capture.preview_size = (32, 32)
+    camera.push(make_frame(2))
+
+    video_frame = wait_for_sequence(capture, 2)
+
+    assert video_frame.preview.shape == (18, 32, 4)
+
+
+def test_stop_wakes_readers_and_releases_after_last_read(camera, capture):
+    results = []
+    reader = Thread(target=lambda: results.append(capture.read_new(1)))
+    reader.start()
+
+    stopper = Thread(target=capture.stop)
+    stopper.start()
+    # The capture thread is blocked in read, the next frame lets it see the stop
+    camera.push(make_frame(2))
+    stopper.join(TIMEOUT)
+    reader.join(TIMEOUT)
+
+    assert not stopper.is_alive() and not reader.is_alive()
+    assert camera.events[-1] == "release"
+    assert camera.events.count("release") == 1
+    # Nothing newer comes after the stop, readers do not wait for it
+    latest = capture.latest().sequence
+    assert capture.read_new(latest) is None
+
+
+def test_subscribers_get_every_frame_in_order(camera, capture):
+    received = []
+    capture.add_subscriber(received.append)
+    for value in (2, 3, 4):
+        camera.push(make_frame(value))
+    # Nobody reads the frames in between
+    wait_for_sequence(capture, 4)
+
+    assert [f.sequence for f in received] == [1, 2, 3, 4]
+    assert [f.frame[0, 0, 0] for f in received] == [1, 2, 3, 4]
+
+
+def test_removed_subscriber_gets_no_more_frames(camera, capture):
+    received = []
+    capture.add_subscriber(received.append)
+    capture.remove_subscriber(received.append)
+    camera.push(make_frame(2))
+    wait_for_sequence(capture, 2)
+
+    assert [f.sequence for f in received] == [1]
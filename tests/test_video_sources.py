@@ -0,0 +1,33 @@
+import pytest
+
+from app.core.video_sources import SyntheticVideoSource, create_video_source, parse_video_source
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("camera:2", ("camera", [2], {})),
+    ("synthetic", ("synthetic", [], {})),
+    ("synthetic:fps=60,pace=False", ("synthetic", [], {"fps": 60, "pace": False})),
+    ("file:clip.mp4,pace=False,loop=True", ("file", ["clip.mp4"], {"pace": False, "loop": True})),
+    ("file:/videos/a,b.mp4", ("file", ["/videos/a,b.mp4"], {})),
+    ("file:/videos/a,b.mp4,fps=25.0", ("file", ["/videos/a,b.mp4"], {"fps": 25.0})),
+    ("mjpeg:http://host:8080/shot?stream=y&crop=0,0,640,480,timeout=2",
+     ("mjpeg", ["http://host:8080/shot?stream=y&crop=0,0,640,480"], {"timeout": 2})),
+    ('file:"takes,pace=2.mp4",loop=True', ("file", ["takes,pace=2.mp4"], {"loop": True})),
+    ("file:'takes,pace=2.mp4'", ("file", ["takes,pace=2.mp4"], {})),
+])
+def test_parse_video_source(spec, expected):
+    assert parse_video_source(spec) == expected
+
+
+def test_synthetic_size_options():
+    source = create_video_source("synthetic:width=64,height=48,pace=False")
+    grabbed, frame = source.read()
+
+    assert grabbed
+    assert frame.shape == (48, 64, 3)
+    assert isinstance(source, SyntheticVideoSource)
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        create_video_source("tape:clip.mp4")